@@ -0,0 +1,220 @@
+"""
+MindVoice 离线批量转录
+遍历目录或读取 JSONL 清单，并行解码音频后按批送入模型，结果逐批追加写入 JSONL。
+输出文件本身就是断点：重新运行时会跳过已完成的条目，继续处理剩余部分。
+批量转录接口上传的 zip / tar 归档也在这里展开。
+"""
+
+import io
+import os
+import json
+import time
+import tarfile
+import zipfile
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger("MindVoice-ASR")
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".webm", ".aac", ".wma", ".mp4")
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def collect_inputs(source: str) -> List[dict]:
+    """目录：递归收集音频文件；.jsonl：每行一个 {"path", "id"?, "language"?, "prompt"?}"""
+    items = []
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    items.append({"id": os.path.relpath(path, source), "path": path})
+        items.sort(key=lambda item: item["id"])
+        return items
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if "path" not in entry:
+                raise ValueError(f"清单第 {line_no} 行缺少 path 字段")
+            path = entry["path"] if os.path.isabs(entry["path"]) else os.path.join(base, entry["path"])
+            items.append({**entry, "id": str(entry.get("id", entry["path"])), "path": path})
+    return items
+
+
+def is_archive(filename: Optional[str]) -> bool:
+    return bool(filename) and filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def expand_archive(filename: str, data: bytes, max_files: int, max_member_bytes: int,
+                   max_total_bytes: int) -> List[Tuple[str, bytes]]:
+    """在内存中展开 zip / tar 归档，按成员路径排序返回其中的音频文件 (名字, 内容)。
+    解压前按成员声明的大小检查单个文件与总量上限，防止压缩炸弹撑爆内存
+    （zipfile 读出的数据不会超过声明的 file_size，tar 成员的 size 即实际长度）"""
+    members, total = [], 0
+
+    def check(name: str, size: int):
+        nonlocal total
+        if size > max_member_bytes:
+            raise ValueError(f"{name} 解压后 {size / 1024 ** 2:.0f}MB，超过单个文件上限 {max_member_bytes / 1024 ** 2:.0f}MB")
+        total += size
+        if total > max_total_bytes:
+            raise ValueError(f"归档解压后超过总量上限 {max_total_bytes / 1024 ** 2:.0f}MB")
+
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for info in archive.infolist():
+                # macOS 压缩时附带的 __MACOSX/ 资源分支文件不是音频
+                if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                    continue
+                if info.filename.lower().endswith(AUDIO_EXTENSIONS):
+                    members.append(info.filename)
+                    if len(members) > max_files:
+                        raise ValueError(f"归档中的音频超过 {max_files} 个")
+                    check(info.filename, info.file_size)
+            return [(name, archive.read(name)) for name in sorted(members)]
+
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as archive:
+        for info in archive.getmembers():
+            if info.isfile() and info.name.lower().endswith(AUDIO_EXTENSIONS):
+                members.append(info)
+                if len(members) > max_files:
+                    raise ValueError(f"归档中的音频超过 {max_files} 个")
+                check(info.name, info.size)
+        return [(info.name, archive.extractfile(info).read()) for info in sorted(members, key=lambda i: i.name)]
+
+
+def load_completed(output_path: str) -> Set[str]:
+    """读取已有输出中完成的 id。失败的条目会重试，为免同一 id 出现两条记录，
+    有失败记录时先把它们从输出中删掉（写临时文件后整体替换）；崩溃留下的半行一并截掉"""
+    if not os.path.exists(output_path):
+        return set()
+
+    with open(output_path, "rb") as f:
+        data = f.read()
+    lines = data.split(b"\n")
+    # 最后一段不以换行结尾：崩溃时写了一半的行
+    truncated = bool(lines[-1])
+    lines = lines[:-1]
+
+    completed, kept = set(), []
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if "error" in record or record["id"] in completed:
+            continue
+        completed.add(record["id"])
+        kept.append(line)
+
+    if truncated or len(kept) != len(lines):
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(line + b"\n" for line in kept))
+        os.replace(tmp_path, output_path)
+        if len(kept) != len(lines):
+            logger.info(f"输出中 {len(lines) - len(kept)} 条失败/无效记录已移除，对应条目将重试")
+    return completed
+
+
+def _decode_item(decode_fn: Callable, item: dict) -> dict:
+    t_start = time.time()
+    try:
+        audio = decode_fn(item["path"])
+        return {**item, "audio": audio, "decode_ms": (time.time() - t_start) * 1000}
+    except Exception as e:
+        return {**item, "audio": None, "error": f"解码失败: {e}"}
+
+
+def _batches(decoded: Iterable[dict], batch_size: int) -> Iterable[List[dict]]:
+    batch = []
+    for item in decoded:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_batch(model, decode_fn: Callable, source: str, output_path: str,
+              batch_size: int = 8, decode_workers: int = 4,
+              language: Optional[str] = None, prompt: Optional[str] = None,
+              sample_rate: int = 16000) -> Dict[str, float]:
+    """执行批量转录并返回汇总统计"""
+    items = collect_inputs(source)
+    completed = load_completed(output_path)
+    pending = [item for item in items if item["id"] not in completed]
+    logger.info(f"共 {len(items)} 个文件，已完成 {len(items) - len(pending)}，待处理 {len(pending)}")
+
+    stats = {"files": 0, "errors": 0, "audio_sec": 0.0, "inference_sec": 0.0, "wall_sec": 0.0}
+    if not pending:
+        return stats
+
+    t_wall = time.time()
+    # 解码预取窗口有界，避免整个归档被解码进内存
+    window = max(batch_size * 2, decode_workers)
+
+    with ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decode") as executor, \
+            open(output_path, "a", encoding="utf-8") as out:
+
+        def decoded_items():
+            queue = deque()
+            for item in pending:
+                queue.append(executor.submit(_decode_item, decode_fn, item))
+                if len(queue) >= window:
+                    yield queue.popleft().result()
+            while queue:
+                yield queue.popleft().result()
+
+        for batch in _batches(decoded_items(), batch_size):
+            records = []
+            groups: Dict[tuple, List[dict]] = {}
+            for item in batch:
+                if item.get("error"):
+                    records.append({"id": item["id"], "path": item["path"], "error": item["error"]})
+                    continue
+                key = (item.get("language", language), item.get("prompt", prompt))
+                groups.setdefault(key, []).append(item)
+
+            for (group_language, group_prompt), group in groups.items():
+                t_infer = time.time()
+                try:
+                    results = model.transcribe_batch([item["audio"] for item in group],
+                                                     language=group_language, prompt=group_prompt)
+                    error = None
+                except Exception as e:
+                    results, error = [None] * len(group), str(e)
+                elapsed = time.time() - t_infer
+                stats["inference_sec"] += elapsed
+
+                for item, result in zip(group, results):
+                    duration = len(item["audio"]) / sample_rate
+                    record = {"id": item["id"], "path": item["path"], "duration": round(duration, 3)}
+                    if result is None:
+                        record["error"] = error
+                    else:
+                        stats["audio_sec"] += duration
+                        record.update(text=result.text, language=result.language)
+                    records.append(record)
+
+            for record in records:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                stats["files"] += 1
+                stats["errors"] += 1 if "error" in record else 0
+            out.flush()
+
+            rtf = stats["inference_sec"] / stats["audio_sec"] if stats["audio_sec"] else 0.0
+            logger.info(f"进度 {stats['files']}/{len(pending)}，失败 {stats['errors']}，累计 RTF {rtf:.3f}")
+
+    stats["wall_sec"] = time.time() - t_wall
+    stats["rtf"] = stats["inference_sec"] / stats["audio_sec"] if stats["audio_sec"] else 0.0
+    stats["wall_rtf"] = stats["wall_sec"] / stats["audio_sec"] if stats["audio_sec"] else 0.0
+    return stats
@@ -0,0 +1,272 @@
+"""
+MindVoice 音频编码器输出缓存
+同一段录音换 language / prompt 重试时，特征提取和音频编码器的结果完全相同，只有文本解码依赖这些参数。
+按原始音频的内容哈希缓存编码器输出（LRU，按字节数限额），重试时直接在缓存的嵌入上解码。
+取键在特征提取之前完成：对特征求哈希要先把（可能在 GPU 上的）特征拷回主机，代价接近一次编码。
+命中时特征提取也跳过：模型仍需要形状正确的特征张量（决定音频占位 token 数等），
+因此缓存里另记一份特征的形状与 mask，命中时用全零特征顶替，编码器直接返回缓存的输出、不会读取它。
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional
+
+import numpy as np
+
+# 当前转录的音频范围（见 _Scope），由 audio_scope 设置，包装后的 forward 与 cached_features 读取
+_audio_scope: ContextVar[Optional["_Scope"]] = ContextVar("mindvoice_audio_scope", default=None)
+
+# 依次尝试的音频编码器子模块路径（Qwen3-ASR 在 thinker 下，Voxtral 等在顶层）
+ENCODER_PATHS = ("thinker.audio_tower", "audio_tower", "audio_encoder", "model.audio_tower")
+
+
+def content_key(*values) -> Optional[str]:
+    """对数组/张量的形状、dtype 和内容求哈希；出现无法哈希的值时返回 None"""
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        if value is None or isinstance(value, (bool, int, float, str)):
+            digest.update(repr(value).encode("utf-8"))
+        elif isinstance(value, np.ndarray):
+            digest.update(f"{value.dtype}{value.shape}".encode("utf-8"))
+            digest.update(np.ascontiguousarray(value).tobytes())
+        elif type(value).__module__.startswith("torch") and hasattr(value, "untyped_storage"):
+            import torch
+            tensor = value.detach().contiguous()
+            digest.update(f"{tensor.dtype}{tuple(tensor.shape)}".encode("utf-8"))
+            digest.update(tensor.view(-1).view(torch.uint8).cpu().numpy().tobytes())
+        elif isinstance(value, (tuple, list)):
+            key = content_key(*value)
+            if key is None:
+                return None
+            digest.update(key.encode("utf-8"))
+        else:
+            return None
+    return digest.hexdigest()
+
+
+def _nbytes(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if hasattr(value, "element_size") and hasattr(value, "numel"):
+        return value.element_size() * value.numel()
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    return 0
+
+
+class EncoderCache:
+    """线程安全的 LRU，按缓存值占用的字节数淘汰"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, value: Any):
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def status(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "mb": round(self.bytes / 1024 ** 2, 1),
+            "max_mb": round(self.max_bytes / 1024 ** 2, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+    def peek(self, key: str) -> Optional[Any]:
+        """只查询，不计命中统计、不调整 LRU 顺序"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+
+class _Zeros:
+    """缓存中代替特征张量的占位：只记形状与 dtype，取用时生成全零张量"""
+
+    def __init__(self, value):
+        self.shape = tuple(value.shape)
+        self.dtype = value.dtype
+        self.torch = not isinstance(value, np.ndarray)
+
+    def realize(self):
+        if not self.torch:
+            return np.zeros(self.shape, dtype=self.dtype)
+        import torch
+        return torch.zeros(self.shape, dtype=self.dtype)
+
+
+def _feature_stub(output):
+    """特征提取结果的占位：特征张量换成 _Zeros，mask 等其他字段原样保留（体积很小）"""
+    if hasattr(output, "shape") and hasattr(output, "dtype"):
+        return _Zeros(output)
+    if isinstance(output, Mapping):
+        return type(output), {k: _Zeros(v) if k == "input_features" else v for k, v in output.items()}
+    return None
+
+
+def _realize(stub):
+    if isinstance(stub, _Zeros):
+        return stub.realize()
+    cls, fields = stub
+    return cls({k: v.realize() if isinstance(v, _Zeros) else v for k, v in fields.items()})
+
+
+class _Scope:
+    """一次 audio_scope：音频键、范围内已发生的编码器/特征提取调用次数；
+    outputs 不为 None 表示命中，依次是缓存的编码器输出，features 是对应的特征占位"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.encoder_calls = 0
+        self.feature_calls = 0
+        self.features = []
+        self.outputs = None
+
+    @property
+    def record_key(self) -> str:
+        return f"{self.key}:scope"
+
+
+def find_audio_encoder(module):
+    for path in ENCODER_PATHS:
+        target = module
+        for attr in path.split("."):
+            target = getattr(target, attr, None)
+            if target is None:
+                break
+        if target is not None:
+            return target
+    return None
+
+
+def scope_cached(cache: Optional[EncoderCache], *audios) -> bool:
+    """这组音频的特征占位与全部编码器输出是否都在缓存中（不计统计）"""
+    if cache is None or not all(isinstance(a, np.ndarray) for a in audios):
+        return False
+    key = content_key(*audios)
+    if key is None:
+        return False
+    record = cache.peek(f"{key}:scope")
+    return record is not None and all(cache.peek(f"{key}:{n}") is not None for n in range(record[1]))
+
+
+@contextmanager
+def audio_scope(*audios, cache: Optional[EncoderCache] = None) -> Iterator[None]:
+    """在此范围内，编码器缓存以原始音频的内容哈希取键（范围内第 n 次编码器调用对应 键:n）；
+    音频不全是内存中的数组（如文件路径）时不缓存。
+    传入 cache 时先查这组音频是否整体命中：命中则预先取出全部编码器输出，范围内经 cached_features
+    的特征提取直接返回全零占位；未命中则在范围正常结束后记下特征占位和编码器调用次数"""
+    key = content_key(*audios) if all(isinstance(a, np.ndarray) for a in audios) else None
+    scope = _Scope(key) if key is not None else None
+    if scope is not None and cache is not None:
+        record = cache.get(scope.record_key)
+        if record is not None:
+            features, calls = record
+            outputs = [cache.get(f"{key}:{n}") for n in range(calls)]
+            # 任何一次编码器输出已被淘汰都不能跳过特征提取，整体按未命中处理
+            if all(output is not None for output in outputs):
+                scope.features, scope.outputs = list(features), outputs
+    token = _audio_scope.set(scope)
+    try:
+        yield
+    finally:
+        _audio_scope.reset(token)
+    if scope is not None and cache is not None and scope.outputs is None and scope.encoder_calls \
+            and scope.features and all(stub is not None for stub in scope.features):
+        cache.put(scope.record_key, (tuple(scope.features), scope.encoder_calls))
+
+
+def cached_features(extract: Callable, *args, **kwargs):
+    """在 audio_scope 内调用特征提取：整体命中时返回全零占位，否则照常提取并记下占位"""
+    scope = _audio_scope.get()
+    if scope is None:
+        return extract(*args, **kwargs)
+    index = scope.feature_calls
+    scope.feature_calls += 1
+    if scope.outputs is not None and index < len(scope.features):
+        return _realize(scope.features[index])
+    output = extract(*args, **kwargs)
+    scope.features.append(_feature_stub(output))
+    return output
+
+
+class CachedFeatureExtractor:
+    """包装处理器里的特征提取器，使处理器内部的特征提取也经过 cached_features；
+    pickle（模型快照）时只保存被包装的特征提取器"""
+
+    def __init__(self, extractor):
+        self.extractor = extractor
+
+    def __call__(self, *args, **kwargs):
+        return cached_features(self.extractor, *args, **kwargs)
+
+    def __getattr__(self, name):
+        if name == "extractor":
+            raise AttributeError(name)
+        return getattr(self.extractor, name)
+
+    def __reduce__(self):
+        return _unwrap, (self.extractor,)
+
+
+def _unwrap(extractor):
+    return extractor
+
+
+def cache_module_forward(module, cache: EncoderCache):
+    """包装编码器的 forward：在 audio_scope 内按音频取键，命中时直接返回缓存的输出；
+    范围之外（预热、流式编码等）照常前向、不缓存"""
+    original = module.forward
+
+    def forward(*args, **kwargs):
+        scope = _audio_scope.get()
+        if scope is None:
+            return original(*args, **kwargs)
+        index = scope.encoder_calls
+        scope.encoder_calls += 1
+        if scope.outputs is not None and index < len(scope.outputs):
+            return scope.outputs[index]
+        key = f"{scope.key}:{index}"
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        output = original(*args, **kwargs)
+        cache.put(key, output)
+        return output
+
+    module.forward = forward
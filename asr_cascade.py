@@ -0,0 +1,105 @@
+"""
+MindVoice 模型级联
+请求先交给小模型（Qwen3-ASR-0.6B），用其输出 token 的对数概率计算置信度；
+只有置信度偏低、音频过长或噪声较大的请求才升级到大模型（Voxtral-Mini-4B）。
+大部分请求保持小模型的延迟，难例仍能得到大模型的质量。
+"""
+
+import threading
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+# 升级原因
+REASON_LONG = "long"
+REASON_NOISY = "noisy"
+REASON_LOW_CONFIDENCE = "low_confidence"
+
+
+# 帧能量高于底噪这么多 dB 记为语音
+VAD_THRESHOLD_DB = 6.0
+# 语音帧前后各扩展这么多帧（音节间的短暂能量低谷仍算语音）
+VAD_HANGOVER_FRAMES = 4
+# 非语音帧少于该比例时视为连续语音，无法测出底噪
+MIN_NOISE_RATIO = 0.1
+
+
+def estimate_snr_db(audio: np.ndarray, sample_rate: int = 16000, frame_ms: int = 30) -> Optional[float]:
+    """粗略估计信噪比，单位 dB：按能量门限做 VAD，语音帧均值对非语音帧均值（底噪）。
+    直接取能量高低分位的比值在连续说话时偏低（低分位帧仍是弱语音），会把干净的长句误判为噪声大；
+    这里底噪只取 VAD 判为非语音且远离语音的帧，几乎没有停顿的连续语音测不出底噪，返回 None，
+    交给置信度判断是否升级"""
+    frame = int(sample_rate * frame_ms / 1000)
+    count = len(audio) // frame
+    if count < 10:
+        return None
+    energy = np.mean(audio[:count * frame].reshape(count, frame) ** 2, axis=1) + 1e-10
+
+    floor = np.percentile(energy, 5)
+    speech = energy > floor * 10 ** (VAD_THRESHOLD_DB / 10)
+    if not speech.any():
+        return 0.0
+    # 膨胀语音掩码，排除语音边缘和音节间隙
+    kernel = np.ones(2 * VAD_HANGOVER_FRAMES + 1)
+    near_speech = np.convolve(speech.astype(float), kernel, mode="same") > 0
+    noise = energy[~near_speech]
+    if len(noise) < max(MIN_NOISE_RATIO * count, 3):
+        return None
+    return float(10 * np.log10(np.mean(energy[speech]) / np.mean(noise)))
+
+
+class CascadePolicy:
+    """级联的路由阈值与统计"""
+
+    def __init__(self, min_confidence: float = 0.7, max_primary_sec: float = 60.0,
+                 min_snr_db: Optional[float] = 10.0, sample_rate: int = 16000):
+        self.min_confidence = min_confidence
+        self.max_primary_sec = max_primary_sec
+        self.min_snr_db = min_snr_db
+        self.sample_rate = sample_rate
+
+        self.requests = 0
+        self.escalations = {REASON_LONG: 0, REASON_NOISY: 0, REASON_LOW_CONFIDENCE: 0}
+        self._confidences = deque(maxlen=1000)
+        self._lock = threading.Lock()
+
+    def route_before(self, audio: np.ndarray) -> Optional[str]:
+        """小模型运行前就能判断的升级原因：过长或噪声大的音频直接交给大模型"""
+        if self.max_primary_sec and len(audio) / self.sample_rate > self.max_primary_sec:
+            return REASON_LONG
+        if self.min_snr_db is not None:
+            snr = estimate_snr_db(audio, self.sample_rate)
+            if snr is not None and snr < self.min_snr_db:
+                return REASON_NOISY
+        return None
+
+    def route_after(self, confidence: Optional[float]) -> Optional[str]:
+        if confidence is not None and confidence < self.min_confidence:
+            return REASON_LOW_CONFIDENCE
+        return None
+
+    def record(self, reason: Optional[str], confidence: Optional[float]):
+        with self._lock:
+            self.requests += 1
+            if reason is not None:
+                self.escalations[reason] += 1
+            if confidence is not None:
+                self._confidences.append(confidence)
+
+    def status(self) -> dict:
+        with self._lock:
+            escalated = sum(self.escalations.values())
+            confidences = sorted(self._confidences)
+        return {
+            "requests": self.requests,
+            "escalated": escalated,
+            "escalation_rate": round(escalated / self.requests, 3) if self.requests else 0.0,
+            "by_reason": dict(self.escalations),
+            "confidence_p50": round(confidences[len(confidences) // 2], 3) if confidences else None,
+            "thresholds": {
+                "min_confidence": self.min_confidence,
+                "max_primary_sec": self.max_primary_sec,
+                "min_snr_db": self.min_snr_db,
+            },
+        }
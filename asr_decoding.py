@@ -0,0 +1,262 @@
+"""
+MindVoice 解码加速
+CPU 上贪心解码每个 token 都要一次完整前向，是推理的主要耗时。
+- prompt lookup：在已有上下文（提示词/热词、已生成的文本）中按 n-gram 匹配，一次起草多个候选 token，
+  再由模型一次前向并行验证，只接受与贪心结果一致的前缀，因此输出与普通贪心解码相同
+- 静态 KV cache：按 token 预算预分配固定形状的 cache，跨请求复用同一组缓冲区，
+  配合 torch.compile 编译解码步，省去逐 token 的 eager 调度和 cache 扩容
+"""
+
+import math
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("MindVoice-ASR")
+
+# 转录文本的 token 速率上限（远高于正常语速），用于由音频时长推算生成预算
+TOKENS_PER_AUDIO_SEC = 15
+MIN_NEW_TOKENS = 32
+
+# 当前转录调用的 token 计数，见 generated_tokens
+_generated: ContextVar[Optional[Dict[str, int]]] = ContextVar("mindvoice_generated_tokens", default=None)
+
+
+def token_budget(audio_sec: float, max_new_tokens: int) -> int:
+    """按音频时长估算需要生成的 token 上限；静态 cache 按此预算分配，不再一律按最大值"""
+    return min(max_new_tokens, MIN_NEW_TOKENS + math.ceil(audio_sec * TOKENS_PER_AUDIO_SEC))
+
+
+def configure_generation(module, prompt_lookup_num_tokens: int = 0, static_cache: bool = False,
+                         batch_size: int = 1) -> str:
+    """在模型的 generation_config 上设置解码方式，之后所有 generate 调用都会生效，返回实际采用的模式。
+    transformers 的辅助解码只支持 batch_size=1 且需要动态 cache，两者冲突时优先 prompt lookup"""
+    config = getattr(module, "generation_config", None)
+    if config is None:
+        return "greedy"
+
+    lookup = prompt_lookup_num_tokens > 0 and batch_size == 1
+    config.prompt_lookup_num_tokens = prompt_lookup_num_tokens if lookup else None
+    # generate 在已有静态 cache 足够大且批大小一致时会 reset 复用，不重新分配
+    config.cache_implementation = "static" if static_cache and not lookup else None
+    if lookup:
+        return "prompt_lookup"
+    return "static" if static_cache else "greedy"
+
+
+def compile_forward(module) -> bool:
+    """用 torch.compile 编译模型前向；配合静态 cache 后解码步的形状固定，只需编译一次"""
+    import torch
+
+    if getattr(module, "_mindvoice_compiled", False):
+        return True
+    try:
+        on_cuda = next(module.parameters()).is_cuda
+        # GPU 上用 CUDA graph 消除逐 token 的 kernel 启动开销
+        module.forward = torch.compile(module.forward, mode="reduce-overhead" if on_cuda else "default")
+        module._mindvoice_compiled = True
+        logger.info(f"已启用 torch.compile ({'reduce-overhead' if on_cuda else 'default'})")
+        return True
+    except Exception as e:
+        logger.warning(f"torch.compile 不可用，使用 eager 解码: {e}")
+        return False
+
+
+def uncompile_forward(module):
+    """撤销 compile_forward，恢复类上的 eager 前向"""
+    if getattr(module, "_mindvoice_compiled", False):
+        module.__dict__.pop("forward", None)
+        module._mindvoice_compiled = False
+
+
+# transformers 判定模型或解码方式不支持静态 cache 时抛出的 ValueError 消息
+_STATIC_CACHE_MESSAGES = (
+    "does not support `cache_implementation='static'`",
+    "not supported with Static cache",
+)
+
+
+def is_static_cache_error(e: BaseException) -> bool:
+    """判断异常是否来自静态 cache 或编译与当前模型不兼容：torch.compile（dynamo/inductor）的异常，
+    或 transformers 拒绝静态 cache 的 ValueError。显存不足、输入错误等其他异常不算"""
+    if "out of memory" in str(e).lower():
+        return False
+    try:
+        from torch._dynamo.exc import TorchDynamoException
+
+        # inductor 的编译错误（InductorError）也是它的子类
+        if isinstance(e, TorchDynamoException):
+            return True
+    except ImportError:
+        pass
+    return isinstance(e, ValueError) and any(message in str(e) for message in _STATIC_CACHE_MESSAGES)
+
+
+def run_with_static_fallback(model, fn: Callable):
+    """执行一次生成；静态 cache 或编译在该模型上不可用时关闭两者并用动态 cache 重试，其他异常照常抛出。
+    这类错误与输入无关，每次都会重现，所以对该模型实例一直关闭（重新加载模型后按配置恢复）"""
+    try:
+        return fn()
+    except Exception as e:
+        if not model.static_cache or not is_static_cache_error(e):
+            raise
+        logger.error(f"⚠️ 静态 KV cache / torch.compile 在 {model.get_model_name()} 上不可用，"
+                     f"已关闭并改用动态 cache，重新加载模型前不再启用: {type(e).__name__}: {e}")
+        model.static_cache = False
+        model.compile_decoder = False
+        module = model.torch_module()
+        if module is not None:
+            uncompile_forward(module)
+        return fn()
+
+
+@contextmanager
+def count_generated_tokens(module) -> Iterator[Dict[str, int]]:
+    """临时包装 module.generate，统计新生成的 token 数（不含输入部分）"""
+    stats = {"tokens": 0, "calls": 0}
+    original = module.generate
+    wrapped = "generate" in module.__dict__
+
+    def generate(*args, **kwargs):
+        outputs = original(*args, **kwargs)
+        sequences = getattr(outputs, "sequences", outputs)
+        input_ids = kwargs.get("input_ids", args[0] if args else None)
+        prompt_len = input_ids.shape[1] if input_ids is not None else 0
+        tokens = (sequences.shape[1] - prompt_len) * sequences.shape[0]
+        stats["tokens"] += tokens
+        stats["calls"] += 1
+        add_generated_tokens(tokens)
+        return outputs
+
+    module.generate = generate
+    try:
+        yield stats
+    finally:
+        # 实例上原本就有包装（如置信度统计）时恢复它，否则回到类方法
+        if wrapped:
+            module.generate = original
+        else:
+            del module.generate
+
+
+def add_generated_tokens(count: int):
+    """后端生成完一次后计入当前的 generated_tokens 统计；不在统计中时什么也不做"""
+    stats = _generated.get()
+    if stats is not None:
+        stats["tokens"] += int(count)
+        stats["calls"] += 1
+
+
+@contextmanager
+def generated_tokens(module=None) -> Iterator[Dict[str, int]]:
+    """统计一次转录生成的 token 数。计数经 contextvars 传递，asyncio.to_thread 复制上下文后仍是同一份：
+    ONNX、分离执行器、vLLM 等后端生成后调用 add_generated_tokens 计入；
+    module 为调用方独占的 torch 模块时，再临时包装它的 generate（见 count_generated_tokens）"""
+    stats = {"tokens": 0, "calls": 0}
+    token = _generated.set(stats)
+    try:
+        if module is not None and hasattr(module, "generate"):
+            with count_generated_tokens(module):
+                yield stats
+        else:
+            yield stats
+    finally:
+        _generated.reset(token)
+
+
+def track_confidence(module) -> Dict[str, list]:
+    """包装 module.generate：额外输出每步分数，按所选 token 的对数概率计算每条序列的置信度
+    （token 概率的几何平均），追加到返回的 dict 中，由调用方按需清空。
+    长音频分段时一次转录会有多次 generate 调用。调用方（如 qwen_asr）拿到的返回值与原来一致"""
+    import torch
+
+    state = {"confidences": []}
+    original = module.generate
+
+    def generate(*args, **kwargs):
+        wants_dict = kwargs.get("return_dict_in_generate", False)
+        kwargs.update(output_scores=True, return_dict_in_generate=True)
+        outputs = original(*args, **kwargs)
+
+        scores = module.compute_transition_scores(outputs.sequences, outputs.scores, normalize_logits=True)
+        new_tokens = outputs.sequences[:, -scores.shape[1]:] if scores.shape[1] else outputs.sequences[:, :0]
+        mask = torch.isfinite(scores)
+        pad_id = getattr(module.generation_config, "pad_token_id", None)
+        if pad_id is not None:
+            mask &= new_tokens != pad_id
+        state["confidences"] += [
+            float(row[keep].float().mean().exp()) if keep.any() else None
+            for row, keep in zip(scores, mask)
+        ]
+        return outputs if wants_dict else outputs.sequences
+
+    module.generate = generate
+    return state
+
+
+def _allocator_snapshot(on_cuda: bool) -> float:
+    """分配器指标：GPU 上为累计分配次数，CPU 上为进程 RSS (MB)"""
+    if on_cuda:
+        import torch
+        return float(torch.cuda.memory_stats().get("allocation.all.allocated", 0))
+    from asr_weights import memory_usage
+    usage = memory_usage() or {}
+    return usage.get("rss_mb", 0.0)
+
+
+def benchmark_decoding(model, audios: List, variants: List[Tuple[str, dict]], language: Optional[str] = None,
+                       prompt: Optional[str] = None,
+                       progress: Optional[Callable[[dict], None]] = None) -> List[dict]:
+    """依次以不同的解码设置转录同一组音频，测量生成速度与分配器开销。
+    variants 为 (名称, 要设置到模型上的属性)；第一组作为基准，其余各组的输出逐条与基准比对，
+    确认加速手段没有改变结果"""
+    module = model.torch_module()
+    if module is None:
+        raise RuntimeError(f"{model.get_model_name()} 不支持解码测速")
+    on_cuda = next(module.parameters()).is_cuda
+
+    originals = {key: getattr(model, key) for _, settings in variants for key in settings}
+    rows = []
+    baseline = None
+    try:
+        for name, settings in variants:
+            for key, value in settings.items():
+                setattr(model, key, value)
+            # 每组先预热一次，避免首次调用的初始化/编译开销算进结果
+            model.transcribe(audios[0], language=language, prompt=prompt)
+
+            texts = []
+            alloc_before = _allocator_snapshot(on_cuda)
+            with count_generated_tokens(module) as stats:
+                t_start = time.perf_counter()
+                for audio in audios:
+                    texts.append(model.transcribe(audio, language=language, prompt=prompt).text)
+                elapsed = time.perf_counter() - t_start
+
+            tokens = stats["tokens"]
+            row = {
+                "variant": name,
+                "files": len(audios),
+                "tokens": tokens,
+                "seconds": elapsed,
+                "tokens_per_sec": tokens / elapsed if elapsed > 0 else 0.0,
+                "ms_per_token": elapsed * 1000 / tokens if tokens else 0.0,
+                "alloc_delta": _allocator_snapshot(on_cuda) - alloc_before,
+                "alloc_unit": "allocs" if on_cuda else "MB",
+            }
+            if baseline is None:
+                baseline = texts
+            else:
+                mismatches = sum(a != b for a, b in zip(texts, baseline))
+                row["identical"] = mismatches == 0
+                if mismatches:
+                    logger.warning(f"{name} 有 {mismatches} 条输出与基准不同")
+            rows.append(row)
+            if progress:
+                progress(row)
+    finally:
+        for key, value in originals.items():
+            setattr(model, key, value)
+    return rows
@@ -0,0 +1,308 @@
+"""
+MindVoice 编码/解码分离执行
+音频编码器是计算密集型、适合大批量；自回归文本解码受内存带宽限制、对延迟敏感。
+普通模式下两者在每个请求的一次 generate 中交替执行，分离模式把它们拆成两个独立阶段：
+- 编码阶段：在自己的线程池中攒批，多个请求的音频窗口一次前向
+- 解码阶段：拿到音频嵌入后进入解码队列，按自己的批大小/等待时间攒批后批量贪心解码
+两个阶段的批大小、最长等待时间和 worker 数分别配置，可各自偏向吞吐或延迟。
+"""
+
+import math
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+import numpy as np
+
+from asr_decoding import add_generated_tokens
+from asr_onnx import EOS_TOKENS, build_prompt, derive_prompt_template, split_language
+from asr_tracing import span
+
+logger = logging.getLogger("MindVoice-ASR")
+
+_STOP = object()
+
+# qwen_asr 会把短于 0.5s 的音频在末尾补零，分离模式保持一致
+MIN_INPUT_SEC = 0.5
+
+
+class PhaseBatcher:
+    """线程池上的微批处理：worker 取到第一个任务后最多等待 max_wait_ms 凑满 max_batch 个，再一次性处理"""
+
+    def __init__(self, name: str, fn: Callable[[List[Any]], List[Any]], max_batch: int = 8,
+                 max_wait_ms: float = 10, workers: int = 1):
+        self.name = name
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.workers = max(1, workers)
+
+        self.batches = 0
+        self.items = 0
+        self.busy_sec = 0.0
+        self._latencies = deque(maxlen=500)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._started = time.monotonic()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"mindvoice-{name}-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, payload: Any) -> Future:
+        future = Future()
+        self._queue.put((payload, future, time.monotonic()))
+        return future
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(_STOP)
+
+    def _collect(self, first) -> Tuple[list, bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _worker(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch, stopping = self._collect(first)
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if batch:
+                self._run(batch)
+            if stopping:
+                return
+
+    def _run(self, batch: list):
+        t_start = time.monotonic()
+        try:
+            results = self.fn([payload for payload, _, _ in batch])
+        except Exception as e:
+            logger.error(f"{self.name} 批处理失败 ({len(batch)} 条): {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finally:
+            self.busy_sec += time.monotonic() - t_start
+
+        t_done = time.monotonic()
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future, t_submit), result in zip(batch, results):
+            self._latencies.append(t_done - t_submit)
+            future.set_result(result)
+
+    def status(self) -> dict:
+        elapsed = time.monotonic() - self._started
+        latencies = sorted(self._latencies)
+        return {
+            "workers": self.workers,
+            "max_batch": self.max_batch,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "utilization": round(self.busy_sec / (elapsed * self.workers), 3) if elapsed > 0 else 0.0,
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+        }
+
+
+class DisaggregatedExecutor:
+    """把一次转录拆成 编码 → 解码 两个攒批阶段；runtime 需提供 encode_batch / decode_batch，
+    decode_batch 对每条返回 (文本, 语言, 置信度, 生成的 token 数)。
+    options 为 encoder_/decoder_ 开头的 max_batch、max_wait_ms、workers 六项"""
+
+    def __init__(self, runtime, options: dict, max_new_tokens: int = 512):
+        self.runtime = runtime
+        self.options = options
+        # 按音频内容缓存编码结果（ASRModel.encoder_cache），为 None 时不缓存
+        self.encoder_cache = None
+        self.encoder = PhaseBatcher(
+            "encoder", runtime.encode_batch,
+            self.options["encoder_max_batch"], self.options["encoder_max_wait_ms"], self.options["encoder_workers"],
+        )
+        self.decoder = PhaseBatcher(
+            "decoder", lambda requests: runtime.decode_batch(requests, max_new_tokens),
+            self.options["decoder_max_batch"], self.options["decoder_max_wait_ms"], self.options["decoder_workers"],
+        )
+
+    @property
+    def max_in_flight(self) -> int:
+        """两个阶段同时能容纳的请求数；调度器至少要放行这么多并发才能攒满批"""
+        o = self.options
+        return o["encoder_max_batch"] * o["encoder_workers"] + o["decoder_max_batch"] * o["decoder_workers"]
+
+    def transcribe_batch(self, audios: List[np.ndarray], language: Optional[str] = None,
+                         prompt: Optional[str] = None) -> List[Tuple[str, str, Optional[float]]]:
+        """返回每条音频的 (文本, 语言, 置信度)；阻塞直到全部解码完成，由调用方在线程中执行。
+        各条音频分别进入编码队列，先编码完的先开始解码。解码在批处理线程中进行，token 数在这里计入调用方的统计"""
+        from asr_cache import content_key
+
+        pending = []
+        for audio in audios:
+            key = content_key(audio) if self.encoder_cache is not None else None
+            embeds = self.encoder_cache.get(key) if key is not None else None
+            pending.append((key, embeds if embeds is not None else self.encoder.submit(audio)))
+
+        decodes = []
+        with span("disagg.encode", items=len(audios),
+                  cached=sum(1 for _, embeds in pending if not isinstance(embeds, Future))):
+            for key, embeds in pending:
+                if isinstance(embeds, Future):
+                    embeds = embeds.result()
+                    if key is not None:
+                        self.encoder_cache.put(key, embeds)
+                decodes.append(self.decoder.submit((embeds, language, prompt)))
+        with span("disagg.decode", items=len(audios)) as decode_span:
+            results = [future.result() for future in decodes]
+            tokens = sum(result[3] for result in results)
+            decode_span.set(tokens=tokens)
+        add_generated_tokens(tokens)
+        return [(text, detected, confidence) for text, detected, confidence, _ in results]
+
+    def stop(self):
+        self.encoder.stop()
+        self.decoder.stop()
+
+    def status(self) -> dict:
+        return {"encoder": self.encoder.status(), "decoder": self.decoder.status()}
+
+
+class QwenSplitRuntime:
+    """直接驱动 qwen_asr 加载的 Qwen3-ASR thinker：音频编码器对多个窗口打包前向，文本解码左填充后批量贪心生成"""
+
+    def __init__(self, wrapper):
+        self.thinker = wrapper.model.thinker
+        self.tokenizer = wrapper.processor.tokenizer
+        self.feature_extractor = wrapper.processor.feature_extractor
+        self.embed = self.thinker.get_input_embeddings()
+        self.device = self.embed.weight.device
+        self.dtype = self.embed.weight.dtype
+        self.tower_dtype = next(self.thinker.audio_tower.parameters()).dtype
+        text_config = self.thinker.config.text_config
+        # 多模态 RoPE 在纯音频输入下三个分量相同，由一维位置展开
+        self.mrope = bool((getattr(text_config, "rope_scaling", None) or {}).get("mrope_section"))
+        self.window_samples = self.feature_extractor.n_samples
+        self.eos_ids = {self.tokenizer.convert_tokens_to_ids(t) for t in EOS_TOKENS}
+        self.eos_ids.discard(None)
+        # 提示词格式取自处理器的 chat template，与 qwen_asr 自己构造的输入一致
+        prefix, suffix = derive_prompt_template(wrapper.processor)
+        self.prompt_config = {"prompt_prefix": prefix, "prompt_suffix": suffix}
+        try:
+            from qwen_asr.inference.utils import parse_asr_output
+        except ImportError:
+            logger.warning("qwen_asr 中找不到 parse_asr_output，分离模式的输出不做重复修正和语言名规范化")
+            parse_asr_output = None
+        self.parse_output = parse_asr_output
+
+    def encode_batch(self, audios: List[np.ndarray]) -> List[Any]:
+        """所有请求的 30s 窗口拼成一个打包输入（feature_lens 标出各窗边界），编码器一次前向"""
+        import torch
+
+        chunks, owners = [], []
+        min_samples = int(MIN_INPUT_SEC * self.feature_extractor.sampling_rate)
+        for index, audio in enumerate(audios):
+            if len(audio) < min_samples:
+                audio = np.pad(audio, (0, min_samples - len(audio))).astype(np.float32)
+            for start in range(0, max(len(audio), 1), self.window_samples):
+                chunks.append(audio[start:start + self.window_samples])
+                owners.append(index)
+
+        features = self.feature_extractor(
+            chunks, sampling_rate=self.feature_extractor.sampling_rate, return_tensors="pt"
+        )["input_features"]
+        count, mel, frames = features.shape
+        packed = features.permute(1, 0, 2).reshape(mel, count * frames).to(self.device, self.tower_dtype)
+        feature_lens = torch.full((count,), frames, dtype=torch.long, device=self.device)
+        with torch.no_grad():
+            hidden = self.thinker.audio_tower(packed, feature_lens=feature_lens).last_hidden_state
+        hidden = hidden.reshape(count, -1, hidden.shape[-1])
+        window_tokens = hidden.shape[1]
+
+        outputs = [[] for _ in audios]
+        for window, chunk, owner in zip(hidden, chunks, owners):
+            outputs[owner].append(window[:math.ceil(window_tokens * len(chunk) / self.window_samples)])
+        return [torch.cat(parts, dim=0) for parts in outputs]
+
+    def _ids(self, text: str):
+        return self.tokenizer(text, add_special_tokens=False, return_tensors="pt").input_ids[0].to(self.device)
+
+    def _positions(self, positions):
+        return positions.unsqueeze(0).expand(3, -1, -1) if self.mrope else positions
+
+    def decode_batch(self, requests: List[Tuple[Any, Optional[str], Optional[str]]],
+                     max_new_tokens: int = 512) -> List[Tuple[str, str, Optional[float], int]]:
+        import torch
+        from transformers import DynamicCache
+
+        with torch.no_grad():
+            sequences = []
+            for embeds, language, prompt in requests:
+                prefix, suffix = build_prompt(prompt, language, self.prompt_config)
+                sequences.append(torch.cat([
+                    self.embed(self._ids(prefix)), embeds.to(self.device, self.dtype), self.embed(self._ids(suffix)),
+                ]))
+
+            # 左填充到同一长度，填充位置 attention_mask 为 0，位置编号从各自的第一个有效 token 起算
+            batch, length = len(sequences), max(len(s) for s in sequences)
+            inputs = torch.zeros(batch, length, sequences[0].shape[-1], dtype=self.dtype, device=self.device)
+            mask = torch.zeros(batch, length, dtype=torch.long, device=self.device)
+            for i, seq in enumerate(sequences):
+                inputs[i, length - len(seq):] = seq
+                mask[i, length - len(seq):] = 1
+            positions = (mask.cumsum(-1) - 1).clamp(min=0)
+
+            cache = DynamicCache()
+            generated = [[] for _ in requests]
+            logprob_sums = [0.0] * batch
+            finished = [False] * batch
+            for _ in range(max_new_tokens):
+                out = self.thinker.model(inputs_embeds=inputs, attention_mask=mask,
+                                         position_ids=self._positions(positions),
+                                         past_key_values=cache, use_cache=True)
+                cache = out.past_key_values
+                logprobs = self.thinker.lm_head(out.last_hidden_state[:, -1]).float().log_softmax(-1)
+                tokens = logprobs.argmax(-1)
+                for i, token in enumerate(tokens.tolist()):
+                    if finished[i]:
+                        continue
+                    if token in self.eos_ids:
+                        finished[i] = True
+                    else:
+                        generated[i].append(token)
+                        logprob_sums[i] += float(logprobs[i, token])
+                if all(finished):
+                    break
+                inputs = self.embed(tokens)[:, None]
+                mask = torch.cat([mask, mask.new_ones(batch, 1)], dim=1)
+                positions = positions[:, -1:] + 1
+
+        results = []
+        for (_, language, _), tokens, logprob_sum in zip(requests, generated, logprob_sums):
+            text, detected = self.postprocess(tokens, language)
+            results.append((text, detected, math.exp(logprob_sum / len(tokens)) if tokens else None, len(tokens)))
+        return results
+
+    def postprocess(self, tokens: List[int], language: Optional[str]) -> Tuple[str, str]:
+        """与 qwen_asr 的 transcribe 相同的后处理：去掉特殊 token 后交给 parse_asr_output（修正重复、规范语言名）"""
+        if self.parse_output is None:
+            return split_language(self.tokenizer.decode(tokens, skip_special_tokens=False), language)
+        raw = self.tokenizer.decode(tokens, skip_special_tokens=True, clean_up_tokenization_spaces=False)
+        detected, text = self.parse_output(raw, user_language=language)
+        return text, detected
@@ -0,0 +1,271 @@
+"""
+MindVoice 按客户端公平调度与准入控制
+共享服务器上请求原本无条件放行，一个不停提交长音频的客户端就能把其他人全部挤在后面。
+- 客户端按 API key（Authorization: Bearer）、X-Client-Id 头或来源 IP 区分；
+  key 与 X-Client-Id 都由请求方自报，只有配置中列出的标识才被采信，其余一律按来源 IP 计
+- 代价按解码后的音频时长计，而不是请求数：一条 10 分钟的音频抵得上上百句短语音
+- 虚拟时间公平排队：各客户端按权重分得推理时间，持续占用的客户端排到新来的客户端后面
+- 令牌桶限额：每个客户端每秒补充若干“音频秒”，超出额度的请求直接返回 429 与 Retry-After
+"""
+
+import time
+import heapq
+import asyncio
+import hashlib
+import itertools
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Collection, Dict, List, Optional
+
+# 服务内部发起的请求（如异步任务）不受限额约束，只参与公平排队
+INTERNAL_CLIENT = "internal"
+
+
+class RateLimited(Exception):
+    """客户端超出音频时长额度或排队上限"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def client_identity(authorization: Optional[str] = None, client_id: Optional[str] = None,
+                    host: Optional[str] = None, trusted: Optional[Collection[str]] = None) -> str:
+    """请求所属客户端：API key 优先（只保留哈希前缀，不在日志和状态中暴露原文），其次 X-Client-Id，最后来源 IP。
+    key 和 X-Client-Id 随意填写就能换一个身份绕过额度，只有出现在 trusted 中的标识才采信，否则按来源 IP 计"""
+    trusted = trusted or ()
+    if authorization:
+        token = authorization.split(" ", 1)[1] if authorization.lower().startswith("bearer ") else authorization
+        token = token.strip()
+        if token:
+            identity = "key:" + hashlib.sha256(token.encode("utf-8")).hexdigest()[:12]
+            if identity in trusted:
+                return identity
+    if client_id:
+        identity = "id:" + client_id.strip()[:64]
+        if identity in trusted:
+            return identity
+    return "ip:" + (host or "unknown")
+
+
+def trusted_clients(weights: Optional[Dict[str, float]] = None, extra: Optional[Collection[str]] = None) -> frozenset:
+    """可信的客户端标识：配置了权重的 key:/id: 标识，加上额外列出的标识"""
+    return frozenset(
+        name for name in [*(weights or {}), *(extra or ())]
+        if name.startswith(("key:", "id:"))
+    )
+
+
+class TokenBucket:
+    """以“音频秒”为单位的令牌桶：每秒补充 rate，最多存 burst"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float) -> float:
+        """额度足够时扣除并返回 0，否则不扣除，返回需要等待的秒数"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # 单次代价超过桶容量时按桶满放行，否则这类请求永远无法通过
+        cost = min(cost, self.burst)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class _Client:
+    def __init__(self, weight: float, bucket: Optional[TokenBucket]):
+        self.weight = weight
+        self.bucket = bucket
+        self.finish_tag = 0.0
+        self.queued_sec = 0.0
+        self.served_sec = 0.0
+        self.requests = 0
+        self.limited = 0
+        self.last_seen = time.monotonic()
+
+
+class FairShare:
+    """虚拟时间公平排队 (start-time fair queuing) 与准入控制。
+    任务的标签 = max(当前虚拟时间, 该客户端上一个任务的结束标签)，结束标签再加上 代价/权重；
+    调度方按标签从小到大执行，虚拟时间随已开始执行的任务标签推进"""
+
+    def __init__(self, rate_sec_per_sec: Optional[float] = None, burst_sec: float = 600.0,
+                 max_queued_sec: Optional[float] = None, weights: Optional[Dict[str, float]] = None,
+                 default_weight: float = 1.0, min_cost_sec: float = 1.0, idle_expire_sec: float = 3600.0):
+        self.rate = rate_sec_per_sec or None
+        self.burst_sec = burst_sec
+        self.max_queued_sec = max_queued_sec or None
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        # 短语音的代价下限：每个请求都有固定的调度/预处理开销
+        self.min_cost_sec = min_cost_sec
+        self.idle_expire_sec = idle_expire_sec
+
+        self.virtual_time = 0.0
+        self._clients: Dict[str, _Client] = {}
+        self._lock = threading.Lock()
+
+    def cost(self, duration: float) -> float:
+        return max(duration, self.min_cost_sec)
+
+    def _client(self, client: str) -> _Client:
+        state = self._clients.get(client)
+        if state is None:
+            self._expire()
+            limited = self.rate is not None and client != INTERNAL_CLIENT
+            state = _Client(
+                max(self.weights.get(client, self.default_weight), 1e-3),
+                TokenBucket(self.rate, self.burst_sec) if limited else None,
+            )
+            self._clients[client] = state
+        state.last_seen = time.monotonic()
+        return state
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.idle_expire_sec
+        for name in [name for name, c in self._clients.items() if c.last_seen < cutoff and c.queued_sec <= 0]:
+            del self._clients[name]
+
+    def admit(self, client: Optional[str], duration: float) -> float:
+        """准入检查，通过时返回计入的代价并记为排队中；超额时抛出 RateLimited"""
+        client = client or INTERNAL_CLIENT
+        cost = self.cost(duration)
+        with self._lock:
+            state = self._client(client)
+            if client != INTERNAL_CLIENT and self.max_queued_sec and state.queued_sec > 0 \
+                    and state.queued_sec + cost > self.max_queued_sec:
+                state.limited += 1
+                raise RateLimited(f"客户端排队中的音频超过 {self.max_queued_sec:.0f}s，请稍后再试",
+                                  retry_after=max(1.0, state.queued_sec / 10))
+            if state.bucket is not None:
+                wait = state.bucket.take(cost)
+                if wait > 0:
+                    state.limited += 1
+                    raise RateLimited(f"客户端音频时长额度已用完，{wait:.0f}s 后恢复", retry_after=wait)
+            state.queued_sec += cost
+            state.requests += 1
+        return cost
+
+    def tag(self, client: Optional[str], cost: float) -> float:
+        """为一个（分段后的）任务分配公平排队标签"""
+        with self._lock:
+            state = self._client(client or INTERNAL_CLIENT)
+            start = max(self.virtual_time, state.finish_tag)
+            state.finish_tag = start + cost / state.weight
+            return start
+
+    def dispatched(self, tag: float):
+        with self._lock:
+            self.virtual_time = max(self.virtual_time, tag)
+
+    def release(self, client: Optional[str], cost: float, served: bool = True):
+        with self._lock:
+            state = self._clients.get(client or INTERNAL_CLIENT)
+            if state is None:
+                return
+            state.queued_sec = max(0.0, state.queued_sec - cost)
+            if served:
+                state.served_sec += cost
+
+    def status(self, top: int = 20) -> dict:
+        with self._lock:
+            clients = sorted(self._clients.items(), key=lambda item: -item[1].served_sec)[:top]
+            return {
+                "rate_sec_per_sec": self.rate,
+                "burst_sec": self.burst_sec,
+                "max_queued_sec": self.max_queued_sec,
+                "clients": {
+                    name: {
+                        "weight": state.weight,
+                        "requests": state.requests,
+                        "queued_sec": round(state.queued_sec, 1),
+                        "served_sec": round(state.served_sec, 1),
+                        "limited": state.limited,
+                        "tokens_sec": round(state.bucket.tokens, 1) if state.bucket is not None else None,
+                    }
+                    for name, state in clients
+                },
+            }
+
+
+class FairGate:
+    """没有调度器的服务用的公平闸门：最多 concurrency 个请求同时执行，其余按公平标签排队"""
+
+    def __init__(self, fairness: FairShare, concurrency: int = 1):
+        self.fairness = fairness
+        self.concurrency = max(1, concurrency)
+        self.active = 0
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._latencies = deque(maxlen=500)
+
+    @asynccontextmanager
+    async def slot(self, client: Optional[str], duration: float):
+        """进入前做准入检查（可能抛出 RateLimited），轮到时执行 with 块"""
+        cost = self.fairness.admit(client, duration)
+        tag = self.fairness.tag(client, cost)
+        t_submit = time.monotonic()
+        served = False
+        try:
+            if self.active >= self.concurrency or self._heap:
+                waiter = asyncio.get_running_loop().create_future()
+                heapq.heappush(self._heap, (tag, next(self._seq), waiter))
+                self._wake()
+                try:
+                    await waiter
+                except asyncio.CancelledError:
+                    if waiter.done() and not waiter.cancelled():
+                        # 已被分配槽位但调用方放弃，把槽位交给下一个
+                        self.active -= 1
+                        self._wake()
+                    else:
+                        waiter.cancel()
+                    raise
+            else:
+                self.active += 1
+            self.fairness.dispatched(tag)
+            self._latencies.append(time.monotonic() - t_submit)
+            try:
+                served = True
+                yield
+            finally:
+                self.active -= 1
+                self._wake()
+        finally:
+            self.fairness.release(client, cost, served=served)
+
+    def _wake(self):
+        while self._heap and self.active < self.concurrency:
+            _, _, waiter = heapq.heappop(self._heap)
+            if waiter.done():
+                continue
+            self.active += 1
+            waiter.set_result(None)
+
+    def status(self) -> dict:
+        waits = sorted(self._latencies)
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "queued": sum(1 for _, _, waiter in self._heap if not waiter.done()),
+            "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 1) if waits else None,
+            "wait_p99_ms": round(waits[int(len(waits) * 0.99)] * 1000, 1) if waits else None,
+            **self.fairness.status(),
+        }
+
+
+def parse_weights(spec: Optional[str]) -> Dict[str, float]:
+    """解析 "客户端标识=权重,..." 形式的权重配置（环境变量用）"""
+    weights = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            name, value = item.rsplit("=", 1)
+            weights[name.strip()] = float(value)
+    return weights
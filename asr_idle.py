@@ -0,0 +1,151 @@
+"""
+MindVoice 空闲卸载
+桌面端一小时可能只听写几次，模型却一直占着数 GB 内存/显存。
+空闲超过设定时间后释放模型，下一次请求到来时再加载：
+- 卸载前可把模型写成快照（见 asr_snapshot），之后的重新加载走只读 mmap，跳过 from_pretrained
+- 客户端按下快捷键时可以先发预加载请求，说话的这几秒里模型就已经在加载
+- 正在处理请求时不会卸载；记录加载次数与耗时，供 GET / 展示
+"""
+
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from collections import deque
+from typing import Callable, Optional
+
+from asr_tracing import span
+
+logger = logging.getLogger("MindVoice-ASR")
+
+
+class ModelResidency:
+    """管理模型的驻留状态：load_fn / unload_fn 为同步函数，在线程中执行且不会并发调用"""
+
+    def __init__(self, load_fn: Callable[[], None], unload_fn: Callable[[], None],
+                 unload_after_sec: float = 0, loaded: bool = True, check_interval: float = 10.0):
+        self.load_fn = load_fn
+        self.unload_fn = unload_fn
+        # 0 表示不自动卸载
+        self.unload_after_sec = unload_after_sec
+        self.check_interval = min(check_interval, unload_after_sec) if unload_after_sec else check_interval
+        self.loaded = loaded
+
+        self.active = 0
+        self.last_used = time.monotonic()
+        self.loads = 0
+        self.unloads = 0
+        self.preloads = 0
+        self._load_times = deque(maxlen=20)
+        self._lock: Optional[asyncio.Lock] = None
+        self._loading: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._lock = asyncio.Lock()
+        if self.unload_after_sec:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def ensure_loaded(self):
+        if self.loaded:
+            return
+        # 多个请求同时等待时只加载一次
+        if self._loading is None or self._loading.done():
+            self._loading = asyncio.create_task(self._load())
+        await asyncio.shield(self._loading)
+
+    async def _load(self):
+        async with self._lock:
+            if self.loaded:
+                return
+            t_start = time.monotonic()
+            # 加载任务由第一个等待的请求创建，继承它的 trace
+            with span("model.reload"):
+                await asyncio.to_thread(self.load_fn)
+            elapsed = time.monotonic() - t_start
+            self.loaded = True
+            self.loads += 1
+            self._load_times.append(elapsed)
+            self.last_used = time.monotonic()
+            logger.info(f"模型已重新加载，耗时 {elapsed*1000:.0f}ms")
+
+    @asynccontextmanager
+    async def use(self):
+        """处理请求期间保持模型驻留：进入时按需加载，退出时刷新空闲计时"""
+        self.active += 1
+        try:
+            await self.ensure_loaded()
+            yield
+        finally:
+            self.active -= 1
+            self.last_used = time.monotonic()
+
+    def preload(self) -> bool:
+        """客户端即将发起请求（如按下快捷键）：后台开始加载并刷新空闲计时，返回模型此刻是否已驻留"""
+        self.last_used = time.monotonic()
+        if self.loaded:
+            return True
+        self.preloads += 1
+        if self._loading is None or self._loading.done():
+            self._loading = asyncio.create_task(self._load())
+            # 没有请求在等这个任务，失败只能在这里记录
+            self._loading.add_done_callback(self._log_preload_failure)
+        return False
+
+    @staticmethod
+    def _log_preload_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"预加载模型失败: {task.exception()}")
+
+    @asynccontextmanager
+    async def exclusive(self):
+        """替换模型（如切换模型）期间独占，不与空闲卸载、重新加载交错；正常结束后视为已驻留"""
+        async with self._lock:
+            yield
+            self.mark_loaded()
+
+    def mark_loaded(self):
+        """模型在别处已加载（如切换模型）"""
+        self.loaded = True
+        self.last_used = time.monotonic()
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            if not self.loaded or self.active or time.monotonic() - self.last_used < self.unload_after_sec:
+                continue
+            async with self._lock:
+                # 拿到锁时可能已有新请求进来
+                if not self.loaded or self.active or time.monotonic() - self.last_used < self.unload_after_sec:
+                    continue
+                idle = time.monotonic() - self.last_used
+                # 先标记为未驻留，卸载期间进来的请求会等待锁释放后重新加载
+                self.loaded = False
+                try:
+                    await asyncio.to_thread(self.unload_fn)
+                except Exception as e:
+                    logger.warning(f"模型卸载失败: {e}")
+                    self.loaded = True
+                    self.last_used = time.monotonic()
+                    continue
+                self.unloads += 1
+                logger.info(f"空闲 {idle:.0f}s，已卸载模型")
+
+    def status(self) -> dict:
+        load_times = list(self._load_times)
+        return {
+            "loaded": self.loaded,
+            "active": self.active,
+            "idle_sec": round(time.monotonic() - self.last_used, 1),
+            "unload_after_sec": self.unload_after_sec,
+            "loads": self.loads,
+            "unloads": self.unloads,
+            "preloads": self.preloads,
+            "last_reload_ms": round(load_times[-1] * 1000) if load_times else None,
+            "avg_reload_ms": round(sum(load_times) / len(load_times) * 1000) if load_times else None,
+        }
@@ -0,0 +1,297 @@
+"""
+MindVoice 异步转录任务
+大文件经 /v1/audio/transcriptions 转录时 HTTP 连接要一直挂到推理结束，客户端超时重试反而加倍负载。
+任务接口把提交与取结果拆开：
+- POST /v1/jobs 保存音频、写入 SQLite 任务表后立即返回任务 ID
+- 后台 worker 每次认领一批排队任务一起处理，吞吐与客户端连接的存活时间无关
+- GET /v1/jobs/{id} 轮询状态，可带 wait 长轮询到任务结束
+任务表和音频都落盘，服务重启后未完成的任务重新排队。
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import sqlite3
+import logging
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger("MindVoice-ASR")
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+FINISHED = (STATUS_DONE, STATUS_FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    audio_path TEXT,
+    filename TEXT,
+    size INTEGER,
+    language TEXT,
+    prompt TEXT,
+    text TEXT,
+    detected_language TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+"""
+
+# 批处理函数：输入认领到的任务行，按顺序返回每个任务的 {"text", "language"} 或异常
+BatchFn = Callable[[List[dict]], Awaitable[List[object]]]
+
+
+class JobStore:
+    """SQLite 任务表；所有操作串行执行，由调用方放到线程中以免阻塞事件循环"""
+
+    def __init__(self, db_path: str, max_attempts: int = 2):
+        self.db_path = db_path
+        self.audio_dir = os.path.join(os.path.dirname(os.path.abspath(db_path)), "audio")
+        self.max_attempts = max(1, max_attempts)
+        os.makedirs(self.audio_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def recover(self) -> int:
+        """上次运行中断时正在处理的任务重新排队（次数用尽的记为失败）"""
+        with self._lock:
+            exhausted = self._db.execute(
+                "SELECT audio_path FROM jobs WHERE status = ? AND attempts >= ?", (STATUS_RUNNING, self.max_attempts),
+            ).fetchall()
+            self._db.execute(
+                "UPDATE jobs SET status = ?, finished = ?, error = ?, audio_path = NULL WHERE status = ? AND attempts >= ?",
+                (STATUS_FAILED, time.time(), "服务重启时任务中断", STATUS_RUNNING, self.max_attempts),
+            )
+            count = self._db.execute(
+                "UPDATE jobs SET status = ?, started = NULL WHERE status = ?", (STATUS_QUEUED, STATUS_RUNNING),
+            ).rowcount
+        # 判为失败的任务不会再处理，音频一并删除
+        for row in exhausted:
+            if row["audio_path"] and os.path.exists(row["audio_path"]):
+                os.unlink(row["audio_path"])
+        if exhausted:
+            logger.info(f"{len(exhausted)} 个中断的任务已用尽重试次数，记为失败")
+        if count:
+            logger.info(f"恢复 {count} 个中断的转录任务")
+        return count
+
+    def create(self, data: bytes, filename: Optional[str], language: Optional[str] = None,
+               prompt: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex
+        suffix = os.path.splitext(filename)[1] if filename else ".webm"
+        audio_path = os.path.join(self.audio_dir, job_id + suffix)
+        with open(audio_path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, created, audio_path, filename, size, language, prompt) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, STATUS_QUEUED, time.time(), audio_path, filename, len(data), language, prompt),
+            )
+        return job_id
+
+    def claim(self, limit: int) -> List[dict]:
+        """按提交顺序认领至多 limit 个排队任务并标记为运行中"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created LIMIT ?", (STATUS_QUEUED, limit),
+                ).fetchall()
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE jobs SET status = ?, started = ?, attempts = attempts + 1 WHERE id = ?",
+                    [(STATUS_RUNNING, now, row["id"]) for row in rows],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return [dict(row) for row in rows]
+
+    def complete(self, job_id: str, text: str, language: Optional[str]):
+        self._finish(job_id, STATUS_DONE, text=text, detected_language=language)
+
+    def fail(self, job_id: str, error: str):
+        self._finish(job_id, STATUS_FAILED, error=error)
+
+    def _finish(self, job_id: str, status: str, **fields):
+        with self._lock:
+            row = self._db.execute("SELECT audio_path FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            columns = ", ".join(f"{key} = ?" for key in fields)
+            self._db.execute(
+                f"UPDATE jobs SET status = ?, finished = ?, audio_path = NULL, {columns} WHERE id = ?",
+                (status, time.time(), *fields.values(), job_id),
+            )
+        # 结果已入库，音频不再需要
+        if row is not None and row["audio_path"] and os.path.exists(row["audio_path"]):
+            os.unlink(row["audio_path"])
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def purge(self, older_than_sec: float) -> int:
+        """删除结束超过 older_than_sec 秒的任务记录"""
+        with self._lock:
+            return self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?",
+                (*FINISHED, time.time() - older_than_sec),
+            ).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+def job_view(job: dict) -> dict:
+    """接口返回的任务信息"""
+    view = {
+        "id": job["id"],
+        "status": job["status"],
+        "filename": job["filename"],
+        "created_at": job["created"],
+        "started_at": job["started"],
+        "finished_at": job["finished"],
+    }
+    if job["status"] == STATUS_DONE:
+        view["text"] = job["text"]
+        view["language"] = job["detected_language"]
+    elif job["status"] == STATUS_FAILED:
+        view["error"] = job["error"]
+    return view
+
+
+class JobRunner:
+    """后台 worker：有任务时每次认领 batch_size 个交给 process_batch，空闲时等待新任务提交"""
+
+    def __init__(self, store: JobStore, process_batch: BatchFn, batch_size: int = 4, workers: int = 1,
+                 retention_hours: float = 24, poll_interval: float = 5.0):
+        self.store = store
+        self.process_batch = process_batch
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.retention_sec = retention_hours * 3600
+        self.poll_interval = poll_interval
+
+        self.batches = 0
+        self.completed = 0
+        self.failed = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._waiters: Dict[str, asyncio.Event] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._purge_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def submit(self, data: bytes, filename: Optional[str], language: Optional[str] = None,
+                     prompt: Optional[str] = None) -> str:
+        job_id = await asyncio.to_thread(self.store.create, data, filename, language, prompt)
+        self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str, wait: float = 0) -> Optional[dict]:
+        """查询任务；wait > 0 时任务未结束则最多等待 wait 秒（长轮询）"""
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or wait <= 0 or job["status"] in FINISHED:
+            return job
+        # 同一任务的多个长轮询共用一个事件，任务结束时由 _notify 移除并触发
+        event = self._waiters.setdefault(job_id, asyncio.Event())
+        # 查询与登记之间任务可能刚好结束，登记后再查一次
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or job["status"] in FINISHED:
+            self._notify(job_id)
+            return job
+        try:
+            await asyncio.wait_for(event.wait(), timeout=wait)
+        except asyncio.TimeoutError:
+            return job
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    def _notify(self, job_id: str):
+        event = self._waiters.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def _worker(self):
+        while True:
+            # 先清除再认领：认领期间提交的任务会重新置位，不会错过唤醒
+            self._wakeup.clear()
+            try:
+                jobs = await asyncio.to_thread(self.store.claim, self.batch_size)
+                if jobs:
+                    await self._run(jobs)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 数据库等异常不能让 worker 退出，否则队列再也没人处理
+                logger.error(f"任务 worker 出错，稍后重试: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, jobs: List[dict]):
+        t_start = time.monotonic()
+        try:
+            results = await self.process_batch(jobs)
+        except Exception as e:
+            results = [e] * len(jobs)
+        self.batches += 1
+
+        for job, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                logger.error(f"任务 {job['id'][:8]} 转录失败: {result}")
+                await asyncio.to_thread(self.store.fail, job["id"], str(result))
+                self.failed += 1
+            else:
+                await asyncio.to_thread(self.store.complete, job["id"], result["text"], result["language"])
+                self.completed += 1
+            self._notify(job["id"])
+        logger.info(f"任务批处理完成: {len(jobs)} 个, 耗时 {(time.monotonic() - t_start)*1000:.0f}ms")
+
+    async def _purge_loop(self):
+        while True:
+            try:
+                removed = await asyncio.to_thread(self.store.purge, self.retention_sec)
+                if removed:
+                    logger.info(f"清理过期任务记录 {removed} 条")
+            except Exception as e:
+                logger.warning(f"任务记录清理失败: {e}")
+            await asyncio.sleep(3600)
+
+    def status(self) -> dict:
+        return {
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+            "batches": self.batches,
+            "completed": self.completed,
+            "failed": self.failed,
+            "long_polls": len(self._waiters),
+            "jobs": self.store.counts(),
+        }
@@ -0,0 +1,334 @@
+"""
+MindVoice ONNX Runtime 后端
+把 Qwen3-ASR 的音频编码器和文本解码器导出为 ONNX（可选 int8 动态量化），在 CPU 上用 onnxruntime 推理：
+- 编码器按固定窗口（特征提取器的 chunk_length，默认 30s）前向，长音频逐窗编码后拼接音频嵌入
+- 解码器逐 token 贪心生成，KV cache 以 numpy 数组在步间传递，每步只计算新 token
+运行时只依赖 onnxruntime / tokenizers / 特征提取器，不需要 qwen_asr。
+
+导出：python asr_onnx.py export --model model/qwen3-asr-0.6B --output model/qwen3-asr-onnx [--int8]
+"""
+
+import os
+import json
+import math
+import time
+import logging
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("MindVoice-ASR")
+
+CONFIG_NAME = "onnx_config.json"
+EMBED_NAME = "embed_tokens.npy"
+
+# Qwen3-ASR 的对话格式：系统消息放提示词/热词，用户消息只含音频；指定语言时在回复开头强制写出语言。
+# 导出时由处理器的 chat template 生成实际使用的前后缀写入 onnx_config.json，这里的常量只在模板不可用时兜底
+PROMPT_PREFIX = "<|im_start|>system\n{context}<|im_end|>\n<|im_start|>user\n<|audio_start|>"
+PROMPT_SUFFIX = "<|audio_end|><|im_end|>\n<|im_start|>assistant\n"
+LANGUAGE_PREFIX = "language {language}<asr_text>"
+EOS_TOKENS = ["<|im_end|>", "<|endoftext|>"]
+
+
+def build_prompt(prompt: Optional[str], language: Optional[str], config: Optional[dict] = None) -> Tuple[str, str]:
+    """音频嵌入前后的对话文本 (前缀, 后缀)"""
+    config = config or {}
+    prefix = config.get("prompt_prefix", PROMPT_PREFIX).replace("{context}", prompt.strip() if prompt else "")
+    suffix = config.get("prompt_suffix", PROMPT_SUFFIX)
+    if language:
+        suffix += config.get("language_prefix", LANGUAGE_PREFIX).replace("{language}", language)
+    return prefix, suffix
+
+
+def derive_prompt_template(processor) -> Tuple[str, str]:
+    """用处理器自带的 chat template 渲染一段只含音频的对话，按音频占位切出 (前缀, 后缀)；
+    前缀保留 {context} 供 build_prompt 填入提示词"""
+    conversation = [
+        {"role": "system", "content": "{context}"},
+        {"role": "user", "content": [{"type": "audio", "audio": ""}]},
+    ]
+    try:
+        rendered = processor.apply_chat_template(conversation, add_generation_prompt=True, tokenize=False)
+        start = rendered.index("<|audio_start|>") + len("<|audio_start|>")
+        end = rendered.index("<|audio_end|>", start)
+    except Exception as e:
+        logger.warning(f"无法从处理器的 chat template 生成提示词格式，使用内置格式: {e}")
+        return PROMPT_PREFIX, PROMPT_SUFFIX
+    if "{context}" not in rendered[:start]:
+        logger.warning("处理器的 chat template 不含系统消息，提示词/热词将不生效")
+    return rendered[:start], rendered[end:]
+
+
+def split_language(output: str, language: Optional[str]) -> Tuple[str, str]:
+    """输出形如 "language Chinese<asr_text>转录文本"；强制语言时语言前缀在输入里。返回 (文本, 语言)"""
+    detected = language or "unknown"
+    if "<asr_text>" in output:
+        head, output = output.split("<asr_text>", 1)
+        detected = head.replace("language", "").strip() or detected
+    return output.strip(), detected
+
+
+def _session_options(threads: Optional[int]):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads is None and hasattr(os, "sched_getaffinity"):
+        # worker 进程已绑定核心时只用分到的核心，onnxruntime 默认会按全部物理核心开线程
+        threads = len(os.sched_getaffinity(0))
+    if threads:
+        options.intra_op_num_threads = threads
+    return options
+
+
+class OnnxQwenRuntime:
+    """onnxruntime 上的 Qwen3-ASR 推理：窗口化音频编码 + 带 KV cache 的贪心解码"""
+
+    def __init__(self, model_dir: str, quantized: bool = False, threads: Optional[int] = None,
+                 encoder_threads: Optional[int] = None, decoder_threads: Optional[int] = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        from transformers import WhisperFeatureExtractor
+
+        with open(os.path.join(model_dir, CONFIG_NAME), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+
+        suffix = ".int8.onnx" if quantized else ".onnx"
+        providers = ["CPUExecutionProvider"]
+        # 编码器/解码器可分别指定线程数（编码器计算密集，解码器受内存带宽限制）
+        self.encoder = ort.InferenceSession(os.path.join(model_dir, "encoder" + suffix),
+                                            _session_options(encoder_threads or threads), providers=providers)
+        self.decoder = ort.InferenceSession(os.path.join(model_dir, "decoder" + suffix),
+                                            _session_options(decoder_threads or threads), providers=providers)
+        self.past_names = [i.name for i in self.decoder.get_inputs() if i.name.startswith("past_")]
+
+        # 词嵌入表只读 mmap，按需取行
+        self.embed_tokens = np.load(os.path.join(model_dir, EMBED_NAME), mmap_mode="r")
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.feature_extractor = WhisperFeatureExtractor.from_pretrained(model_dir)
+
+        self.window_samples = self.feature_extractor.n_samples
+        self.window_tokens = self.config["window_tokens"]
+        self.eos_ids = {self.tokenizer.token_to_id(t) for t in self.config.get("eos_tokens", EOS_TOKENS)}
+        self.eos_ids.discard(None)
+
+    def _embed(self, ids: List[int]) -> np.ndarray:
+        return np.asarray(self.embed_tokens[ids], dtype=np.float32)
+
+    def _tokenize(self, text: str) -> List[int]:
+        return self.tokenizer.encode(text, add_special_tokens=False).ids
+
+    def extract_features(self, audio: np.ndarray) -> List[Tuple[np.ndarray, int]]:
+        """逐窗计算 log-mel 特征，返回 [(特征, 该窗有效的嵌入数)]"""
+        windows = []
+        for start in range(0, max(len(audio), 1), self.window_samples):
+            chunk = audio[start:start + self.window_samples]
+            features = self.feature_extractor(
+                chunk, sampling_rate=self.feature_extractor.sampling_rate, return_tensors="np"
+            )["input_features"][0].astype(np.float32)
+            windows.append((features, math.ceil(self.window_tokens * len(chunk) / self.window_samples)))
+        return windows
+
+    def encode_features(self, windows: List[Tuple[np.ndarray, int]]) -> np.ndarray:
+        """逐窗编码，去掉末窗补零部分对应的嵌入后拼接为 [tokens, hidden]"""
+        embeddings = [
+            self.encoder.run(None, {"input_features": features})[0][:valid]
+            for features, valid in windows
+        ]
+        return np.concatenate(embeddings, axis=0)
+
+    def encode_audio(self, audio: np.ndarray) -> np.ndarray:
+        return self.encode_features(self.extract_features(audio))
+
+    def encode_batch(self, audios: List[np.ndarray]) -> List[np.ndarray]:
+        # 导出的编码器输入不含批维度，按窗依次前向
+        return [self.encode_audio(audio) for audio in audios]
+
+    def generate(self, inputs_embeds: np.ndarray, max_new_tokens: int) -> Tuple[List[int], Optional[float]]:
+        """贪心解码，返回 (token, 置信度)；present KV 直接作为下一步的 past 输入，前缀只在首步计算一次"""
+        cfg = self.config
+        empty = np.zeros((1, cfg["num_key_value_heads"], 0, cfg["head_dim"]), dtype=np.float32)
+        past = [empty] * len(self.past_names)
+
+        embeds = inputs_embeds[None]
+        past_len = 0
+        generated = []
+        logprob_sum = 0.0
+        for _ in range(max_new_tokens):
+            seq_len = embeds.shape[1]
+            feeds = {
+                "inputs_embeds": embeds,
+                "attention_mask": np.ones((1, past_len + seq_len), dtype=np.int64),
+                "position_ids": np.arange(past_len, past_len + seq_len, dtype=np.int64)[None],
+            }
+            feeds.update(zip(self.past_names, past))
+            outputs = self.decoder.run(None, feeds)
+            logits, past = outputs[0], outputs[1:]
+            past_len += seq_len
+
+            step = logits[0, -1].astype(np.float64)
+            token = int(np.argmax(step))
+            if token in self.eos_ids:
+                break
+            # argmax 处的 log-softmax = -log(sum(exp(logits - max)))
+            logprob_sum -= float(np.log(np.exp(step - step[token]).sum()))
+            generated.append(token)
+            embeds = self._embed([token])[None]
+        return generated, math.exp(logprob_sum / len(generated)) if generated else None
+
+    def decode_one(self, audio_embeds: np.ndarray, language: Optional[str], prompt: Optional[str],
+                   max_new_tokens: int) -> Tuple[str, str, Optional[float], int]:
+        """在已编码的音频嵌入上构造对话输入并解码，返回 (文本, 语言, 置信度, 生成的 token 数)；
+        置信度为所选 token 概率的几何平均，供模型级联判断是否升级"""
+        prefix, suffix = build_prompt(prompt, language, self.config)
+        inputs_embeds = np.concatenate([
+            self._embed(self._tokenize(prefix)),
+            audio_embeds,
+            self._embed(self._tokenize(suffix)),
+        ], axis=0)
+        tokens, confidence = self.generate(inputs_embeds, max_new_tokens)
+        text, detected = split_language(self.tokenizer.decode(tokens, skip_special_tokens=False), language)
+        return text, detected, confidence, len(tokens)
+
+    def decode_batch(self, requests: List[Tuple[np.ndarray, Optional[str], Optional[str]]],
+                     max_new_tokens: int = 512) -> List[Tuple[str, str, Optional[float], int]]:
+        # 导出的解码器 KV 为单序列形状，批内逐条解码
+        return [self.decode_one(embeds, language, prompt, max_new_tokens) for embeds, language, prompt in requests]
+
+
+def embedding_table(embed_tokens) -> np.ndarray:
+    """导出用的词嵌入表：与导出的 fp32 解码图保持一致，避免嵌入多一次 fp16 舍入导致与 transformers 输出不一致"""
+    import torch
+
+    return embed_tokens.weight.detach().to(torch.float32).cpu().numpy()
+
+
+def export(model_path: str, output_dir: str, quantize: bool = False, opset: int = 17):
+    """从 qwen_asr 的 transformers 模型导出编码器/解码器 ONNX、词嵌入表、分词器和特征提取器配置"""
+    import torch
+    from qwen_asr import Qwen3ASRModel
+
+    os.makedirs(output_dir, exist_ok=True)
+    wrapper = Qwen3ASRModel.from_pretrained(model_path, dtype=torch.float32, device_map="cpu")
+    thinker = wrapper.model.thinker
+    processor = wrapper.processor
+    feature_extractor = processor.feature_extractor
+    text_config = thinker.config.text_config
+    head_dim = getattr(text_config, "head_dim", None) or text_config.hidden_size // text_config.num_attention_heads
+    num_layers = text_config.num_hidden_layers
+    num_kv_heads = text_config.num_key_value_heads
+    # 多模态 RoPE 在纯音频输入下三个分量相同，导出时由一维位置展开
+    mrope = bool((getattr(text_config, "rope_scaling", None) or {}).get("mrope_section"))
+
+    class AudioEncoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.audio_tower = thinker.audio_tower
+
+        def forward(self, input_features):
+            feature_lens = torch.tensor([input_features.shape[-1]], dtype=torch.long)
+            return self.audio_tower(input_features, feature_lens=feature_lens).last_hidden_state
+
+    class TextDecoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = thinker.model
+            self.lm_head = thinker.lm_head
+
+        def forward(self, inputs_embeds, attention_mask, position_ids, *past):
+            from transformers import DynamicCache
+
+            cache = DynamicCache.from_legacy_cache(tuple(zip(past[0::2], past[1::2])))
+            if mrope:
+                position_ids = position_ids.unsqueeze(0).expand(3, -1, -1)
+            out = self.model(inputs_embeds=inputs_embeds, attention_mask=attention_mask,
+                             position_ids=position_ids, past_key_values=cache, use_cache=True)
+            logits = self.lm_head(out.last_hidden_state[:, -1:, :])
+            present = out.past_key_values.to_legacy_cache()
+            return (logits, *[t for kv in present for t in kv])
+
+    window_frames = feature_extractor.nb_max_frames
+    features = torch.zeros(feature_extractor.feature_size, window_frames)
+    encoder = AudioEncoder().eval()
+    with torch.no_grad():
+        window_tokens = encoder(features).shape[0]
+        logger.info(f"导出音频编码器: {window_frames} 帧 -> {window_tokens} tokens")
+        torch.onnx.export(encoder, (features,), os.path.join(output_dir, "encoder.onnx"),
+                          input_names=["input_features"], output_names=["audio_embeds"], opset_version=opset)
+
+    past_names, present_names, past_axes = [], [], {}
+    for i in range(num_layers):
+        for kind in ("key", "value"):
+            past_names.append(f"past_{kind}_{i}")
+            present_names.append(f"present_{kind}_{i}")
+            past_axes[f"past_{kind}_{i}"] = {2: "past_len"}
+            past_axes[f"present_{kind}_{i}"] = {2: "total_len"}
+    seq_len, past_len = 3, 4
+    dummy_past = [torch.zeros(1, num_kv_heads, past_len, head_dim) for _ in past_names]
+    dummy = (
+        torch.zeros(1, seq_len, text_config.hidden_size),
+        torch.ones(1, past_len + seq_len, dtype=torch.long),
+        torch.arange(past_len, past_len + seq_len).unsqueeze(0),
+        *dummy_past,
+    )
+    logger.info(f"导出文本解码器: {num_layers} 层, KV heads {num_kv_heads}, head_dim {head_dim}")
+    with torch.no_grad():
+        torch.onnx.export(
+            TextDecoder().eval(), dummy, os.path.join(output_dir, "decoder.onnx"),
+            input_names=["inputs_embeds", "attention_mask", "position_ids", *past_names],
+            output_names=["logits", *present_names],
+            dynamic_axes={
+                "inputs_embeds": {1: "seq_len"},
+                "attention_mask": {1: "total_len"},
+                "position_ids": {1: "seq_len"},
+                **past_axes,
+            },
+            opset_version=opset,
+        )
+
+    np.save(os.path.join(output_dir, EMBED_NAME), embedding_table(thinker.model.embed_tokens))
+    processor.tokenizer.save_pretrained(output_dir)
+    feature_extractor.save_pretrained(output_dir)
+    prompt_prefix, prompt_suffix = derive_prompt_template(processor)
+
+    with open(os.path.join(output_dir, CONFIG_NAME), "w", encoding="utf-8") as f:
+        json.dump({
+            "source": model_path,
+            "hidden_size": text_config.hidden_size,
+            "num_hidden_layers": num_layers,
+            "num_key_value_heads": num_kv_heads,
+            "head_dim": head_dim,
+            "window_tokens": int(window_tokens),
+            "prompt_prefix": prompt_prefix,
+            "prompt_suffix": prompt_suffix,
+            "language_prefix": LANGUAGE_PREFIX,
+            "eos_tokens": EOS_TOKENS,
+        }, f, indent=2, ensure_ascii=False)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        for name in ("encoder", "decoder"):
+            logger.info(f"int8 动态量化: {name}")
+            quantize_dynamic(os.path.join(output_dir, f"{name}.onnx"), os.path.join(output_dir, f"{name}.int8.onnx"),
+                             weight_type=QuantType.QInt8, use_external_data_format=True)
+    logger.info(f"✅ ONNX 模型已导出到 {output_dir}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="MindVoice ONNX 导出工具")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--model", default="model/qwen3-asr-0.6B",
+                        help="Qwen3-ASR 模型目录或 HuggingFace 名称 (默认: model/qwen3-asr-0.6B)")
+    parser.add_argument("--output", "-o", default="model/qwen3-asr-onnx",
+                        help="输出目录 (默认: model/qwen3-asr-onnx)")
+    parser.add_argument("--int8", action="store_true", help="额外导出 int8 动态量化版本")
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+
+    t_start = time.time()
+    export(args.model, args.output, quantize=args.int8, opset=args.opset)
+    print(f"导出完成，用时 {time.time() - t_start:.0f}s")
@@ -0,0 +1,236 @@
+"""
+MindVoice 分阶段流水线
+一次转录依次经过 接收 → 解码/重采样 → 特征提取 → 模型推理 四个阶段。
+各阶段之间用有界队列相连、各自有独立的 worker 数，模型推理时下一个请求的音频解码和特征提取并行进行；
+下游处理不过来时上游 put 阻塞，形成背压而不是无限堆积。
+队列按 rank（优先级类别、截止时间）出队而不是先进先出，并可为最高类别预留 worker：
+几条长 bulk 请求占满阶段时，交互请求仍能直接进入下游（最终到达调度器的优先级队列）。
+每个阶段统计队列深度与利用率，用于判断瓶颈所在；请求带有 trace 时每个阶段记一个 span（见 asr_tracing）。
+"""
+
+import time
+import heapq
+import asyncio
+import inspect
+import logging
+import threading
+import itertools
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from asr_tracing import Captured, activate, capture, span
+
+logger = logging.getLogger("MindVoice-ASR")
+
+# 阶段函数：接收并原地更新上下文 dict；同步函数在线程中执行，协程函数直接 await
+StageFn = Callable[[dict], Union[None, Awaitable[None]]]
+# 出队顺序：按上下文计算的元组，越小越先；rank[0] == 0 为最高优先级类别
+RankFn = Callable[[dict], tuple]
+
+
+@dataclass
+class _Item:
+    context: dict
+    future: asyncio.Future
+    enqueued: float = field(default_factory=time.monotonic)
+    # 提交方所在的 trace 位置；worker 是常驻协程，不继承请求的上下文
+    traced: Captured = field(default_factory=capture)
+
+
+class Stage:
+    """一个流水线阶段：workers 个协程从有界优先队列中取任务执行。
+    reserved 个 worker 只处理最高类别（rank[0] == 0）的任务，其他任务最多同时占用 workers - reserved 个"""
+
+    def __init__(self, name: str, fn: StageFn, workers: int = 1, queue_size: int = 8, reserved: int = 0):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.reserved = min(max(0, reserved), self.workers - 1)
+        self.next: Optional["Stage"] = None
+        self.rank: RankFn = lambda context: (0,)
+        # 请求方已放弃的任务被丢弃时调用，用于清理前面阶段留下的资源（如临时文件）
+        self.on_drop: Optional[Callable[[dict], None]] = None
+
+        self.processed = 0
+        self.failed = 0
+        self.active = 0
+        self.busy_sec = 0.0
+        self._started = 0.0
+        self._service = deque(maxlen=500)
+        self._wait = deque(maxlen=500)
+        self._tasks: List[asyncio.Task] = []
+        self._heap: List[Tuple[tuple, int, _Item]] = []
+        self._seq = itertools.count()
+        self._cond: Optional[asyncio.Condition] = None
+        self._active_low = 0
+
+    def start(self):
+        self._cond = asyncio.Condition()
+        self._started = time.monotonic()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def put(self, item: _Item):
+        """入队，队列满时等待（背压）。最高类别的任务最多可再超出 queue_size 个，不会被挡在满队列之外"""
+        rank = self.rank(item.context)
+        limit = self.queue_size * 2 if rank[0] == 0 else self.queue_size
+        item.enqueued = time.monotonic()
+        async with self._cond:
+            await self._cond.wait_for(lambda: len(self._heap) < limit)
+            heapq.heappush(self._heap, (rank, next(self._seq), item))
+            self._cond.notify_all()
+
+    def _takeable(self) -> bool:
+        # 堆顶不是最高类别说明队列里没有最高类别的任务
+        return bool(self._heap) and (self._heap[0][0][0] == 0 or self._active_low < self.workers - self.reserved)
+
+    async def _run(self, context: dict):
+        if inspect.iscoroutinefunction(self.fn):
+            await self.fn(context)
+        else:
+            await asyncio.to_thread(self.fn, context)
+
+    async def _worker(self):
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(self._takeable)
+                rank, _, item = heapq.heappop(self._heap)
+                low = rank[0] != 0
+                if low:
+                    self._active_low += 1
+                self._cond.notify_all()
+            try:
+                await self._process(item)
+            finally:
+                if low:
+                    async with self._cond:
+                        self._active_low -= 1
+                        self._cond.notify_all()
+            if item.future.done():
+                continue
+            if self.next is None:
+                item.future.set_result(item.context)
+            else:
+                await self.next.put(item)
+
+    async def _process(self, item: _Item):
+        if item.future.done():
+            # 请求方已取消（如客户端断开），后续阶段不再处理
+            self._drop(item)
+            return
+        t_start = time.monotonic()
+        self._wait.append(t_start - item.enqueued)
+        self.active += 1
+        try:
+            with activate(item.traced), span(self.name, wait_ms=round((t_start - item.enqueued) * 1000, 1)):
+                await self._run(item.context)
+        except Exception as e:
+            self.failed += 1
+            if not item.future.done():
+                item.future.set_exception(e)
+            return
+        finally:
+            self.active -= 1
+            elapsed = time.monotonic() - t_start
+            self.busy_sec += elapsed
+            self._service.append(elapsed)
+            item.context.setdefault("timings", {})[self.name] = elapsed
+
+        self.processed += 1
+        if item.future.done():
+            self._drop(item)
+
+    def _drop(self, item: _Item):
+        if self.on_drop is not None:
+            try:
+                self.on_drop(item.context)
+            except Exception as e:
+                logger.warning(f"流水线清理失败: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        def mean_ms(values):
+            return round(sum(values) / len(values) * 1000, 1) if values else None
+
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        return {
+            "workers": self.workers,
+            "active": self.active,
+            "queued": len(self._heap),
+            "queue_size": self.queue_size,
+            "reserved": self.reserved,
+            "processed": self.processed,
+            "failed": self.failed,
+            # 启动以来 worker 忙碌时间占比；接近 1 的阶段即为瓶颈
+            "utilization": round(self.busy_sec / (elapsed * self.workers), 3) if elapsed > 0 else 0.0,
+            "avg_service_ms": mean_ms(self._service),
+            "avg_wait_ms": mean_ms(self._wait),
+        }
+
+
+class Pipeline:
+    """按顺序串联各阶段；submit 放入首个阶段的队列并等待最后一个阶段完成。
+    rank 在每次入队时按当前上下文重新计算（如解码后才知道音频时长）"""
+
+    def __init__(self, stages: List[Stage], on_drop: Optional[Callable[[dict], None]] = None,
+                 rank: Optional[RankFn] = None):
+        self.stages = stages
+        for stage, following in zip(stages, stages[1:]):
+            stage.next = following
+        for stage in stages:
+            stage.on_drop = on_drop
+            if rank is not None:
+                stage.rank = rank
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    async def stop(self):
+        for stage in self.stages:
+            await stage.stop()
+
+    async def submit(self, context: dict) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        await self.stages[0].put(_Item(context, future))
+        try:
+            return await future
+        finally:
+            future.cancel()
+
+    def status(self) -> Dict[str, Any]:
+        stages = {stage.name: stage.status() for stage in self.stages}
+        busiest = max(self.stages, key=lambda s: stages[s.name]["utilization"])
+        return {
+            "stages": stages,
+            "bottleneck": busiest.name if stages[busiest.name]["processed"] else None,
+        }
+
+
+class PreparedInputs:
+    """特征阶段预先算好的模型输入，按音频数组对象索引；容量有限，未被取用的旧条目直接丢弃"""
+
+    def __init__(self, max_items: int = 32):
+        self.max_items = max_items
+        self._entries: "OrderedDict[int, Tuple[Any, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, audio, features):
+        with self._lock:
+            # 条目持有音频数组的引用，id 在条目存活期间不会被复用
+            self._entries[id(audio)] = (audio, features)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def pop(self, audio) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(id(audio))
+            if entry is None or entry[0] is not audio:
+                return None
+            del self._entries[id(audio)]
+            return entry[1]
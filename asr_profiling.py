@@ -0,0 +1,192 @@
+"""
+MindVoice 在线性能剖析
+排查线上节点的热点原本要在 profiler 下重启服务，模型预热、缓存等状态全部丢失。
+/debug/profile?seconds=N 在服务照常处理请求的同时采集一个时间窗口：
+- Python 采样剖析：后台线程定时抓取所有线程的调用栈，输出折叠栈（flamegraph.pl / speedscope 可直接打开）
+- 模型的 torch.profiler trace：窗口内的模型调用各自在调用线程中开启 profiler，结束时合并为一份 Chrome trace
+不在剖析时不启动采样线程，模型调用只多一次属性判断。
+"""
+
+import io
+import os
+import sys
+import json
+import hmac
+import time
+import asyncio
+import zipfile
+import logging
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger("MindVoice-ASR")
+
+
+class ProfileBusy(Exception):
+    """已有一个剖析窗口在进行"""
+
+
+def debug_authorized(expected: Optional[str], authorization: Optional[str], debug_token: Optional[str]) -> bool:
+    """校验调试令牌：Authorization: Bearer <token> 或 X-Debug-Token 头；未配置令牌时一律拒绝"""
+    if not expected:
+        return False
+    supplied = debug_token
+    if not supplied and authorization and authorization.lower().startswith("bearer "):
+        supplied = authorization.split(" ", 1)[1].strip()
+    return bool(supplied) and hmac.compare_digest(supplied.encode("utf-8"), expected.encode("utf-8"))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """采样剖析：每 interval 秒用 sys._current_frames 抓一次所有线程的栈，按折叠栈计数"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="mindvoice-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+
+class ModelProfiler:
+    """剖析窗口内对模型调用逐个开启 torch.profiler（profiler 只记录开启它的线程，模型在工作线程中执行），
+    同一时刻只剖析一个调用，其余照常执行"""
+
+    def __init__(self):
+        self.active = False
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._profiles: List[object] = []
+
+    def start(self):
+        self._profiles = []
+        self.skipped = 0
+        self.active = True
+
+    def stop(self) -> Optional[bytes]:
+        """结束窗口，把各次调用的 trace 合并为一份 Chrome trace；窗口内没有模型调用时返回 None"""
+        self.active = False
+        # 等待正在剖析的调用结束
+        with self._lock:
+            profiles, self._profiles = self._profiles, []
+        if not profiles:
+            return None
+        events = []
+        with tempfile.TemporaryDirectory() as tmp:
+            for i, prof in enumerate(profiles):
+                path = os.path.join(tmp, f"{i}.json")
+                prof.export_chrome_trace(path)
+                with open(path, encoding="utf-8") as f:
+                    events.extend(json.load(f).get("traceEvents", []))
+        return json.dumps({"traceEvents": events}).encode("utf-8")
+
+    @contextmanager
+    def profile_call(self):
+        if not self.active or not self._lock.acquire(blocking=False):
+            if self.active:
+                self.skipped += 1
+            yield
+            return
+        try:
+            import torch
+            from torch.profiler import ProfilerActivity, profile
+
+            activities = [ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(ProfilerActivity.CUDA)
+            with profile(activities=activities, record_shapes=True) as prof:
+                yield
+            self._profiles.append(prof)
+        finally:
+            self._lock.release()
+
+    def call(self, fn: Callable, *args, **kwargs):
+        with self.profile_call():
+            return fn(*args, **kwargs)
+
+
+class ProfileSession:
+    """一次只允许一个剖析窗口"""
+
+    def __init__(self, max_seconds: float = 60.0, interval_ms: float = 5.0):
+        self.max_seconds = max_seconds
+        self.interval = interval_ms / 1000
+        self.running = False
+
+    async def capture(self, seconds: float, start_model: Optional[Callable[[], None]] = None,
+                      stop_model: Optional[Callable[[], Dict[str, bytes]]] = None,
+                      notes: Optional[List[str]] = None) -> Dict[str, bytes]:
+        """采集 seconds 秒，返回 文件名 -> 内容；start_model/stop_model 开关模型侧的 torch profiler，
+        notes 写入 profile.json（如模型 trace 缺失的原因）"""
+        if self.running:
+            raise ProfileBusy("已有剖析在进行，请稍后再试")
+        seconds = min(max(seconds, 0.1), self.max_seconds)
+        self.running = True
+        sampler = StackSampler(self.interval)
+        t_start = time.time()
+        try:
+            sampler.start()
+            if start_model is not None:
+                await asyncio.to_thread(start_model)
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                sampler.stop()
+                model_files = await asyncio.to_thread(stop_model) if stop_model is not None else {}
+        finally:
+            self.running = False
+
+        files = {"python.collapsed": sampler.collapsed().encode("utf-8")}
+        files.update(model_files or {})
+        files["profile.json"] = json.dumps({
+            "started_at": t_start,
+            "seconds": seconds,
+            "interval_ms": self.interval * 1000,
+            "samples": sampler.samples,
+            "files": sorted(files),
+            "notes": notes or [],
+        }, ensure_ascii=False, indent=2).encode("utf-8")
+        return files
+
+
+def bundle(files: Dict[str, bytes]) -> bytes:
+    """打包为 zip 供下载"""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
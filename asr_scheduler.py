@@ -0,0 +1,316 @@
+"""
+MindVoice 推理调度器
+按优先级类别（interactive / bulk）和客户端截止时间调度转录请求：
+- interactive 永远优先于 bulk；同类别内带截止时间的请求按截止时间先行（EDF），
+  其余按客户端公平份额（见 asr_fairshare）和到达顺序
+- 长 bulk 音频在静音处切成若干段分别排队，段与段之间交互请求可以插队
+- bulk 最多占用部分推理槽位，给交互请求预留算力
+- 预计无法在截止时间前完成的请求直接拒绝，而不是排队后超时
+"""
+
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from asr_fairshare import FairShare
+from asr_tracing import Captured, activate, capture, record_span, span
+
+logger = logging.getLogger("MindVoice-ASR")
+
+PRIORITY_CLASSES = {"interactive": 0, "bulk": 1}
+
+
+class DeadlineExceeded(Exception):
+    """请求预计无法在客户端给定的截止时间前完成"""
+
+
+@dataclass(order=True)
+class _Job:
+    sort_key: tuple
+    audio: Any = field(compare=False)
+    language: Optional[str] = field(compare=False)
+    prompt: Optional[str] = field(compare=False)
+    priority: str = field(compare=False)
+    deadline: Optional[float] = field(compare=False)
+    duration: float = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    client: Optional[str] = field(default=None, compare=False)
+    cost: float = field(default=0.0, compare=False)
+    tag: float = field(default=0.0, compare=False)
+    traced: Captured = field(default_factory=capture, compare=False)
+    # 非空时槽位执行它而不是 execute（如占用一个 bulk 槽位跑整批转录）
+    run: Optional[Callable[[], Awaitable[Any]]] = field(default=None, compare=False)
+    enqueued: float = field(default_factory=time.perf_counter, compare=False)
+
+
+def split_on_silence(audio: np.ndarray, chunk_samples: int, search_samples: int,
+                     frame_samples: int = 320) -> List[np.ndarray]:
+    """把长音频切成不超过 chunk_samples 的段，切点选在每段末尾 search_samples 范围内能量最低的帧"""
+    chunks, start = [], 0
+    while len(audio) - start > chunk_samples:
+        window_end = start + chunk_samples
+        window_start = max(start + frame_samples, window_end - search_samples)
+        window = audio[window_start:window_end]
+        num_frames = len(window) // frame_samples
+        if num_frames > 0:
+            frames = window[:num_frames * frame_samples].reshape(num_frames, frame_samples)
+            quietest = int(np.argmin(np.mean(frames ** 2, axis=1)))
+            cut = window_start + quietest * frame_samples + frame_samples // 2
+        else:
+            cut = window_end
+        chunks.append(audio[start:cut])
+        start = cut
+    chunks.append(audio[start:])
+    return chunks
+
+
+def join_texts(texts: List[str]) -> str:
+    """拼接分段结果：两侧都是拉丁字母/数字时补空格，中日韩文本直接相连"""
+    joined = ""
+    for text in (t.strip() for t in texts):
+        if not text:
+            continue
+        if joined and joined[-1].isascii() and joined[-1].isalnum() and text[0].isascii() and text[0].isalnum():
+            joined += " "
+        elif joined and joined[-1] in ",.!?;:" and text[0].isascii():
+            joined += " "
+        joined += text
+    return joined
+
+
+class Scheduler:
+    """在固定数量的推理槽位上按优先级/截止时间分发转录任务"""
+
+    def __init__(self, execute: Callable[..., Awaitable[Any]], concurrency: int = 1,
+                 bulk_concurrency: Optional[int] = None, bulk_chunk_sec: float = 30.0,
+                 interactive_max_sec: float = 60.0, interactive_cap_sec: Optional[float] = 300.0,
+                 sample_rate: int = 16000, fairness: Optional[FairShare] = None):
+        self.execute = execute
+        self.concurrency = max(1, concurrency)
+        # 默认给交互请求预留一个槽位；只有一个槽位时 bulk 也只能用它
+        self.bulk_concurrency = bulk_concurrency or max(1, self.concurrency - 1)
+        self.bulk_chunk_sec = bulk_chunk_sec
+        self.interactive_max_sec = interactive_max_sec
+        # 客户端自行声明 interactive 时的时长上限，超出（或时长未知）按 bulk 处理，避免长音频冒充交互请求
+        self.interactive_cap_sec = interactive_cap_sec
+        self.sample_rate = sample_rate
+        # 按客户端的公平排队与限额；为 None 时同类别内只按截止时间和到达顺序
+        self.fairness = fairness
+
+        self._heap: List[_Job] = []
+        self._seq = itertools.count()
+        self._cond: Optional[asyncio.Condition] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running = {name: 0 for name in PRIORITY_CLASSES}
+        self._queued_sec = {name: 0.0 for name in PRIORITY_CLASSES}
+        self._latencies = {name: deque(maxlen=500) for name in PRIORITY_CLASSES}
+        self._shed = {name: 0 for name in PRIORITY_CLASSES}
+        # 推理耗时 / 音频时长 的滑动估计，用于截止时间判断
+        self._rtf = 0.3
+        self._overhead = 0.1
+
+    def start(self):
+        self._cond = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._slot()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def classify(self, duration: Optional[float], priority: Optional[str]) -> str:
+        """duration 为 None 表示时长未知（以文件路径提交的音频），按 bulk 处理。
+        未指定优先级时不超过 interactive_max_sec 的音频视为交互请求；
+        声明为 interactive 的音频超过 interactive_cap_sec 时降为 bulk"""
+        if priority == "bulk":
+            return priority
+        if duration is None:
+            return "bulk"
+        if priority == "interactive":
+            return "bulk" if self.interactive_cap_sec and duration > self.interactive_cap_sec else priority
+        return "interactive" if duration <= self.interactive_max_sec else "bulk"
+
+    def will_split(self, audio, priority: Optional[str] = None) -> bool:
+        """submit 是否会把这条音频切成多段调度（切分后各段各自提取特征，整段预先提取的特征用不上）"""
+        if not isinstance(audio, np.ndarray):
+            return False
+        duration = len(audio) / self.sample_rate
+        return self.classify(duration, priority) == "bulk" and duration > self.bulk_chunk_sec
+
+    def estimate(self, duration: float) -> float:
+        return self._overhead + self._rtf * duration
+
+    async def submit(self, audio, language: Optional[str] = None, prompt: Optional[str] = None,
+                     priority: Optional[str] = None, deadline_ms: Optional[float] = None,
+                     client: Optional[str] = None):
+        """提交一次转录并等待结果；deadline_ms 为从现在起的时间预算。
+        client 为请求所属客户端，超出其额度时抛出 RateLimited"""
+        known = isinstance(audio, np.ndarray)
+        requested = priority
+        priority = self.classify(len(audio) / self.sample_rate if known else None, priority)
+        duration = len(audio) / self.sample_rate if known else 0.0
+        if requested == "interactive" and priority != "interactive":
+            logger.info(f"声明为 interactive 的请求按 bulk 调度（时长 {f'{duration:.1f}s' if known else '未知'}）")
+        deadline = time.monotonic() + deadline_ms / 1000 if deadline_ms else None
+        t_submit = time.monotonic()
+
+        if deadline is not None:
+            # 排在前面的同级及更高优先级工作量，平摊到可用槽位
+            ahead = sum(sec for name, sec in self._queued_sec.items()
+                        if PRIORITY_CLASSES[name] <= PRIORITY_CLASSES[priority])
+            slots = self.concurrency if priority == "interactive" else self.bulk_concurrency
+            if t_submit + self._rtf * ahead / slots + self.estimate(duration) > deadline:
+                self._shed[priority] += 1
+                raise DeadlineExceeded(f"预计无法在 {deadline_ms:.0f}ms 内完成")
+
+        if self.will_split(audio, priority):
+            chunks = split_on_silence(
+                audio,
+                int(self.bulk_chunk_sec * self.sample_rate),
+                int(min(5.0, self.bulk_chunk_sec / 4) * self.sample_rate),
+            )
+            logger.info(f"bulk 请求 {duration:.1f}s 切分为 {len(chunks)} 段调度")
+        else:
+            chunks = [audio]
+
+        # 准入检查按整条音频计费，通过后代价按时长分摊到各分段
+        cost = self.fairness.admit(client, duration) if self.fairness is not None else 0.0
+        futures = [
+            self._enqueue(chunk, language, prompt, priority, deadline, client,
+                          cost * len(chunk) / len(audio) if len(chunks) > 1 else cost)
+            for chunk in chunks
+        ]
+        async with self._cond:
+            self._cond.notify_all()
+
+        try:
+            results = await asyncio.gather(*futures)
+        finally:
+            for future in futures:
+                future.cancel()
+        self._latencies[priority].append(time.monotonic() - t_submit)
+
+        if len(results) == 1:
+            return results[0]
+        merged = results[0]
+        merged.text = join_texts([r.text for r in results])
+        return merged
+
+    async def run_bulk(self, run: Callable[[], Awaitable[Any]], duration: float, client: Optional[str] = None,
+                       cost: float = 0.0):
+        """占用一个 bulk 槽位执行 run（如多文件的整批转录）并返回其结果：
+        与其他 bulk 工作一起受 bulk_concurrency 限制，排队时交互请求照常优先。
+        duration 为这批音频的总时长，cost 为准入时分摊到这批的额度，执行完由调度器归还"""
+        future = self._enqueue(None, None, None, "bulk", None, client, cost, run=run, duration=duration)
+        async with self._cond:
+            self._cond.notify_all()
+        try:
+            return await future
+        finally:
+            future.cancel()
+
+    def _enqueue(self, audio, language, prompt, priority, deadline, client=None, cost=0.0, run=None,
+                 duration=None) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        if duration is None:
+            duration = len(audio) / self.sample_rate if isinstance(audio, np.ndarray) else 0.0
+        tag = self.fairness.tag(client, cost) if self.fairness is not None else 0.0
+        # 截止时间排在公平标签之前：有截止时间的请求不会输给别的客户端没有截止时间、只是标签更小的请求
+        sort_key = (PRIORITY_CLASSES[priority], deadline if deadline is not None else float("inf"), tag, next(self._seq))
+        heapq.heappush(self._heap, _Job(sort_key, audio, language, prompt, priority, deadline, duration, future,
+                                        client, cost, tag, run=run))
+        self._queued_sec[priority] += duration
+        return future
+
+    def _dispatchable(self) -> bool:
+        if not self._heap:
+            return False
+        top = self._heap[0]
+        # 堆按类别排序：堆顶是 bulk 说明没有交互请求在等
+        return top.priority != "bulk" or self._running["bulk"] < self.bulk_concurrency
+
+    async def _slot(self):
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(self._dispatchable)
+                job = heapq.heappop(self._heap)
+                self._queued_sec[job.priority] -= job.duration
+                if job.future.done():
+                    self._release(job, served=False)
+                    continue
+                if job.deadline is not None and time.monotonic() + self.estimate(job.duration) > job.deadline:
+                    self._shed[job.priority] += 1
+                    job.future.set_exception(DeadlineExceeded("排队期间已错过截止时间"))
+                    self._release(job, served=False)
+                    continue
+                self._running[job.priority] += 1
+                if self.fairness is not None:
+                    self.fairness.dispatched(job.tag)
+
+            t_start = time.monotonic()
+            record_span("scheduler.queue", job.enqueued, at=job.traced, priority=job.priority)
+            try:
+                with activate(job.traced), span("scheduler.execute", priority=job.priority,
+                                                audio_sec=round(job.duration, 2)):
+                    if job.run is not None:
+                        result = await job.run()
+                    else:
+                        result = await self.execute(job.audio, job.language, job.prompt)
+                if not job.future.done():
+                    job.future.set_result(result)
+                # 整批执行的耗时不代表单条请求的实时率，不计入估计
+                if job.run is None:
+                    self._observe(job.duration, time.monotonic() - t_start)
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self._release(job, served=True)
+                async with self._cond:
+                    self._running[job.priority] -= 1
+                    self._cond.notify_all()
+
+    def _release(self, job: _Job, served: bool):
+        if self.fairness is not None:
+            self.fairness.release(job.client, job.cost, served=served)
+
+    def _observe(self, duration: float, elapsed: float):
+        if duration >= 1.0:
+            self._rtf = 0.8 * self._rtf + 0.2 * (elapsed / duration)
+        else:
+            self._overhead = 0.8 * self._overhead + 0.2 * elapsed
+
+    def status(self) -> Dict[str, Any]:
+        def percentile(values, q):
+            if not values:
+                return None
+            return round(float(np.percentile(list(values), q)) * 1000, 1)
+
+        queued = {name: 0 for name in PRIORITY_CLASSES}
+        for job in self._heap:
+            queued[job.priority] += 1
+        status = {
+            "slots": self.concurrency,
+            "bulk_slots": self.bulk_concurrency,
+            "rtf_estimate": round(self._rtf, 3),
+            "classes": {
+                name: {
+                    "queued": queued[name],
+                    "running": self._running[name],
+                    "shed": self._shed[name],
+                    "p50_ms": percentile(self._latencies[name], 50),
+                    "p99_ms": percentile(self._latencies[name], 99),
+                }
+                for name in PRIORITY_CLASSES
+            },
+        }
+        if self.fairness is not None:
+            status["fairness"] = self.fairness.status()
+        return status
@@ -0,0 +1,135 @@
+"""
+MindVoice 快速加载快照
+from_pretrained 每次启动都要读取 HF 格式权重、转换 dtype、映射设备并重建分词器/特征提取器。
+快照把已加载好的模型一次性落盘：
+- 参数按目标 dtype（可选 int8 动态量化）写入单个 safetensors，加载时只读 mmap，零拷贝
+- 模型结构、分词器、特征提取器等其余对象状态 pickle 保存，参数在 pickle 中只留名字引用
+快照与 torch/transformers 版本和源模型指纹绑定，任一变化时自动失效，回退到 from_pretrained。
+"""
+
+import os
+import io
+import json
+import pickle
+import shutil
+import logging
+from typing import Any, Dict, Optional
+
+import torch
+
+from asr_weights import open_shared_tensors, save_shared_weights
+
+logger = logging.getLogger("MindVoice-ASR")
+
+SNAPSHOT_FORMAT = 1
+WEIGHTS_NAME = "weights.safetensors"
+STATE_NAME = "state.pkl"
+META_NAME = "snapshot.json"
+
+
+def snapshot_meta(source: str, dtype: torch.dtype, device: str, quantize: Optional[str]) -> dict:
+    """快照的适用条件；加载时逐项比对，不一致即视为失效"""
+    import transformers
+
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "source": source,
+        "dtype": str(dtype).replace("torch.", ""),
+        "device": device,
+        "quantize": quantize,
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+    }
+
+
+class _SnapshotPickler(pickle.Pickler):
+    """参数不进 pickle，只记录它在权重文件中的名字"""
+
+    def __init__(self, file, param_names: Dict[int, str]):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.param_names = param_names
+
+    def persistent_id(self, obj):
+        if isinstance(obj, torch.nn.Parameter):
+            name = self.param_names.get(id(obj))
+            if name is not None:
+                return ("weight", name)
+        return None
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    def __init__(self, file, tensors: Dict[str, torch.Tensor], device: str):
+        super().__init__(file)
+        self.tensors = tensors
+        self.device = device
+        self.params: Dict[str, torch.nn.Parameter] = {}
+
+    def persistent_load(self, pid):
+        kind, name = pid
+        if kind != "weight":
+            raise pickle.UnpicklingError(f"未知的快照引用: {pid}")
+        # 同名引用返回同一个 Parameter，保持 tie_weights 的共享关系
+        if name not in self.params:
+            tensor = self.tensors[name]
+            if self.device != "cpu":
+                tensor = tensor.to(self.device)
+            self.params[name] = torch.nn.Parameter(tensor, requires_grad=False)
+        return self.params[name]
+
+
+def quantize_int8(module: torch.nn.Module) -> torch.nn.Module:
+    """CPU 上对 Linear 层做 int8 动态量化（原地替换）"""
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def save_snapshot(state: Dict[str, Any], module: torch.nn.Module, snapshot_dir: str, meta: dict):
+    """写出快照：module 的参数进 safetensors，state 中的对象（含 module 本身）pickle 保存"""
+    tmp_dir = f"{snapshot_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    save_shared_weights(module, os.path.join(tmp_dir, WEIGHTS_NAME))
+    param_names = {id(param): name for name, param in module.named_parameters()}
+
+    # 运行期挂在实例上的包装（编码器缓存、torch.compile、置信度统计）不属于快照内容，序列化时临时摘下
+    overrides = {}
+    for submodule in module.modules():
+        saved = {key: submodule.__dict__.pop(key) for key in ("forward", "generate", "_mindvoice_compiled") if key in submodule.__dict__}
+        if saved:
+            overrides[submodule] = saved
+    buffer = io.BytesIO()
+    try:
+        _SnapshotPickler(buffer, param_names).dump(state)
+    finally:
+        for submodule, saved in overrides.items():
+            submodule.__dict__.update(saved)
+    with open(os.path.join(tmp_dir, STATE_NAME), "wb") as f:
+        f.write(buffer.getvalue())
+    with open(os.path.join(tmp_dir, META_NAME), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    # 整个目录写完再替换，半成品快照不会被加载
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    os.replace(tmp_dir, snapshot_dir)
+    logger.info(f"快照已写入: {snapshot_dir} (对象状态 {len(buffer.getvalue()) / 1024 ** 2:.1f}MB)")
+
+
+def load_snapshot(snapshot_dir: str, meta: dict) -> Optional[Dict[str, Any]]:
+    """加载快照；不存在或与当前环境不匹配时返回 None"""
+    meta_path = os.path.join(snapshot_dir, META_NAME)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        saved = json.load(f)
+    stale = [key for key in meta if saved.get(key) != meta[key]]
+    if stale:
+        logger.info(f"快照已失效 ({', '.join(stale)} 不匹配)，改用原始模型: {snapshot_dir}")
+        return None
+
+    try:
+        tensors = open_shared_tensors(os.path.join(snapshot_dir, WEIGHTS_NAME))
+        with open(os.path.join(snapshot_dir, STATE_NAME), "rb") as f:
+            return _SnapshotUnpickler(f, tensors, meta["device"]).load()
+    except Exception as e:
+        logger.warning(f"快照加载失败，改用原始模型: {e}")
+        return None
@@ -0,0 +1,253 @@
+"""
+MindVoice 渐进式上传会话
+客户端边录边传音频分片，服务器在分片到达时就开始解码：
+- 编码格式（webm/ogg 等）送入常驻 ffmpeg 进程的 stdin，后台线程持续读出 16kHz PCM
+- pcm_f32le 分片（16kHz 单声道）直接追加
+结束会话时只剩最后一小段音频需要解码，随即进入推理。
+
+客户端在说话停顿处标记分段时，服务器可用 take_segment 切出已解码的音频提前转录，
+切点取解码末端附近能量最低处，结束时只需推理最后一段。
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+import tempfile
+import threading
+import subprocess
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("MindVoice-ASR")
+
+PCM_FORMATS = ("pcm_f32le", "f32le")
+# 乱序到达的分片最多领先当前序号这么多，防止一个大序号让 _pending 无限堆积
+MAX_SEQ_AHEAD = 256
+
+
+class StreamSession:
+    """一次渐进式上传：按序号重排分片，增量解码为 float32 PCM"""
+
+    def __init__(self, audio_format: str = "webm", language: Optional[str] = None,
+                 prompt: Optional[str] = None, sample_rate: int = 16000, client: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.format = audio_format
+        self.language = language
+        self.prompt = prompt
+        # 会话所属客户端，分段转录按它公平排队与计费
+        self.client = client
+        self.sample_rate = sample_rate
+        self.created = time.time()
+        self.last_active = self.created
+        self.bytes_received = 0
+
+        self._next_seq = 0
+        self._pending: Dict[int, bytes] = {}
+        self._pcm = bytearray()
+        self._lock = threading.Lock()
+        self._append_lock = threading.Lock()
+        self._closed = False
+
+        # 推测转录：segment_offset 之前的音频已切分提交，segments 由服务器记录 (start, end, task)
+        self.segment_offset = 0
+        self.segments: List[tuple] = []
+
+        self._process = None
+        self._reader = None
+        self._raw_file = None
+        if self.format not in PCM_FORMATS:
+            # 原始字节同时落一份临时文件，流式解码失败时可整体重解
+            self._raw_file = tempfile.NamedTemporaryFile(delete=False, suffix=f".{self.format}")
+            self._process = subprocess.Popen([
+                "ffmpeg", "-loglevel", "error",
+                "-probesize", "4096", "-analyzeduration", "0",
+                "-i", "pipe:0",
+                "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "pipe:1",
+            ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            self._reader = threading.Thread(target=self._read_pcm, daemon=True, name=f"stream-{self.id[:8]}")
+            self._reader.start()
+
+    def _read_pcm(self):
+        while True:
+            data = self._process.stdout.read(8192)
+            if not data:
+                break
+            with self._lock:
+                self._pcm += data
+
+    @property
+    def _sample_width(self) -> int:
+        return 4 if self.format in PCM_FORMATS else 2
+
+    def _to_float(self, data: bytes) -> np.ndarray:
+        if self.format in PCM_FORMATS:
+            return np.frombuffer(data, dtype=np.float32)
+        return np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+
+    @property
+    def decoded_seconds(self) -> float:
+        return len(self._pcm) / self._sample_width / self.sample_rate
+
+    async def settle(self, timeout: float = 0.3, poll: float = 0.02):
+        """等待 ffmpeg 追上已送入的分片：解码输出连续两次轮询不再增长，或超时"""
+        if self.format in PCM_FORMATS:
+            return
+        deadline = time.monotonic() + timeout
+        last, stable = -1, 0
+        while time.monotonic() < deadline and stable < 2:
+            await asyncio.sleep(poll)
+            size = len(self._pcm)
+            stable = stable + 1 if size == last else 0
+            last = size
+
+    def take_segment(self, min_samples: int = 1, search_samples: int = 0) -> Optional[Tuple[int, np.ndarray]]:
+        """切出上次切分以来已解码的音频，返回 (起始采样点, 音频)；不足 min_samples 时留给下一段。
+        search_samples > 0 时在已解码部分的末尾这么长的范围内找能量最低的 20ms 帧作为切点，
+        编码格式的解码进度可能落后于客户端标记的停顿，直接切在解码末端容易切在字中间。
+        会话已开始结束后不再切分，尾音完整留给 finish。"""
+        width = self._sample_width
+        with self._lock:
+            if self._closed:
+                return None
+            end = len(self._pcm) // width
+            if end - self.segment_offset < max(min_samples, 1):
+                return None
+            data = bytes(self._pcm[self.segment_offset * width:end * width])
+        audio = self._to_float(data)
+
+        frame = self.sample_rate // 50
+        window_start = max(min_samples, len(audio) - search_samples)
+        if search_samples > 0 and len(audio) - window_start >= frame:
+            frames = audio[window_start:window_start + (len(audio) - window_start) // frame * frame].reshape(-1, frame)
+            quietest = int(np.argmin(np.mean(frames ** 2, axis=1)))
+            audio = audio[:window_start + quietest * frame + frame // 2]
+
+        start = self.segment_offset
+        self.segment_offset = start + len(audio)
+        return start, audio
+
+    def append(self, seq: Optional[int], data: bytes):
+        """追加一个分片；seq 为空时按到达顺序处理，重复的序号会被忽略"""
+        with self._append_lock:
+            if self._closed:
+                raise RuntimeError("会话已结束")
+            self.last_active = time.time()
+            seq = self._next_seq if seq is None else seq
+            if seq < self._next_seq:
+                return
+            if seq >= self._next_seq + MAX_SEQ_AHEAD:
+                raise RuntimeError(f"分片序号 {seq} 超前过多（当前等待 {self._next_seq}）")
+            self._pending[seq] = data
+
+            while self._next_seq in self._pending:
+                chunk = self._pending.pop(self._next_seq)
+                self._next_seq += 1
+                self.bytes_received += len(chunk)
+                self._feed(chunk)
+
+    def _feed(self, chunk: bytes):
+        if self.format in PCM_FORMATS:
+            with self._lock:
+                self._pcm += chunk
+            return
+
+        self._raw_file.write(chunk)
+        try:
+            self._process.stdin.write(chunk)
+            self._process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            logger.warning(f"流式解码中断，将在结束时整体重解: {e}")
+
+    def finish(self, decode_fn: Callable[[str], np.ndarray]) -> np.ndarray:
+        """结束上传，等待解码收尾并返回完整 PCM；无论成败都会回收 ffmpeg 进程和临时文件"""
+        try:
+            with self._append_lock, self._lock:
+                self._closed = True
+                if self._pending:
+                    raise RuntimeError(f"分片不连续，缺少序号 {self._next_seq}")
+
+            if self.format in PCM_FORMATS:
+                return self._to_float(bytes(self._pcm))
+
+            self._raw_file.close()
+            try:
+                self._process.stdin.close()
+            except OSError:
+                pass
+            self._process.wait(timeout=30)
+            self._reader.join(timeout=5)
+
+            if self._process.returncode == 0 and self._pcm:
+                return self._to_float(bytes(self._pcm))
+            logger.warning(f"流式解码失败 (code {self._process.returncode})，改为整体解码")
+            return decode_fn(self._raw_file.name)
+        finally:
+            self.abort()
+
+    def abort(self):
+        self._closed = True
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        if self._raw_file is not None:
+            self._raw_file.close()
+            if os.path.exists(self._raw_file.name):
+                os.unlink(self._raw_file.name)
+
+
+class SessionRegistry:
+    """进行中的上传会话；长时间无活动的会话由后台定时回收"""
+
+    def __init__(self, idle_timeout: float = 300.0, check_interval: float = 30.0):
+        self.idle_timeout = idle_timeout
+        self.check_interval = min(check_interval, idle_timeout)
+        self._sessions: Dict[str, StreamSession] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        for session_id in list(self._sessions):
+            await asyncio.to_thread(self._sessions.pop(session_id).abort)
+
+    def create(self, **kwargs) -> StreamSession:
+        session = StreamSession(**kwargs)
+        self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id: str) -> Optional[StreamSession]:
+        return self._sessions.get(session_id)
+
+    def pop(self, session_id: str) -> Optional[StreamSession]:
+        return self._sessions.pop(session_id, None)
+
+    def expire(self) -> List[StreamSession]:
+        """摘除空闲超时的会话并返回，由调用方中止"""
+        now = time.time()
+        expired = []
+        for session_id, session in list(self._sessions.items()):
+            if now - session.last_active > self.idle_timeout:
+                logger.info(f"回收空闲上传会话 {session_id}")
+                expired.append(self._sessions.pop(session_id))
+        return expired
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for session in self.expire():
+                for _, _, task in session.segments:
+                    task.cancel()
+                try:
+                    await asyncio.to_thread(session.abort)
+                except Exception as e:
+                    logger.warning(f"回收上传会话 {session.id} 失败: {e}")
+
+    def __len__(self) -> int:
+        return len(self._sessions)
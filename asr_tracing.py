@@ -0,0 +1,233 @@
+"""
+MindVoice 请求追踪
+一次听写偶尔要 4 秒而不是 400ms 时，单行耗时统计分不清时间花在上传、ffmpeg 重试、排队还是生成上。
+- 每个请求分配一个 trace ID（响应头 X-Trace-Id 返回，客户端也可以自带）
+- 各阶段用嵌套的 span 计时，可附带属性（ffmpeg 策略、返回码、token 数等）
+- 当前 trace 经 contextvars 传递：asyncio.to_thread 会复制上下文，线程里的 span 自动挂到发起方下面；
+  流水线和调度器的常驻 worker 不继承请求的上下文，入队时用 capture 记下位置，处理时用 activate 切换回去
+- 保留最慢的 N 条与最近的若干条，供 /debug/traces 查看，可选逐条导出到本地 JSONL
+"""
+
+import json
+import time
+import uuid
+import heapq
+import logging
+import threading
+import itertools
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("MindVoice-ASR")
+
+TRACE_HEADER = "X-Trace-Id"
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("mindvoice_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("mindvoice_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "start", "end", "attrs", "children")
+
+    def __init__(self, name: str, start: Optional[float] = None, attrs: Optional[dict] = None):
+        self.name = name
+        self.start = time.perf_counter() if start is None else start
+        self.end: Optional[float] = None
+        self.attrs = attrs or {}
+        self.children: List["Span"] = []
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self, origin: float) -> dict:
+        end = self.end if self.end is not None else time.perf_counter()
+        data = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 2),
+            "duration_ms": round((end - self.start) * 1000, 2),
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in sorted(self.children, key=lambda s: s.start)]
+        return data
+
+
+class _NullSpan:
+    """没有进行中的 trace 时返回，调用方无需判断"""
+
+    def set(self, **attrs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    def __init__(self, name: str, trace_id: Optional[str] = None, **attrs):
+        self.id = trace_id or uuid.uuid4().hex[:16]
+        self.started_at = time.time()
+        self.root = Span(name, attrs=attrs)
+
+    @property
+    def duration(self) -> float:
+        end = self.root.end if self.root.end is not None else time.perf_counter()
+        return end - self.root.start
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.id,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 2),
+            **self.root.to_dict(self.root.start),
+        }
+
+
+# 入队时记下的 trace 位置：(trace, 当时所在的 span)
+Captured = Optional[Tuple[Trace, Optional[Span]]]
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def capture() -> Captured:
+    trace = _current_trace.get()
+    return (trace, _current_span.get()) if trace is not None else None
+
+
+@contextmanager
+def activate(captured: Captured) -> Iterator[None]:
+    """在常驻 worker 中切换回任务入队时的 trace 位置，之后的 span 挂在入队时所在的 span 下"""
+    trace, parent = captured if captured is not None else (None, None)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(parent)
+    try:
+        yield
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Span]:
+    """在当前 trace 中开一个子 span；不在 trace 中时什么也不记录"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield NULL_SPAN
+        return
+    parent = _current_span.get() or trace.root
+    child = Span(name, attrs=attrs)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def record_span(name: str, start: float, end: Optional[float] = None, at: Captured = None, **attrs):
+    """补记一个已经结束的区间（如排队等待），start/end 为 time.perf_counter() 读数；
+    at 为 capture() 的返回值，缺省时记在当前 span 下"""
+    trace, parent = at if at is not None else (_current_trace.get(), _current_span.get())
+    if trace is None:
+        return
+    child = Span(name, start=start, attrs=attrs)
+    child.end = time.perf_counter() if end is None else end
+    (parent or trace.root).children.append(child)
+
+
+def annotate(**attrs):
+    """给当前 span 加属性"""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attrs)
+
+
+async def trace_http(collector: "TraceCollector", request, call_next, **attrs):
+    """FastAPI http 中间件的主体：为请求开一个 trace，响应头带回 trace ID"""
+    trace = collector.begin(f"{request.method} {request.url.path}", request.headers.get(TRACE_HEADER), **attrs)
+    status_code = 500
+    try:
+        # call_next 在新任务中运行路由，任务创建时复制当前上下文，路由内的 span 都挂到这个 trace 上
+        with activate((trace, None)):
+            response = await call_next(request)
+        status_code = response.status_code
+        response.headers[TRACE_HEADER] = trace.id
+        return response
+    finally:
+        collector.finish(trace, status_code=status_code)
+
+
+class TraceCollector:
+    """保留最慢的 keep_slowest 条和最近的 keep_recent 条 trace，可选导出到 JSONL"""
+
+    def __init__(self, keep_slowest: int = 50, keep_recent: int = 200, export_path: Optional[str] = None,
+                 export_min_ms: float = 0):
+        self.keep_slowest = keep_slowest
+        self.export_path = export_path
+        self.export_min_ms = export_min_ms
+
+        self.finished = 0
+        self._slowest: List[tuple] = []
+        self._recent: deque = deque(maxlen=keep_recent)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+
+    def begin(self, name: str, trace_id: Optional[str] = None, **attrs) -> Trace:
+        # 客户端自带的 ID 只接受较短的可打印字符串
+        if trace_id and (len(trace_id) > 64 or not trace_id.isprintable()):
+            trace_id = None
+        return Trace(name, trace_id, **attrs)
+
+    def finish(self, trace: Trace, **attrs):
+        trace.root.end = time.perf_counter()
+        trace.root.set(**attrs)
+        with self._lock:
+            self.finished += 1
+            self._recent.append(trace)
+            entry = (trace.duration, next(self._seq), trace)
+            if len(self._slowest) < self.keep_slowest:
+                heapq.heappush(self._slowest, entry)
+            elif entry[0] > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+        if self.export_path and trace.duration * 1000 >= self.export_min_ms:
+            self._export(trace)
+
+    def _export(self, trace: Trace):
+        try:
+            line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+            with self._export_lock, open(self.export_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except Exception as e:
+            logger.warning(f"trace 导出失败: {e}")
+
+    def slowest(self, limit: Optional[int] = None) -> List[dict]:
+        with self._lock:
+            traces = [trace for _, _, trace in sorted(self._slowest, reverse=True)]
+        return [trace.to_dict() for trace in traces[:limit]]
+
+    def get(self, trace_id: str) -> Optional[dict]:
+        with self._lock:
+            candidates = list(self._recent) + [trace for _, _, trace in self._slowest]
+        for trace in candidates:
+            if trace.id == trace_id:
+                return trace.to_dict()
+        return None
+
+    def status(self) -> Dict[str, object]:
+        with self._lock:
+            slowest_ms = round(max(self._slowest)[0] * 1000, 1) if self._slowest else None
+        return {
+            "finished": self.finished,
+            "keep_slowest": self.keep_slowest,
+            "slowest_ms": slowest_ms,
+            "export_path": self.export_path,
+        }
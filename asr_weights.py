@@ -0,0 +1,161 @@
+"""
+MindVoice 共享模型权重
+把已加载模型的参数导出为目标 dtype 的 safetensors 文件，再以只读 mmap 方式挂回模型。
+多个 worker 进程映射同一个文件时，权重只在页缓存中保留一份物理内存。
+"""
+
+import os
+import json
+import mmap
+import struct
+import hashlib
+import logging
+import warnings
+from typing import Dict, Optional
+
+import torch
+
+logger = logging.getLogger("MindVoice-ASR")
+
+# safetensors dtype 标识与 torch dtype 的对应关系
+_DTYPES = {
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "F64": torch.float64,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+_DTYPE_NAMES = {v: k for k, v in _DTYPES.items()}
+
+
+def source_fingerprint(model_path: str) -> str:
+    """根据模型目录中权重/配置文件的大小与修改时间生成指纹，源模型变化时缓存自动失效"""
+    digest = hashlib.sha1(os.path.abspath(model_path).encode("utf-8"))
+    if os.path.isdir(model_path):
+        for name in sorted(os.listdir(model_path)):
+            if name.endswith((".safetensors", ".bin", ".json")):
+                stat = os.stat(os.path.join(model_path, name))
+                digest.update(f"{name}:{stat.st_size}:{int(stat.st_mtime)}".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def save_shared_weights(module: torch.nn.Module, path: str):
+    """把模块参数按 safetensors 格式写入单个文件（先写临时文件再原子替换）"""
+    tensors = {
+        name: param.detach().to("cpu").contiguous()
+        for name, param in module.named_parameters()
+    }
+
+    header, offset = {}, 0
+    for name, tensor in tensors.items():
+        nbytes = tensor.numel() * tensor.element_size()
+        header[name] = {
+            "dtype": _DTYPE_NAMES[tensor.dtype],
+            "shape": list(tensor.shape),
+            "data_offsets": [offset, offset + nbytes],
+        }
+        offset += nbytes
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    # 头部补齐到 8 字节，保证各张量数据按 dtype 对齐
+    header_bytes += b" " * (-len(header_bytes) % 8)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for tensor in tensors.values():
+            f.write(tensor.view(-1).view(torch.uint8).numpy().tobytes())
+    os.replace(tmp_path, path)
+    logger.info(f"共享权重已写入: {path} ({offset / 1024 ** 2:.0f}MB)")
+
+
+def open_shared_tensors(path: str) -> Dict[str, torch.Tensor]:
+    """以只读 mmap 打开 safetensors 文件，返回零拷贝的张量视图"""
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    header_len = struct.unpack("<Q", buffer[:8])[0]
+    header = json.loads(buffer[8:8 + header_len])
+    data_start = 8 + header_len
+
+    tensors = {}
+    with warnings.catch_warnings():
+        # 只读映射本身就是目的，torch 对不可写 buffer 的警告可以忽略
+        warnings.simplefilter("ignore", UserWarning)
+        for name, info in header.items():
+            if name == "__metadata__":
+                continue
+            dtype = _DTYPES[info["dtype"]]
+            start, end = info["data_offsets"]
+            count = (end - start) // torch.empty((), dtype=dtype).element_size()
+            if count == 0:
+                tensors[name] = torch.empty(info["shape"], dtype=dtype)
+                continue
+            tensor = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + start)
+            tensors[name] = tensor.view(info["shape"])
+    return tensors
+
+
+def attach_shared_weights(module: torch.nn.Module, path: str) -> int:
+    """把模块中的参数替换为 mmap 张量，释放进程私有的权重副本；返回挂载的字节数"""
+    tensors = open_shared_tensors(path)
+
+    replaced = {}
+    for name, param in module.named_parameters():
+        shared = tensors.get(name)
+        if shared is None or shared.shape != param.shape or shared.dtype != param.dtype:
+            raise ValueError(f"共享权重与模型不匹配: {name}")
+        replaced[id(param)] = torch.nn.Parameter(shared, requires_grad=False)
+
+    # 按对象替换，保证 tie_weights 共享的参数仍指向同一份数据
+    for submodule in module.modules():
+        for key, param in list(submodule._parameters.items()):
+            if param is not None and id(param) in replaced:
+                submodule._parameters[key] = replaced[id(param)]
+
+    return sum(p.numel() * p.element_size() for p in module.parameters())
+
+
+def share_model_weights(module: torch.nn.Module, cache_path: str) -> bool:
+    """确保共享权重文件存在并挂载到模块上；GPU 模型无法共享，直接跳过"""
+    if any(p.device.type != "cpu" for p in module.parameters()):
+        logger.info("模型不在 CPU 上，跳过共享权重")
+        return False
+
+    if not os.path.exists(cache_path):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        save_shared_weights(module, cache_path)
+
+    nbytes = attach_shared_weights(module, cache_path)
+    logger.info(f"已挂载共享权重 {nbytes / 1024 ** 2:.0f}MB: {cache_path}")
+    return True
+
+
+def memory_usage() -> Optional[dict]:
+    """当前进程的内存占用（MB）：Linux 上给出 RSS/PSS/共享页，其他平台退化为 psutil 的 RSS"""
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+        return {
+            "rss_mb": round(fields.get("Rss", 0), 1),
+            "pss_mb": round(fields.get("Pss", 0), 1),
+            "shared_mb": round(fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0), 1),
+        }
+    except OSError:
+        pass
+
+    try:
+        import psutil
+        return {"rss_mb": round(psutil.Process().memory_info().rss / 1024 ** 2, 1)}
+    except ImportError:
+        return None
@@ -0,0 +1,345 @@
+"""
+MindVoice 多进程推理 Worker 池
+前端 HTTP 进程只负责收包与解码，模型推理分发到 N 个常驻 worker 进程，
+每个 worker 绑定一组 CPU 核心并独占自己的 torch 线程池。
+音频通过共享内存传递，避免在进程间序列化大块 PCM 数据。
+"""
+
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+import itertools
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger("MindVoice-ASR")
+
+# worker 连续异常退出时重启间隔按 2 的幂增长，最长不超过这个秒数
+MAX_RESTART_BACKOFF_SEC = 60.0
+
+
+def get_available_cores() -> List[int]:
+    """获取当前进程可用的 CPU 核心列表"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def partition_cores(num_workers: int, cores: Optional[List[int]] = None) -> List[List[int]]:
+    """把核心均分为 num_workers 份连续区间，余数分给前面的 worker"""
+    cores = cores if cores is not None else get_available_cores()
+    num_workers = max(1, min(num_workers, len(cores)))
+    base, extra = divmod(len(cores), num_workers)
+    groups, start = [], 0
+    for i in range(num_workers):
+        size = base + (1 if i < extra else 0)
+        groups.append(cores[start:start + size])
+        start += size
+    return groups
+
+
+def pin_current_process(cores: List[int]):
+    """将当前进程绑定到指定核心，并让 torch/OpenMP 线程数与之匹配"""
+    try:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+        else:
+            import psutil
+            psutil.Process().cpu_affinity(cores)
+    except ImportError:
+        logger.warning("当前平台需要 psutil 才能绑定 CPU 核心，已跳过")
+    except Exception as e:
+        logger.warning(f"绑定 CPU 核心失败: {e}")
+
+    import torch
+    torch.set_num_threads(len(cores))
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # interop 线程池只能在首次并行操作前设置
+        pass
+
+
+def _worker_main(index: int, cores: List[int], model_factory: Callable, config: dict,
+                 request_queue, response_queue, post_load: Optional[Callable] = None, load_lock=None):
+    """worker 进程入口：绑核、加载模型，然后循环处理请求"""
+    from asr_decoding import generated_tokens
+    from asr_weights import memory_usage
+
+    pin_current_process(cores)
+    logger.info(f"[worker {index}] 绑定核心 {cores[0]}-{cores[-1]}，线程数 {len(cores)}")
+
+    # 共享权重模式下逐个加载：第一个 worker 写出共享文件，其余直接映射，避免 N 份加载峰值叠加
+    if load_lock is not None:
+        load_lock.acquire()
+    try:
+        model = model_factory(config)
+        model.load()
+        if post_load is not None:
+            post_load(model)
+    finally:
+        if load_lock is not None:
+            load_lock.release()
+    response_queue.put(("ready", index, memory_usage()))
+
+    while True:
+        item = request_queue.get()
+        if item is None:
+            break
+
+        request_id, audio_ref, language, prompt = item
+        response_queue.put(("started", index, request_id))
+        shm = None
+        try:
+            if isinstance(audio_ref, tuple):
+                shm_name, num_samples = audio_ref
+                shm = shared_memory.SharedMemory(name=shm_name)
+                audio = np.ndarray((num_samples,), dtype=np.float32, buffer=shm.buf)
+            else:
+                audio = audio_ref
+
+            t_start = time.time()
+            # 进程内只有这一个调用方，可以直接包装模型的 generate 计数
+            with generated_tokens(model.torch_module()) as stats:
+                result = model.transcribe(audio, language=language, prompt=prompt)
+            payload = {
+                "text": result.text,
+                "language": result.language,
+                "tokens": stats["tokens"] if stats["calls"] else None,
+                "inference_ms": (time.time() - t_start) * 1000,
+                "worker": index,
+                "memory": memory_usage(),
+            }
+            del audio
+            response_queue.put(("result", request_id, payload))
+        except Exception as e:
+            logger.error(f"[worker {index}] 转录失败: {e}")
+            response_queue.put(("error", request_id, str(e)))
+        finally:
+            if shm is not None:
+                shm.close()
+
+
+class WorkerPool:
+    """管理 N 个模型 worker 进程，对前端提供 async 的 transcribe 接口。
+    worker 异常退出后按指数退避重启；连续 max_restarts 次都没能成功处理请求的 worker 不再重启，
+    全部 worker 都失效时整个池判为失败，新请求直接报错而不是排队"""
+
+    def __init__(self, num_workers: int, model_factory: Callable, config: dict,
+                 threads_per_worker: Optional[int] = None, post_load: Optional[Callable] = None,
+                 max_restarts: int = 5, restart_backoff_sec: float = 1.0):
+        cores = get_available_cores()
+        if threads_per_worker:
+            num_workers = max(1, min(num_workers, len(cores) // threads_per_worker))
+            cores = cores[:num_workers * threads_per_worker]
+        self.core_groups = partition_cores(num_workers, cores)
+        self.num_workers = len(self.core_groups)
+        self.model_factory = model_factory
+        self.config = config
+        self.post_load = post_load
+        self.max_restarts = max_restarts
+        self.restart_backoff_sec = restart_backoff_sec
+
+        self._ctx = mp.get_context("spawn")
+        self._load_lock = self._ctx.Lock() if post_load is not None else None
+        self._memory: Dict[int, dict] = {}
+        # 每个 worker 一条请求队列，由父进程分派：分派时即记下请求归属，worker 崩溃时能找出它手上的所有请求
+        self._request_queues = [self._ctx.Queue() for _ in range(self.num_workers)]
+        self._response_queue = self._ctx.Queue()
+        self._processes: List[Optional[mp.Process]] = [None] * self.num_workers
+        # 连续异常退出次数（成功返回一次结果后清零）、等待重启的时间点、已放弃重启的 worker
+        self._restarts: Dict[int, int] = {i: 0 for i in range(self.num_workers)}
+        self._respawn_at: Dict[int, float] = {}
+        self._failed = set()
+        self._ready = set()
+        self._inflight: Dict[int, int] = {}
+        self._assigned: Dict[int, set] = {i: set() for i in range(self.num_workers)}
+        self._owner: Dict[int, int] = {}
+        self._futures: Dict[int, asyncio.Future] = {}
+        self._shm: Dict[int, shared_memory.SharedMemory] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+
+    @property
+    def ready_workers(self) -> int:
+        return len(self._ready)
+
+    @property
+    def failed(self) -> bool:
+        return len(self._failed) == self.num_workers
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        for i in range(self.num_workers):
+            self._spawn(i)
+        threading.Thread(target=self._collect_responses, daemon=True, name="worker-responses").start()
+        threading.Thread(target=self._monitor, daemon=True, name="worker-monitor").start()
+        logger.info(f"已启动 {self.num_workers} 个推理 worker，核心分组: {[len(g) for g in self.core_groups]}")
+
+    def _spawn(self, index: int):
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(index, self.core_groups[index], self.model_factory, self.config,
+                  self._request_queues[index], self._response_queue, self.post_load, self._load_lock),
+            daemon=True,
+            name=f"asr-worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+
+    def stop(self):
+        self._stopping = True
+        for request_queue in self._request_queues:
+            request_queue.put(None)
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+        with self._lock:
+            for request_id in list(self._futures):
+                self._finish(request_id, error="worker 池已停止")
+
+    async def transcribe(self, audio, language: Optional[str] = None, prompt: Optional[str] = None) -> dict:
+        """提交一次转录；audio 为 float32 PCM 数组（走共享内存）或文件路径"""
+        if self.failed:
+            raise RuntimeError("worker 池已失效：所有 worker 均多次异常退出")
+        request_id = next(self._ids)
+        future = self._loop.create_future()
+
+        if isinstance(audio, np.ndarray):
+            audio = np.ascontiguousarray(audio, dtype=np.float32)
+            shm = shared_memory.SharedMemory(create=True, size=max(audio.nbytes, 1))
+            np.ndarray(audio.shape, dtype=np.float32, buffer=shm.buf)[:] = audio
+            audio_ref = (shm.name, audio.shape[0])
+        else:
+            shm = None
+            audio_ref = audio
+
+        with self._lock:
+            self._futures[request_id] = future
+            if shm is not None:
+                self._shm[request_id] = shm
+            candidates = [i for i in range(self.num_workers) if i not in self._failed]
+            if not candidates:
+                self._finish(request_id, error="worker 池已失效：所有 worker 均多次异常退出")
+                return await future
+            # 优先分给已就绪且手上请求最少的 worker，其次是正在加载的，等待重启的排在最后
+            index = min(candidates, key=lambda i: (i not in self._ready, self._processes[i] is None,
+                                                   len(self._assigned[i])))
+            self._assigned[index].add(request_id)
+            self._owner[request_id] = index
+            self._request_queues[index].put((request_id, audio_ref, language, prompt))
+        return await future
+
+    def _finish(self, request_id: int, payload: Optional[dict] = None, error: Optional[str] = None):
+        """在持锁状态下调用：释放共享内存并唤醒等待中的请求"""
+        index = self._owner.pop(request_id, None)
+        if index is not None:
+            self._assigned[index].discard(request_id)
+        shm = self._shm.pop(request_id, None)
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        future = self._futures.pop(request_id, None)
+        if future is None:
+            return
+
+        def resolve():
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(payload)
+
+        self._loop.call_soon_threadsafe(resolve)
+
+    def _collect_responses(self):
+        while not self._stopping:
+            try:
+                kind, key, value = self._response_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            with self._lock:
+                if kind == "ready":
+                    self._ready.add(key)
+                    self._memory[key] = value
+                    logger.info(f"✅ worker {key} 模型加载完成 ({len(self._ready)}/{self.num_workers})")
+                elif kind == "started":
+                    # 崩溃 worker 迟到的消息：请求已判失败，不再计入
+                    if self._owner.get(value) == key:
+                        self._inflight[key] = value
+                elif kind == "result":
+                    self._memory[value["worker"]] = value.get("memory")
+                    self._restarts[value["worker"]] = 0
+                    self._drop_inflight(key)
+                    self._finish(key, payload=value)
+                elif kind == "error":
+                    self._drop_inflight(key)
+                    self._finish(key, error=value)
+
+    def _drop_inflight(self, request_id: int):
+        for index, current in list(self._inflight.items()):
+            if current == request_id:
+                del self._inflight[index]
+
+    def _monitor(self):
+        """worker 异常退出时让分派给它的所有请求失败（包括还没开始处理的），换一条新队列，按退避时间重新拉起进程"""
+        while not self._stopping:
+            time.sleep(1)
+            now = time.monotonic()
+            for index, process in enumerate(self._processes):
+                if self._stopping:
+                    break
+                if process is None:
+                    if index in self._respawn_at and now >= self._respawn_at[index]:
+                        del self._respawn_at[index]
+                        self._spawn(index)
+                    continue
+                if process.is_alive():
+                    continue
+                self._restarts[index] += 1
+                with self._lock:
+                    self._processes[index] = None
+                    self._ready.discard(index)
+                    self._inflight.pop(index, None)
+                    for request_id in list(self._assigned[index]):
+                        self._finish(request_id, error=f"worker {index} 异常退出")
+                    # 旧队列里剩下的都是已判失败的请求
+                    self._request_queues[index] = self._ctx.Queue()
+                    if self._restarts[index] > self.max_restarts:
+                        self._failed.add(index)
+                if index in self._failed:
+                    logger.error(f"worker {index} 连续 {self._restarts[index]} 次异常退出 (code {process.exitcode})，不再重启")
+                    if self.failed:
+                        logger.error("❌ 所有 worker 均已失效，worker 池不再接受请求")
+                    continue
+                delay = min(self.restart_backoff_sec * 2 ** (self._restarts[index] - 1), MAX_RESTART_BACKOFF_SEC)
+                logger.error(f"worker {index} 异常退出 (code {process.exitcode})，{delay:.0f}s 后重启"
+                             f"（连续第 {self._restarts[index]} 次）")
+                self._respawn_at[index] = now + delay
+
+    def status(self) -> dict:
+        return {
+            "workers": self.num_workers,
+            "ready": self.ready_workers,
+            "busy": len(self._inflight),
+            "pending": len(self._futures),
+            "failed": self.failed,
+            "failed_workers": sorted(self._failed),
+            "restarts": {str(i): n for i, n in sorted(self._restarts.items()) if n},
+            "cores": [[g[0], g[-1]] for g in self.core_groups],
+            "memory": {str(i): m for i, m in sorted(self._memory.items())},
+        }
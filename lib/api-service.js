@@ -1,5 +1,42 @@
 const FormData = require('form-data');
 const http = require('http');
+const https = require('https');
+const http2 = require('http2');
+
+// Shared keep-alive pools: transcription uploads and health probes reuse the same sockets,
+// so the probe main.js sends before each utterance also warms the connection for the upload
+const httpAgent = new http.Agent({ keepAlive: true, keepAliveMsecs: 30000, maxSockets: 8 });
+const httpsAgent = new https.Agent({ keepAlive: true, keepAliveMsecs: 30000, maxSockets: 8 });
+
+// Cached HTTP/2 sessions per origin, and origins that turned out not to speak HTTP/2
+const http2Sessions = new Map();
+const http2Unsupported = new Set();
+
+function clientFor(url) {
+    return url.startsWith('https:') ? { client: https, agent: httpsAgent } : { client: http, agent: httpAgent };
+}
+
+// Recent latencies and failures per transcription endpoint, shared by all APIService instances
+// (main.js creates one per utterance) so hedging delays and provider ranking carry over
+const endpointStats = new Map();
+const LATENCY_WINDOW = 50;
+const MIN_LATENCY_SAMPLES = 5;
+const FAILURE_COOLDOWN_MS = 30000;
+const MIN_HEDGE_DELAY_MS = 200;
+
+function statsFor(url) {
+    let stats = endpointStats.get(url);
+    if (!stats) {
+        stats = { latencies: [], failures: 0, lastFailure: 0 };
+        endpointStats.set(url, stats);
+    }
+    return stats;
+}
+
+function percentile(values, q) {
+    const sorted = [...values].sort((a, b) => a - b);
+    return sorted[Math.min(sorted.length - 1, Math.floor(sorted.length * q))];
+}
 
 /**
  * API Service for Whisper-compatible transcription APIs
@@ -9,9 +46,16 @@ class APIService {
         this.config = config;
     }
 
-    static checkLocalServer() {
+    /**
+     * GET a health endpoint over the shared keep-alive pool
+     * @returns {Promise<boolean>} - true if the server answered 200
+     */
+    static probe(url, timeout = 5000) {
         return new Promise((resolve) => {
-            const req = http.get('http://localhost:8787/', { timeout: 5000 }, (res) => {
+            const { client, agent } = clientFor(url);
+            const req = client.get(url, { agent, timeout }, (res) => {
+                // Drain the body so the socket goes back to the pool
+                res.resume();
                 resolve(res.statusCode === 200);
             });
 
@@ -26,21 +70,291 @@ class APIService {
         });
     }
 
+    static checkLocalServer() {
+        return APIService.probe('http://localhost:8787/');
+    }
+
     static checkVllmServer(vllmUrl = 'http://localhost:8000') {
-        return new Promise((resolve) => {
-            const url = `${vllmUrl.replace(/\/$/, '')}/health`;
-            const req = http.get(url, { timeout: 5000 }, (res) => {
-                resolve(res.statusCode === 200);
+        return APIService.probe(`${vllmUrl.replace(/\/$/, '')}/health`);
+    }
+
+    /**
+     * Ask the local server to reload its model if it was unloaded while idle, so loading
+     * overlaps with the user speaking. Best effort: failures are ignored.
+     */
+    static async preloadLocalServer() {
+        try {
+            await APIService.request('POST', 'http://localhost:8787/v1/preload', null, {}, false);
+        } catch (e) { /* server not running yet; ensureServerOnline starts it */ }
+    }
+
+    /**
+     * POST a multipart form over HTTP/1.1 keep-alive, streaming the parts instead of
+     * concatenating them into one buffer first
+     * @param {Function} buildForm - Returns a fresh FormData (a stream can only be sent once)
+     */
+    static postForm(url, buildForm, headers = {}, retry = true, signal = undefined) {
+        return new Promise((resolve, reject) => {
+            const { client, agent } = clientFor(url);
+            const formData = buildForm();
+            const req = client.request(url, {
+                method: 'POST',
+                agent,
+                signal,
+                headers: {
+                    ...formData.getHeaders(),
+                    ...headers,
+                    'Content-Length': formData.getLengthSync()
+                }
+            }, (res) => {
+                const chunks = [];
+                res.on('data', (chunk) => chunks.push(chunk));
+                res.on('end', () => resolve({ status: res.statusCode, body: Buffer.concat(chunks).toString('utf8') }));
+                res.on('error', reject);
             });
 
-            req.on('error', () => {
-                resolve(false);
+            req.on('error', (error) => {
+                // The server may close an idle pooled socket just as we reuse it; retry once on a fresh one
+                if (retry && req.reusedSocket && error.code === 'ECONNRESET') {
+                    APIService.postForm(url, buildForm, headers, false, signal).then(resolve, reject);
+                } else {
+                    reject(error);
+                }
             });
 
-            req.on('timeout', () => {
-                req.destroy();
-                resolve(false);
+            formData.pipe(req);
+        });
+    }
+
+    static getHttp2Session(origin) {
+        let session = http2Sessions.get(origin);
+        if (session && !session.closed && !session.destroyed) {
+            return session;
+        }
+
+        session = http2.connect(origin);
+        session.on('error', () => http2Sessions.delete(origin));
+        session.on('close', () => http2Sessions.delete(origin));
+        // Don't keep the app alive just for an idle session
+        session.unref();
+        http2Sessions.set(origin, session);
+        return session;
+    }
+
+    /**
+     * POST a multipart form on a shared HTTP/2 session (many requests multiplexed on one connection)
+     */
+    static postFormHttp2(url, buildForm, headers = {}, signal = undefined) {
+        return new Promise((resolve, reject) => {
+            const target = new URL(url);
+            const session = APIService.getHttp2Session(target.origin);
+            const formData = buildForm();
+            const req = session.request({
+                ':method': 'POST',
+                ':path': `${target.pathname}${target.search}`,
+                ...formData.getHeaders(),
+                ...headers,
+                'content-length': formData.getLengthSync()
+            }, { signal });
+
+            let status = 0;
+            const chunks = [];
+            req.on('response', (responseHeaders) => {
+                status = responseHeaders[':status'];
             });
+            req.on('data', (chunk) => chunks.push(chunk));
+            req.on('end', () => resolve({ status, body: Buffer.concat(chunks).toString('utf8') }));
+            req.on('error', reject);
+
+            formData.pipe(req);
+        });
+    }
+
+    /**
+     * Send a form using HTTP/2 when enabled for local/vLLM providers, falling back to
+     * HTTP/1.1 keep-alive for origins that don't support it
+     * @param {string} provider - Provider the URL belongs to (defaults to the selected one)
+     * @param {AbortSignal} signal - Aborts the request, e.g. when a hedged request wins
+     */
+    async send(url, buildForm, headers, provider = this.config.apiProvider, signal = undefined) {
+        const { useHttp2 } = this.config;
+        const origin = new URL(url).origin;
+
+        if (useHttp2 && (provider === 'local' || provider === 'vllm') && !http2Unsupported.has(origin)) {
+            try {
+                return await APIService.postFormHttp2(url, buildForm, headers, signal);
+            } catch (error) {
+                if (signal && signal.aborted) {
+                    throw error;
+                }
+                console.log(`[MindVoice] HTTP/2 unavailable at ${origin}, using HTTP/1.1 keep-alive: ${error.message}`);
+                http2Unsupported.add(origin);
+            }
+        }
+
+        return APIService.postForm(url, buildForm, headers, true, signal);
+    }
+
+    /**
+     * Record the outcome of a request to a transcription endpoint
+     */
+    static recordLatency(url, ms) {
+        const stats = statsFor(url);
+        stats.latencies.push(ms);
+        if (stats.latencies.length > LATENCY_WINDOW) {
+            stats.latencies.shift();
+        }
+    }
+
+    static recordFailure(url) {
+        const stats = statsFor(url);
+        stats.failures++;
+        stats.lastFailure = Date.now();
+    }
+
+    /**
+     * Recent latency summary per endpoint (p50/p95 over the last LATENCY_WINDOW successes)
+     */
+    static latencyStats() {
+        const summary = {};
+        for (const [url, stats] of endpointStats) {
+            summary[url] = {
+                samples: stats.latencies.length,
+                p50: stats.latencies.length ? percentile(stats.latencies, 0.5) : null,
+                p95: stats.latencies.length ? percentile(stats.latencies, 0.95) : null,
+                failures: stats.failures,
+                healthy: Date.now() - stats.lastFailure > FAILURE_COOLDOWN_MS
+            };
+        }
+        return summary;
+    }
+
+    /**
+     * How long to wait for an endpoint before hedging: its recent p95, or the configured
+     * delay until enough samples have been collected
+     */
+    hedgeDelay(url) {
+        const { latencies } = statsFor(url);
+        if (latencies.length < MIN_LATENCY_SAMPLES) {
+            return Math.max(MIN_HEDGE_DELAY_MS, Number(this.config.hedgeDelayMs) || 1500);
+        }
+        return Math.max(MIN_HEDGE_DELAY_MS, percentile(latencies, 0.95));
+    }
+
+    /**
+     * Endpoints a transcription may be sent to: the selected provider first, then the configured
+     * hedge targets ('local', 'vllm' or the base URL of another vLLM-compatible replica).
+     * With hedging on they are reordered so the fastest healthy endpoint is tried first.
+     */
+    getTargets() {
+        const primary = { provider: this.config.apiProvider, url: this.getBaseUrl(), primary: true };
+        if (!this.config.hedging) {
+            return [primary];
+        }
+
+        const targets = [primary];
+        for (const entry of this.config.hedgeTargets || []) {
+            let target;
+            if (entry === 'local' || entry === 'vllm') {
+                target = { provider: entry, url: new APIService({ ...this.config, apiProvider: entry }).getBaseUrl() };
+            } else if (/^https?:\/\//.test(entry)) {
+                const base = entry.replace(/\/$/, '');
+                target = { provider: 'vllm', url: /\/transcriptions$/.test(base) ? base : `${base}/v1/audio/transcriptions` };
+            } else {
+                continue;
+            }
+            if (!targets.some((t) => t.url === target.url)) {
+                targets.push({ ...target, primary: false });
+            }
+        }
+
+        // Healthy before recently failed; among healthy, lower median latency first. Until it has
+        // enough samples the selected provider stays in front and unmeasured hedge targets go last.
+        const now = Date.now();
+        const rank = (target) => {
+            const stats = statsFor(target.url);
+            const healthy = now - stats.lastFailure > FAILURE_COOLDOWN_MS;
+            const median = stats.latencies.length >= MIN_LATENCY_SAMPLES ? percentile(stats.latencies, 0.5) : Infinity;
+            return [healthy ? 0 : 1, target.primary && median === Infinity ? -1 : median];
+        };
+        return targets
+            .map((target, index) => ({ target, index, rank: rank(target) }))
+            .sort((a, b) => a.rank[0] - b.rank[0] || a.rank[1] - b.rank[1] || a.index - b.index)
+            .map(({ target }) => target);
+    }
+
+    /**
+     * Run attempt(target, signal) on the first target; if it hasn't answered within that target's
+     * hedge delay, or fails, start the next one. The first success wins and the others are aborted.
+     * @returns {Promise<string>}
+     */
+    hedge(targets, attempt) {
+        return new Promise((resolve, reject) => {
+            // controller -> { url, startTime } for attempts still waiting on a response
+            const inflight = new Map();
+            const errors = [];
+            let next = 0;
+            let pending = 0;
+            let settled = false;
+            let timer = null;
+
+            const launch = () => {
+                if (settled || next >= targets.length) {
+                    return;
+                }
+                const target = targets[next++];
+                const controller = new AbortController();
+                const startTime = Date.now();
+                inflight.set(controller, { url: target.url, startTime });
+                pending++;
+                if (next > 1) {
+                    console.log(`[MindVoice] Hedging transcription to ${target.url}`);
+                }
+
+                attempt(target, controller.signal).then((text) => {
+                    inflight.delete(controller);
+                    APIService.recordLatency(target.url, Date.now() - startTime);
+                    if (settled) {
+                        return;
+                    }
+                    settled = true;
+                    clearTimeout(timer);
+                    // A loser would have taken at least this long; without the sample a slow endpoint
+                    // that keeps losing never has its latency updated and keeps being tried first
+                    for (const [other, { url, startTime: otherStart }] of inflight) {
+                        APIService.recordLatency(url, Date.now() - otherStart);
+                        other.abort();
+                    }
+                    inflight.clear();
+                    resolve(text);
+                }, (error) => {
+                    inflight.delete(controller);
+                    pending--;
+                    if (controller.signal.aborted) {
+                        return;
+                    }
+                    APIService.recordFailure(target.url);
+                    errors.push(error);
+                    if (settled) {
+                        return;
+                    }
+                    if (next < targets.length) {
+                        // Fail over right away instead of waiting out the hedge delay
+                        clearTimeout(timer);
+                        launch();
+                    } else if (pending === 0) {
+                        settled = true;
+                        reject(errors[0]);
+                    }
+                });
+
+                if (next < targets.length) {
+                    clearTimeout(timer);
+                    timer = setTimeout(launch, this.hedgeDelay(target.url));
+                }
+            };
+
+            launch();
         });
     }
 
@@ -70,19 +384,12 @@ class APIService {
     }
 
     /**
-     * Transcribe audio file
-     * @param {Buffer} audioBuffer - Audio file buffer
-     * @param {string} filename - Filename with extension (e.g., 'audio.wav')
-     * @returns {Promise<string>} - Transcribed text
+     * Build attempt(target, signal) that uploads the whole file to one transcription endpoint
+     * @returns {function(object, AbortSignal): Promise<string>}
      */
-    async transcribe(audioBuffer, filename = 'audio.wav') {
+    uploadAttempt(audioBuffer, filename) {
         const { apiKey, model, language, prompt } = this.config;
 
-        // Local and vLLM providers don't need API key
-        if (!apiKey && this.config.apiProvider !== 'local' && this.config.apiProvider !== 'vllm') {
-            throw new Error('API Key is not configured');
-        }
-
         // Determine content type from filename extension
         const ext = filename.split('.').pop().toLowerCase();
         const contentTypes = {
@@ -95,57 +402,240 @@ class APIService {
         };
         const contentType = contentTypes[ext] || 'audio/wav';
 
-        const formData = new FormData();
-        formData.append('file', audioBuffer, {
-            filename,
-            contentType
-        });
-
         let targetModel = model || 'whisper-1';
         if (this.config.apiProvider === 'siliconflow' && this.config.siliconFlowModel) {
             targetModel = this.config.siliconFlowModel;
         }
 
-        formData.append('model', targetModel);
+        const buildForm = (provider) => {
+            const formData = new FormData();
+            formData.append('file', audioBuffer, {
+                filename,
+                contentType
+            });
 
-        if (language && language !== 'auto') {
-            formData.append('language', language);
-        }
+            formData.append('model', targetModel);
 
-        if (prompt && prompt.trim()) {
-            formData.append('prompt', prompt.trim());
-        }
+            if (language && language !== 'auto') {
+                formData.append('language', language);
+            }
+
+            if (prompt && prompt.trim()) {
+                formData.append('prompt', prompt.trim());
+            }
 
-        const url = this.getBaseUrl();
+            // Push-to-talk dictation is latency-sensitive; let the local scheduler put it ahead of bulk work
+            if (provider === 'local') {
+                formData.append('priority', 'interactive');
+            }
 
-        try {
-            const headers = { ...formData.getHeaders() };
-            if (apiKey) {
+            return formData;
+        };
+
+        return async (target, signal) => {
+            const headers = {};
+            // The API key belongs to the selected provider; never send it to hedge targets
+            if (apiKey && target.primary) {
                 headers['Authorization'] = `Bearer ${apiKey}`;
             }
 
-            // Convert form-data to Buffer (stream is incompatible with Electron's fetch)
-            const body = formData.getBuffer();
-
-            const response = await fetch(url, {
-                method: 'POST',
-                headers,
-                body
-            });
+            const response = await this.send(target.url, () => buildForm(target.provider), headers, target.provider, signal);
 
-            if (!response.ok) {
-                const errorText = await response.text();
-                throw new Error(`API Error (${response.status}): ${errorText}`);
+            if (response.status < 200 || response.status >= 300) {
+                throw new Error(`API Error (${response.status}): ${response.body}`);
             }
 
-            const result = await response.json();
+            const result = JSON.parse(response.body);
             return result.text || '';
+        };
+    }
+
+    /**
+     * Transcribe audio file
+     * @param {Buffer} audioBuffer - Audio file buffer
+     * @param {string} filename - Filename with extension (e.g., 'audio.wav')
+     * @returns {Promise<string>} - Transcribed text
+     */
+    async transcribe(audioBuffer, filename = 'audio.wav') {
+        const { apiKey } = this.config;
+
+        // Local and vLLM providers don't need API key
+        if (!apiKey && this.config.apiProvider !== 'local' && this.config.apiProvider !== 'vllm') {
+            throw new Error('API Key is not configured');
+        }
+
+        const attempt = this.uploadAttempt(audioBuffer, filename);
+
+        try {
+            const targets = this.getTargets();
+            if (targets.length === 1) {
+                const startTime = Date.now();
+                const text = await attempt(targets[0]).catch((error) => {
+                    APIService.recordFailure(targets[0].url);
+                    throw error;
+                });
+                APIService.recordLatency(targets[0].url, Date.now() - startTime);
+                return text;
+            }
+            return await this.hedge(targets, attempt);
         } catch (error) {
             console.error('Transcription failed:', error);
             throw error;
         }
     }
 
+    /**
+     * Send a raw request over the shared keep-alive pool
+     * @returns {Promise<{status: number, body: string}>}
+     */
+    static request(method, url, body = null, headers = {}, retry = true, signal = undefined) {
+        return new Promise((resolve, reject) => {
+            const { client, agent } = clientFor(url);
+            const req = client.request(url, {
+                method,
+                agent,
+                signal,
+                headers: body ? { ...headers, 'Content-Length': body.length } : headers
+            }, (res) => {
+                const chunks = [];
+                res.on('data', (chunk) => chunks.push(chunk));
+                res.on('end', () => resolve({ status: res.statusCode, body: Buffer.concat(chunks).toString('utf8') }));
+                res.on('error', reject);
+            });
+
+            req.on('error', (error) => {
+                if (retry && req.reusedSocket && error.code === 'ECONNRESET') {
+                    APIService.request(method, url, body, headers, false, signal).then(resolve, reject);
+                } else {
+                    reject(error);
+                }
+            });
+
+            req.end(body || undefined);
+        });
+    }
+
+    /**
+     * Whether the provider accepts progressive upload sessions (audio sent while recording)
+     */
+    supportsStreaming() {
+        return this.config.apiProvider === 'local';
+    }
+
+    getSessionsUrl() {
+        return this.getBaseUrl().replace(/\/transcriptions$/, '/sessions');
+    }
+
+    /**
+     * Open a progressive upload session
+     * @param {string} format - 'webm' for MediaRecorder output, 'pcm_f32le' for 16kHz float samples
+     * @returns {Promise<string>} - Session id
+     */
+    async startSession(format) {
+        const { language, prompt } = this.config;
+        const response = await APIService.postForm(this.getSessionsUrl(), () => {
+            const formData = new FormData();
+            formData.append('format', format);
+            if (language && language !== 'auto') {
+                formData.append('language', language);
+            }
+            if (prompt && prompt.trim()) {
+                formData.append('prompt', prompt.trim());
+            }
+            return formData;
+        });
+
+        if (response.status !== 200) {
+            throw new Error(`Session Error (${response.status}): ${response.body}`);
+        }
+        return JSON.parse(response.body).session_id;
+    }
+
+    /**
+     * Upload one binary chunk; the server starts decoding it immediately
+     */
+    async appendChunk(sessionId, seq, chunk, segmentEnd = false) {
+        let url = `${this.getSessionsUrl()}/${sessionId}/chunks?seq=${seq}`;
+        if (segmentEnd) {
+            // Speaker paused here: the server transcribes what it has so far in the background
+            url += '&segment_end=true';
+        }
+        const response = await APIService.request('POST', url, chunk, { 'Content-Type': 'application/octet-stream' });
+        if (response.status !== 200) {
+            throw new Error(`Chunk Error (${response.status}): ${response.body}`);
+        }
+    }
+
+    /**
+     * Close the session and get the transcription of everything uploaded
+     * @returns {Promise<string>} - Transcribed text
+     */
+    async finishSession(sessionId, signal = undefined) {
+        const response = await APIService.request('POST', `${this.getSessionsUrl()}/${sessionId}/finish`, null, {}, true, signal);
+        if (response.status !== 200) {
+            throw new Error(`API Error (${response.status}): ${response.body}`);
+        }
+        return JSON.parse(response.body).text || '';
+    }
+
+    /**
+     * Finish a session, hedged like a one-shot upload: the finish goes first (its latency is tracked
+     * under the sessions URL, separately from whole-file uploads); if it hasn't answered within its
+     * hedge delay, or fails, the whole recording is uploaded to the other hedge targets.
+     * Without hedging this is just finishSession.
+     * @param {Buffer} audioBuffer - The whole recording, only sent if the finish is slow or fails
+     * @returns {Promise<string>} - Transcribed text
+     */
+    async finishSessionHedged(sessionId, audioBuffer, filename = 'audio.wav') {
+        const others = this.getTargets().filter((target) => !target.primary);
+        if (others.length === 0) {
+            return this.finishSession(sessionId);
+        }
+
+        const session = { provider: 'local', url: this.getSessionsUrl(), primary: true, session: true };
+        const upload = this.uploadAttempt(audioBuffer, filename);
+        return this.hedge([session, ...others], (target, signal) => (
+            target.session ? this.finishSession(sessionId, signal) : upload(target, signal)
+        ));
+    }
+
+    async abortSession(sessionId) {
+        try {
+            await APIService.request('DELETE', `${this.getSessionsUrl()}/${sessionId}`);
+        } catch (e) { /* best effort */ }
+    }
+
+    /**
+     * Wrap 16kHz mono float32 samples in a 16-bit PCM WAV container
+     * @param {Buffer} samples - Little-endian float32 samples
+     * @returns {Buffer}
+     */
+    static float32ToWav(samples, sampleRate = 16000) {
+        const count = Math.floor(samples.length / 4);
+        const wav = Buffer.alloc(44 + count * 2);
+
+        wav.write('RIFF', 0);
+        wav.writeUInt32LE(36 + count * 2, 4);
+        wav.write('WAVE', 8);
+        wav.write('fmt ', 12);
+        wav.writeUInt32LE(16, 16);
+        wav.writeUInt16LE(1, 20);
+        wav.writeUInt16LE(1, 22);
+        wav.writeUInt32LE(sampleRate, 24);
+        wav.writeUInt32LE(sampleRate * 2, 28);
+        wav.writeUInt16LE(2, 32);
+        wav.writeUInt16LE(16, 34);
+        wav.write('data', 36);
+        wav.writeUInt32LE(count * 2, 40);
+
+        for (let i = 0; i < count; i++) {
+            const s = Math.max(-1, Math.min(1, samples.readFloatLE(i * 4)));
+            wav.writeInt16LE(Math.round(s < 0 ? s * 0x8000 : s * 0x7FFF), 44 + i * 2);
+        }
+
+        return wav;
+    }
+
     /**
      * Test API connection with a minimal request
      * @returns {Promise<boolean>} - Success status
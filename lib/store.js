@@ -10,6 +10,27 @@ const schema = {
         type: 'string',
         default: 'http://localhost:8000'
     },
+    useHttp2: {
+        type: 'boolean',
+        default: false
+    },
+    // Send a second copy of the upload to another endpoint when the fastest one is slow to answer
+    hedging: {
+        type: 'boolean',
+        default: false
+    },
+    // Hedge/failover endpoints besides the selected provider: 'local', 'vllm' or a vLLM replica base URL
+    hedgeTargets: {
+        type: 'array',
+        items: { type: 'string' },
+        default: []
+    },
+    // Hedge delay until an endpoint has enough latency samples to use its p95
+    hedgeDelayMs: {
+        type: 'number',
+        default: 1500,
+        minimum: 0
+    },
     vllmPythonPath: {
         type: 'string',
         default: '/home/ai/miniconda3/envs/qwen-asr/bin/python'
@@ -33,7 +54,13 @@ const schema = {
     localModel: {
         type: 'string',
         default: 'qwen',
-        enum: ['qwen', 'voxtral']
+        enum: ['qwen', 'voxtral', 'onnx', 'cascade']
+    },
+    // Minutes of inactivity before the local server releases model memory (0 = keep resident)
+    localIdleUnloadMin: {
+        type: 'number',
+        default: 15,
+        minimum: 0
     },
     language: {
         type: 'string',
@@ -8,14 +8,16 @@ import os
 import sys
 import io
 import json
+import time
 import tempfile
 import logging
+import asyncio
 import subprocess
 import numpy as np
 import scipy.io.wavfile as wavfile
 from abc import ABC, abstractmethod
-from contextlib import asynccontextmanager
-from typing import Optional, Tuple
+from contextlib import asynccontextmanager, nullcontext
+from typing import List, Optional, Tuple, Union
 from dataclasses import dataclass
 
 # Force UTF-8 output on all platforms
@@ -119,10 +121,20 @@ def _patch_qwen2_tokenizer():
 _patch_qwen3_asr_rotary_embedding()
 _patch_qwen2_tokenizer()
 
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, Header, Request
+from fastapi.responses import JSONResponse, Response
 import uvicorn
 
+from asr_scheduler import PRIORITY_CLASSES, DeadlineExceeded, join_texts
+from asr_fairshare import RateLimited, client_identity, trusted_clients
+from asr_streaming import SessionRegistry
+from asr_cache import audio_scope, cached_features, scope_cached
+from asr_decoding import (
+    add_generated_tokens, compile_forward, configure_generation, generated_tokens, run_with_static_fallback, token_budget,
+)
+from asr_tracing import TRACE_HEADER, current_trace, record_span, span, trace_http
+from asr_profiling import ModelProfiler, ProfileBusy, ProfileSession, bundle, debug_authorized
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger("MindVoice-ASR")
 
@@ -133,40 +145,365 @@ DEFAULT_CONFIG = {
     "qwen": {
         "model_name": "Qwen/Qwen3-ASR-0.6B",
         "local_path": "model/qwen3-asr-0.6B",
-        "max_new_tokens": 512
+        "max_new_tokens": 512,
+        "quantize": None,
+        "encoder_cache_mb": 256,
+        "prompt_lookup_num_tokens": 0,
+        "static_cache": False,
+        "compile": False
     },
     "voxtral": {
         "model_name": "mistralai/Voxtral-Mini-4B-Realtime-2602",
         "local_path": "model/Voxtral-Mini-4B-Realtime-2602",
-        "transcription_delay_ms": 480
+        "transcription_delay_ms": 480,
+        "quantize": None,
+        "encoder_cache_mb": 256,
+        "prompt_lookup_num_tokens": 0,
+        "static_cache": False,
+        "compile": False
+    },
+    "onnx": {
+        "local_path": "model/qwen3-asr-onnx",
+        "quantized": False,
+        "threads": None,
+        "encoder_threads": None,
+        "decoder_threads": None,
+        "max_new_tokens": 512,
+        "encoder_cache_mb": 256
+    },
+    "cascade": {
+        "primary": "qwen",
+        "fallback": "voxtral",
+        "min_confidence": 0.7,
+        "max_primary_sec": 60,
+        "min_snr_db": 10,
+        "preload_fallback": True
+    },
+    "scheduler": {
+        "interactive_max_sec": 60,
+        "interactive_cap_sec": 300,
+        "bulk_chunk_sec": 30,
+        "bulk_max_concurrency": None
+    },
+    "disaggregation": {
+        "enabled": False,
+        "encoder_max_batch": 8,
+        "encoder_max_wait_ms": 10,
+        "encoder_workers": 1,
+        "decoder_max_batch": 4,
+        "decoder_max_wait_ms": 5,
+        "decoder_workers": 1
+    },
+    "pipeline": {
+        "ingest_workers": 2,
+        "decode_workers": 2,
+        "feature_workers": 1,
+        "model_workers": None,
+        "model_reserved_workers": None,
+        "queue_size": 8
+    },
+    "fairness": {
+        "enabled": True,
+        "client_header": "X-Client-Id",
+        "rate_sec_per_sec": None,
+        "burst_sec": 600,
+        "max_queued_sec": None,
+        "min_cost_sec": 1.0,
+        "default_weight": 1.0,
+        "weights": {},
+        "trusted_clients": []
+    },
+    "idle": {
+        "unload_after_sec": 0,
+        # 快照与模型权重同等大小（数 GB），默认不写
+        "snapshot_on_unload": False
+    },
+    "batch": {
+        "max_files": 64,
+        "max_batch_size": 8,
+        "decode_workers": 4,
+        "max_member_mb": 200,
+        "max_archive_mb": 1024
+    },
+    "jobs": {
+        "db_path": "jobs/jobs.sqlite3",
+        "batch_size": 4,
+        "workers": 1,
+        "max_attempts": 2,
+        "retention_hours": 24,
+        "max_wait_sec": 60
+    },
+    "tracing": {
+        "enabled": True,
+        "keep_slowest": 50,
+        "keep_recent": 200,
+        "export_path": None,
+        "export_min_ms": 0
+    },
+    "debug": {
+        "token": None,
+        "max_profile_sec": 60,
+        "profile_interval_ms": 5
     }
 }
 
 
+MODEL_TYPES = ["qwen", "voxtral", "onnx", "cascade"]
+
+SAMPLE_RATE = 16000
+
+# Qwen3-ASR 的语言参数为英文全称
+QWEN_LANGUAGES = {
+    "zh": "Chinese",
+    "en": "English",
+    "ja": "Japanese",
+    "ko": "Korean",
+    "auto": None,
+}
+
+# 音频输入：文件路径，或已解码的 16kHz 单声道 float32 PCM
+AudioInput = Union[str, np.ndarray]
+
+
 @dataclass
 class TranscriptionResult:
     text: str
     language: str
 
 
+def get_encoder_cache_mb(model_config: dict) -> int:
+    """编码器缓存上限 (MB)：环境变量 MINDVOICE_ENCODER_CACHE_MB 优先，其次模型配置，0 关闭"""
+    env_value = os.environ.get("MINDVOICE_ENCODER_CACHE_MB")
+    if env_value:
+        return int(env_value)
+    return int(model_config.get("encoder_cache_mb", 0) or 0)
+
+
+def get_decoding_options(model_config: dict) -> dict:
+    """解码加速选项：环境变量（由命令行参数设置）优先，其次模型配置"""
+    lookup = os.environ.get("MINDVOICE_PROMPT_LOOKUP")
+    return {
+        "prompt_lookup_num_tokens": int(lookup) if lookup else int(model_config.get("prompt_lookup_num_tokens", 0) or 0),
+        "static_cache": os.environ.get("MINDVOICE_STATIC_CACHE") == "1" or bool(model_config.get("static_cache")),
+        "compile_decoder": os.environ.get("MINDVOICE_COMPILE") == "1" or bool(model_config.get("compile")),
+    }
+
+
+def decode_audio(input_path: str) -> np.ndarray:
+    """用 ffmpeg 将任意格式音频解码为 16kHz 单声道 float32 PCM（经管道，不落盘）"""
+    proc = subprocess.run([
+        "ffmpeg", "-nostdin", "-i", input_path,
+        "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1", "-c:a", "pcm_s16le",
+        "pipe:1"
+    ], check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return np.frombuffer(proc.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+
+
 class ASRModel(ABC):
+    # 解码加速选项（见 asr_decoding）：prompt lookup 起草 token 数，0 表示普通贪心解码；
+    # 静态 KV cache；静态 cache 下用 torch.compile 编译前向
+    prompt_lookup_num_tokens = 0
+    static_cache = False
+    compile_decoder = False
+    # 快速加载快照中保存的实例属性；为空表示该后端不支持快照
+    snapshot_attrs: Tuple[str, ...] = ()
+    from_snapshot = False
+    # 音频编码器输出的 LRU 缓存，换 language/prompt 重试同一段音频时只需重新解码
+    encoder_cache = None
+    # 输出置信度统计（见 asr_decoding.track_confidence），模型级联启用
+    confidence_state = None
+    # 流水线特征阶段预先算好的模型输入（见 asr_pipeline.PreparedInputs）
+    prepared = None
+    # 编码/解码分离执行器（见 asr_disagg），启用后转录经它分阶段攒批
+    disaggregated = None
+
     @abstractmethod
     def load(self):
         pass
 
     @abstractmethod
-    def transcribe(self, audio_path: str, language: Optional[str] = None, prompt: Optional[str] = None) -> TranscriptionResult:
+    def transcribe(self, audio: AudioInput, language: Optional[str] = None, prompt: Optional[str] = None) -> TranscriptionResult:
         pass
 
+    def transcribe_batch(self, audios: List[AudioInput], language: Optional[str] = None, prompt: Optional[str] = None) -> List[TranscriptionResult]:
+        """批量转录；默认逐条调用 transcribe，支持批推理的后端应覆盖此方法"""
+        return [self.transcribe(audio, language=language, prompt=prompt) for audio in audios]
+
     @abstractmethod
     def get_model_name(self) -> str:
         pass
 
+    def torch_module(self) -> Optional[torch.nn.Module]:
+        """返回持有权重的 torch 模块（用于共享权重等），不支持时返回 None"""
+        return None
+
+    def snapshot_dir(self) -> str:
+        device = str(self.device).split(":")[0]
+        dtype = str(self.dtype).replace("torch.", "")
+        quantize = self.config.get("quantize")
+        tag = f"{self.get_model_name()}-{dtype}-{device}" + (f"-{quantize}" if quantize else "")
+        return get_model_path(os.path.join("model", "snapshots", tag))
+
+    def _snapshot_meta(self) -> dict:
+        from asr_snapshot import snapshot_meta
+        from asr_weights import source_fingerprint
+        return snapshot_meta(source_fingerprint(self.model_path), self.dtype,
+                             str(self.device), self.config.get("quantize"))
+
+    def load_snapshot(self) -> bool:
+        """存在匹配的快照时直接从快照恢复，跳过 from_pretrained"""
+        from asr_snapshot import load_snapshot
+
+        if not self.snapshot_attrs or os.environ.get("MINDVOICE_NO_SNAPSHOT") == "1":
+            return False
+        state = load_snapshot(self.snapshot_dir(), self._snapshot_meta())
+        if state is None:
+            return False
+        for key, value in state.items():
+            setattr(self, key, value)
+        self.from_snapshot = True
+        logger.info(f"从快照加载: {self.snapshot_dir()}")
+        return True
+
+    def save_snapshot(self) -> str:
+        """把当前已加载的模型写成快照；配置了 quantize=int8 时先做动态量化（仅 CPU）"""
+        from asr_snapshot import quantize_int8, save_snapshot
+
+        if not self.snapshot_attrs:
+            raise RuntimeError(f"{self.get_model_name()} 不支持快照")
+        module = self.torch_module()
+        quantize = self.config.get("quantize")
+        if quantize == "int8":
+            if str(self.device) != "cpu":
+                raise RuntimeError("int8 动态量化仅支持 CPU 推理")
+            quantize_int8(module)
+        elif quantize:
+            raise ValueError(f"不支持的量化方式: {quantize}")
+
+        path = self.snapshot_dir()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        save_snapshot({key: getattr(self, key) for key in self.snapshot_attrs}, module, path, self._snapshot_meta())
+        return path
+
+    def setup_encoder_cache(self):
+        """按配置创建编码器缓存，并挂到 torch 模型的音频编码器上"""
+        from asr_cache import EncoderCache, cache_module_forward, find_audio_encoder
+
+        max_mb = get_encoder_cache_mb(self.config)
+        if max_mb <= 0:
+            return
+        self.encoder_cache = EncoderCache(max_mb * 1024 ** 2)
+        module = self.torch_module()
+        if module is None:
+            return
+        encoder = find_audio_encoder(module)
+        if encoder is None:
+            logger.info(f"{self.get_model_name()} 未找到音频编码器，不启用编码器缓存")
+            self.encoder_cache = None
+            return
+        cache_module_forward(encoder, self.encoder_cache)
+        logger.info(f"已启用编码器缓存 (上限 {max_mb}MB)")
+
+    def extract_features(self, audio: np.ndarray):
+        """不依赖模型权重的预处理（特征提取），结果由 transcribe 取用；不支持单独提取的后端返回 None"""
+        return None
+
+    def is_cached(self, audio: np.ndarray) -> bool:
+        """编码器缓存已有这段音频的结果，转录时不需要特征提取"""
+        return scope_cached(self.encoder_cache, audio)
+
+    def prepare(self, audio: np.ndarray) -> bool:
+        """流水线特征阶段调用：提前提取特征，与其他请求的推理并行；编码器缓存命中的音频不必提取"""
+        from asr_pipeline import PreparedInputs
+
+        if self.is_cached(audio):
+            return False
+        features = self.extract_features(audio)
+        if features is None:
+            return False
+        if self.prepared is None:
+            self.prepared = PreparedInputs()
+        self.prepared.put(audio, features)
+        return True
+
+    def take_prepared(self, audio: np.ndarray):
+        if self.prepared is None:
+            return None
+        return self.prepared.pop(audio)
+
+    def split_runtime(self):
+        """可分阶段执行的推理对象（提供 encode_batch / decode_batch），不支持时返回 None"""
+        return None
+
+    def enable_disaggregation(self, options: dict) -> bool:
+        from asr_cache import find_audio_encoder
+        from asr_disagg import DisaggregatedExecutor
+
+        runtime = self.split_runtime()
+        if runtime is None:
+            return False
+        module = self.torch_module()
+        if module is not None and self.encoder_cache is not None:
+            # 编码器的输入变为多条音频打包的批，改为在执行器中按单条音频缓存
+            encoder = find_audio_encoder(module)
+            if encoder is not None:
+                encoder.__dict__.pop("forward", None)
+        self.disaggregated = DisaggregatedExecutor(runtime, options, self.config.get("max_new_tokens", 512))
+        self.disaggregated.encoder_cache = self.encoder_cache
+        return True
+
+    def transcribe_split(self, audios: List[AudioInput], language: Optional[str],
+                         prompt: Optional[str]) -> List[TranscriptionResult]:
+        arrays = [audio if isinstance(audio, np.ndarray) else decode_audio(audio) for audio in audios]
+        results = []
+        for text, detected, confidence in self.disaggregated.transcribe_batch(arrays, language, prompt):
+            if self.confidence_state is not None:
+                self.confidence_state["confidences"].append(confidence)
+            results.append(TranscriptionResult(text=text, language=detected))
+        return results
+
+    def enable_confidence(self) -> bool:
+        """在 generate 上挂置信度统计；不支持的后端返回 False"""
+        from asr_decoding import track_confidence
+
+        module = self.torch_module()
+        if module is None or not hasattr(module, "compute_transition_scores"):
+            return False
+        self.confidence_state = track_confidence(module)
+        return True
+
+    def reset_confidence(self):
+        if self.confidence_state is not None:
+            self.confidence_state["confidences"].clear()
+
+    def last_confidence(self) -> Optional[float]:
+        """自上次 reset_confidence 以来各次生成中最低的置信度，没有统计时为 None"""
+        if self.confidence_state is None:
+            return None
+        values = [c for c in self.confidence_state["confidences"] if c is not None]
+        return min(values) if values else None
+
+    def load_decoding_options(self, model_config: dict):
+        for key, value in get_decoding_options(model_config).items():
+            setattr(self, key, value)
+
+    def configure_generation(self, batch_size: int = 1):
+        """把当前的解码加速选项应用到模型的 generation_config 上，每次生成前调用"""
+        module = self.torch_module()
+        if module is None:
+            return
+        if self.static_cache and self.compile_decoder:
+            compile_forward(module)
+        configure_generation(module, self.prompt_lookup_num_tokens, self.static_cache, batch_size)
+
 
 class QwenASRModel(ASRModel):
+    snapshot_attrs = ("model",)
+
     def __init__(self, config: dict):
         self.config = config
         self.model = None
+        self.model_path = None
         self.device = None
         self.dtype = None
 
@@ -194,6 +531,13 @@ class QwenASRModel(ASRModel):
         else:
             model_name = self.config.get("model_name", "Qwen/Qwen3-ASR-0.6B")
             logger.info(f"本地模型未找到，将从 HuggingFace 下载: {model_name}")
+        self.model_path = model_name
+
+        if self.load_snapshot():
+            self.load_decoding_options(self.config)
+            self.setup_encoder_cache()
+            logger.info("✅ Qwen3-ASR 模型加载完成！(快照)")
+            return
 
         self.model = Qwen3ASRModel.from_pretrained(
             model_name,
@@ -202,39 +546,80 @@ class QwenASRModel(ASRModel):
             max_new_tokens=self.config.get("max_new_tokens", 512),
         )
 
+        self.load_decoding_options(self.config)
+        self.setup_encoder_cache()
         logger.info("✅ Qwen3-ASR 模型加载完成！")
 
-    def transcribe(self, audio_path: str, language: Optional[str] = None, prompt: Optional[str] = None) -> TranscriptionResult:
-        lang_map = {
-            "zh": "Chinese",
-            "en": "English",
-            "ja": "Japanese",
-            "ko": "Korean",
-            "auto": None,
-        }
-        lang = lang_map.get(language, language) if language else None
+    def transcribe(self, audio: AudioInput, language: Optional[str] = None, prompt: Optional[str] = None) -> TranscriptionResult:
+        return self.transcribe_batch([audio], language=language, prompt=prompt)[0]
 
-        transcribe_kwargs = {"audio": audio_path, "language": lang}
+    def transcribe_batch(self, audios: List[AudioInput], language: Optional[str] = None, prompt: Optional[str] = None) -> List[TranscriptionResult]:
+        lang = QWEN_LANGUAGES.get(language, language) if language else None
+        if self.disaggregated is not None:
+            return self.transcribe_split(audios, lang, prompt.strip() if prompt else None)
+
+        audio_inputs = [(a, SAMPLE_RATE) if isinstance(a, np.ndarray) else a for a in audios]
+        transcribe_kwargs = {"audio": audio_inputs, "language": lang}
         if prompt and prompt.strip():
             transcribe_kwargs["prompt"] = prompt.strip()
             logger.info(f"使用提示词: {prompt.strip()[:50]}...")
 
-        results = self.model.transcribe(**transcribe_kwargs)
-        if results:
-            return TranscriptionResult(
-                text=results[0].text,
-                language=results[0].language if hasattr(results[0], 'language') else "unknown"
+        max_new_tokens = self.config.get("max_new_tokens", 512)
+
+        def generate():
+            self.configure_generation(batch_size=len(audios))
+            # 同 Voxtral：静态 cache 按本批最长音频推算的 token 预算分配（文件路径输入时长未知，按上限）
+            if self.static_cache and all(isinstance(a, np.ndarray) for a in audios):
+                longest = max(len(a) for a in audios) / SAMPLE_RATE
+                self.model.max_new_tokens = token_budget(longest, max_new_tokens)
+            try:
+                # qwen_asr 在处理器内部提取特征，经 CachedFeatureExtractor 在编码器缓存整体命中时跳过
+                with audio_scope(*audios, cache=self.encoder_cache):
+                    return self.model.transcribe(**transcribe_kwargs) or []
+            finally:
+                self.model.max_new_tokens = max_new_tokens
+
+        results = run_with_static_fallback(self, generate)
+        outputs = [
+            TranscriptionResult(
+                text=r.text,
+                language=r.language if hasattr(r, 'language') else "unknown"
             )
-        return TranscriptionResult(text="", language="unknown")
+            for r in results
+        ]
+        outputs += [TranscriptionResult(text="", language="unknown")] * (len(audios) - len(outputs))
+        return outputs
 
     def get_model_name(self) -> str:
         return "Qwen3-ASR-0.6B"
 
+    def torch_module(self) -> Optional[torch.nn.Module]:
+        return getattr(self.model, "model", None)
+
+    def setup_encoder_cache(self):
+        from asr_cache import CachedFeatureExtractor
+
+        super().setup_encoder_cache()
+        processor = getattr(self.model, "processor", None)
+        if self.encoder_cache is not None and processor is not None \
+                and not isinstance(processor.feature_extractor, CachedFeatureExtractor):
+            processor.feature_extractor = CachedFeatureExtractor(processor.feature_extractor)
+
+    def split_runtime(self):
+        from asr_disagg import QwenSplitRuntime
+
+        if not hasattr(self.torch_module(), "thinker"):
+            return None
+        return QwenSplitRuntime(self.model)
+
 
 class VoxtralASRModel(ASRModel):
+    snapshot_attrs = ("model", "tokenizer", "feature_extractor")
+
     def __init__(self, config: dict):
         self.config = config
         self.model = None
+        self.model_path = None
         self.tokenizer = None
         self.device = None
         self.dtype = None
@@ -264,6 +649,13 @@ class VoxtralASRModel(ASRModel):
         else:
             model_name = self.config.get("model_name", "mistralai/Voxtral-Mini-4B-Realtime-2602")
             logger.info(f"本地模型未找到，将从 HuggingFace 下载: {model_name}")
+        self.model_path = model_name
+
+        if self.load_snapshot():
+            self.load_decoding_options(self.config)
+            self.setup_encoder_cache()
+            logger.info("✅ Voxtral 模型加载完成！(快照)")
+            return
 
         try:
             self.tokenizer = MistralTokenizer.from_file(os.path.join(model_name, "tekken.json"))
@@ -295,20 +687,18 @@ class VoxtralASRModel(ASRModel):
             logger.error(f"transformers 加载失败: {e}")
             raise
 
+        self.load_decoding_options(self.config)
+        self.setup_encoder_cache()
         logger.info("✅ Voxtral 模型加载完成！")
 
-    def transcribe(self, audio_path: str, language: Optional[str] = None, prompt: Optional[str] = None) -> TranscriptionResult:
-        audio_array = self._load_audio(audio_path)
+    def transcribe(self, audio: AudioInput, language: Optional[str] = None, prompt: Optional[str] = None) -> TranscriptionResult:
+        audio_array = audio if isinstance(audio, np.ndarray) else self._load_audio(audio)
 
         try:
-            audio_inputs = self.feature_extractor(
-                audio_array, 
-                sampling_rate=16000, 
-                return_tensors="pt"
-            )
-            
-            input_features = audio_inputs["input_features"]
-            input_features = input_features.to(self.device, dtype=self.dtype)
+            prepared = self.take_prepared(audio_array)
+
+            def features():
+                return prepared if prepared is not None else self.extract_features(audio_array)
 
             from mistral_common.protocol.instruct.chunk import RawAudio
             from mistral_common.protocol.transcription.request import (
@@ -338,13 +728,21 @@ class VoxtralASRModel(ASRModel):
             tokenized = self.tokenizer.encode_transcription(req)
             input_ids = torch.tensor([tokenized.tokens], device=self.device)
             
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    input_ids=input_ids,
-                    input_features=input_features,
-                    max_new_tokens=512,
-                    do_sample=False,
-                )
+            def generate():
+                self.configure_generation()
+                # 静态 cache 按音频时长推算的 token 预算分配，短音频不必预留 512 个位置
+                max_new_tokens = token_budget(len(audio_array) / 16000, 512) if self.static_cache else 512
+                # 编码器缓存整体命中时跳过特征提取，用同形状的全零特征占位
+                with torch.no_grad(), audio_scope(audio_array, cache=self.encoder_cache):
+                    input_features = cached_features(features).to(self.device, dtype=self.dtype)
+                    return self.model.generate(
+                        input_ids=input_ids,
+                        input_features=input_features,
+                        max_new_tokens=max_new_tokens,
+                        do_sample=False,
+                    )
+
+            outputs = run_with_static_fallback(self, generate)
             
             generated_ids = outputs[0][input_ids.shape[1]:].tolist()
             decoded = self.tokenizer.decode(generated_ids)
@@ -359,6 +757,9 @@ class VoxtralASRModel(ASRModel):
             logger.error(traceback.format_exc())
             return TranscriptionResult(text="", language="error")
 
+    def extract_features(self, audio: np.ndarray):
+        return self.feature_extractor(audio, sampling_rate=16000, return_tensors="pt")["input_features"]
+
     def _load_audio(self, audio_path: str):
         sample_rate, audio_data = wavfile.read(audio_path)
         
@@ -380,6 +781,153 @@ class VoxtralASRModel(ASRModel):
     def get_model_name(self) -> str:
         return "Voxtral-Mini-4B-Realtime"
 
+    def torch_module(self) -> Optional[torch.nn.Module]:
+        return self.model
+
+
+class OnnxASRModel(ASRModel):
+    """Qwen3-ASR 的 onnxruntime CPU 后端，模型需先用 asr_onnx.py export 导出"""
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.runtime = None
+        self.model_path = None
+        self.device = "cpu"
+
+    def load(self):
+        from asr_onnx import CONFIG_NAME, OnnxQwenRuntime
+
+        logger.info("正在加载 Qwen3-ASR ONNX 模型...")
+        model_dir = get_model_path(self.config.get("local_path", "model/qwen3-asr-onnx"))
+        if not os.path.exists(os.path.join(model_dir, CONFIG_NAME)):
+            raise FileNotFoundError(
+                f"未找到 ONNX 模型: {model_dir}，请先运行 python asr_onnx.py export --output {model_dir}"
+            )
+        self.model_path = model_dir
+        self.runtime = OnnxQwenRuntime(
+            model_dir,
+            quantized=self.config.get("quantized", False),
+            threads=self.config.get("threads"),
+            encoder_threads=self.config.get("encoder_threads"),
+            decoder_threads=self.config.get("decoder_threads"),
+        )
+        self.setup_encoder_cache()
+        logger.info(f"✅ Qwen3-ASR ONNX 模型加载完成！({'int8' if self.config.get('quantized') else 'fp32'})")
+
+    def transcribe(self, audio: AudioInput, language: Optional[str] = None, prompt: Optional[str] = None) -> TranscriptionResult:
+        lang = QWEN_LANGUAGES.get(language, language) if language else None
+        if self.disaggregated is not None:
+            return self.transcribe_split([audio], lang, prompt)[0]
+        audio_array = audio if isinstance(audio, np.ndarray) else decode_audio(audio)
+
+        # 特征提取与编码只依赖音频内容，命中缓存时直接在嵌入上解码
+        features = self.take_prepared(audio_array)
+        audio_embeds = None
+        if self.encoder_cache is not None:
+            from asr_cache import content_key
+            key = content_key(audio_array)
+            audio_embeds = self.encoder_cache.get(key)
+        if audio_embeds is None:
+            if features is None:
+                features = self.runtime.extract_features(audio_array)
+            audio_embeds = self.runtime.encode_features(features)
+            if self.encoder_cache is not None:
+                self.encoder_cache.put(key, audio_embeds)
+
+        text, detected, confidence, tokens = self.runtime.decode_one(
+            audio_embeds, lang, prompt, self.config.get("max_new_tokens", 512),
+        )
+        add_generated_tokens(tokens)
+        if self.confidence_state is not None:
+            self.confidence_state["confidences"].append(confidence)
+        return TranscriptionResult(text=text, language=detected)
+
+    def extract_features(self, audio: np.ndarray):
+        return self.runtime.extract_features(audio)
+
+    def is_cached(self, audio: np.ndarray) -> bool:
+        from asr_cache import content_key
+
+        return self.encoder_cache is not None and self.encoder_cache.peek(content_key(audio)) is not None
+
+    def split_runtime(self):
+        return self.runtime
+
+    def enable_confidence(self) -> bool:
+        # 置信度由 runtime 的贪心解码循环直接给出
+        self.confidence_state = {"confidences": []}
+        return True
+
+    def get_model_name(self) -> str:
+        return "Qwen3-ASR-0.6B (ONNX int8)" if self.config.get("quantized") else "Qwen3-ASR-0.6B (ONNX)"
+
+
+class CascadeASRModel(ASRModel):
+    """模型级联：先用小模型转录，置信度低、音频过长或噪声大时升级到大模型（见 asr_cascade）"""
+
+    def __init__(self, config: dict):
+        from asr_cascade import CascadePolicy
+
+        self.config = {**DEFAULT_CONFIG["cascade"], **config.get("cascade", {})}
+        self.primary = create_asr_model({**config, "model_type": self.config["primary"]})
+        self.fallback = create_asr_model({**config, "model_type": self.config["fallback"]})
+        self.fallback_loaded = False
+        self.policy = CascadePolicy(
+            min_confidence=self.config["min_confidence"],
+            max_primary_sec=self.config["max_primary_sec"],
+            min_snr_db=self.config["min_snr_db"],
+            sample_rate=SAMPLE_RATE,
+        )
+
+    def load(self):
+        self.primary.load()
+        if not self.primary.enable_confidence():
+            logger.warning(f"{self.primary.get_model_name()} 不支持置信度统计，只按音频时长和噪声升级")
+        if self.config.get("preload_fallback", True):
+            self._load_fallback()
+
+    def _load_fallback(self) -> ASRModel:
+        if not self.fallback_loaded:
+            self.fallback.load()
+            self.fallback_loaded = True
+        return self.fallback
+
+    def prepare(self, audio: np.ndarray) -> bool:
+        # 大多数请求由小模型完成，只为它提前提取特征
+        return self.primary.prepare(audio)
+
+    def members(self) -> List[ASRModel]:
+        return [self.primary] + ([self.fallback] if self.fallback_loaded else [])
+
+    def transcribe(self, audio: AudioInput, language: Optional[str] = None, prompt: Optional[str] = None) -> TranscriptionResult:
+        audio_array = audio if isinstance(audio, np.ndarray) else decode_audio(audio)
+
+        confidence = None
+        reason = self.policy.route_before(audio_array)
+        if reason is None:
+            self.primary.reset_confidence()
+            result = self.primary.transcribe(audio_array, language=language, prompt=prompt)
+            confidence = self.primary.last_confidence()
+            reason = self.policy.route_after(confidence)
+        if reason is not None:
+            logger.info(f"升级到 {self.fallback.get_model_name()} ({reason}"
+                        + (f", 置信度 {confidence:.2f})" if confidence is not None else ")"))
+            result = self._load_fallback().transcribe(audio_array, language=language, prompt=prompt)
+
+        self.policy.record(reason, confidence)
+        return result
+
+    def get_model_name(self) -> str:
+        return f"{self.primary.get_model_name()} → {self.fallback.get_model_name()}"
+
+    def status(self) -> dict:
+        return {
+            "primary": self.primary.get_model_name(),
+            "fallback": self.fallback.get_model_name(),
+            "fallback_loaded": self.fallback_loaded,
+            **self.policy.status(),
+        }
+
 
 def load_config() -> dict:
     config = DEFAULT_CONFIG.copy()
@@ -401,7 +949,18 @@ def save_config(config: dict):
 
 
 asr_model: Optional[ASRModel] = None
+worker_pool = None
+scheduler = None
+pipeline = None
+job_runner = None
+residency = None
+tracer = None
+# 在线剖析（见 asr_profiling）：不在剖析窗口内时模型调用只多一次属性判断
+model_profiler = ModelProfiler()
+profile_session = None
+stream_sessions = SessionRegistry()
 current_config: dict = {}
+model_lock = asyncio.Lock()
 
 
 def create_asr_model(config: dict) -> ASRModel:
@@ -409,17 +968,74 @@ def create_asr_model(config: dict) -> ASRModel:
     
     if model_type == "voxtral":
         return VoxtralASRModel(config.get("voxtral", {}))
+    elif model_type == "onnx":
+        return OnnxASRModel(config.get("onnx", {}))
+    elif model_type == "cascade":
+        return CascadeASRModel(config)
     else:
         return QwenASRModel(config.get("qwen", {}))
 
 
+def share_weights_enabled() -> bool:
+    return os.environ.get("MINDVOICE_SHARE_WEIGHTS", "") == "1"
+
+
+def enable_shared_weights(model: ASRModel):
+    """把模型权重换成只读 mmap 的共享文件，多个 worker 共用同一份物理内存"""
+    from asr_weights import share_model_weights, source_fingerprint
+
+    if isinstance(model, CascadeASRModel):
+        for member in model.members():
+            enable_shared_weights(member)
+        return
+    if model.from_snapshot:
+        logger.info("快照权重本身就是只读 mmap，多个 worker 已共享同一份物理内存")
+        return
+    module = model.torch_module()
+    if module is None:
+        logger.warning(f"{model.get_model_name()} 不支持共享权重")
+        return
+    dtype_name = str(model.dtype).replace("torch.", "")
+    cache_path = os.path.join(
+        TEMP_DIR, "shared_weights",
+        f"{model.get_model_name()}-{dtype_name}-{source_fingerprint(model.model_path)}.safetensors",
+    )
+    share_model_weights(module, cache_path)
+
+
+def get_disaggregation_options() -> Optional[dict]:
+    """编码/解码分离的批处理参数；未启用（环境变量 MINDVOICE_DISAGGREGATE 或配置 enabled）时返回 None"""
+    options = {**DEFAULT_CONFIG["disaggregation"], **current_config.get("disaggregation", {})}
+    enabled = options.pop("enabled", False)
+    if not (enabled or os.environ.get("MINDVOICE_DISAGGREGATE") == "1"):
+        return None
+    return options
+
+
+def enable_disaggregation(model: ASRModel):
+    options = get_disaggregation_options()
+    if options is None:
+        return
+    if model.enable_disaggregation(options):
+        logger.info(f"已启用编码/解码分离执行 (编码批 {options['encoder_max_batch']}, 解码批 {options['decoder_max_batch']})")
+    else:
+        logger.warning(f"{model.get_model_name()} 不支持编码/解码分离执行，按普通模式运行")
+
+
+def get_worker_count() -> int:
+    try:
+        return int(os.environ.get("MINDVOICE_WORKERS", "0"))
+    except ValueError:
+        return 0
+
+
 def load_model():
     global asr_model, current_config
     
     current_config = load_config()
     
     env_model = os.environ.get("MINDVOICE_MODEL", "").lower()
-    if env_model in ["qwen", "voxtral"]:
+    if env_model in MODEL_TYPES:
         current_config["model_type"] = env_model
         logger.info(f"从环境变量读取模型类型: {env_model}")
     
@@ -428,28 +1044,502 @@ def load_model():
     logger.info(f"选择的模型类型: {model_type}")
     
     asr_model = create_asr_model(current_config)
-    asr_model.load()
+    if get_worker_count() > 0:
+        # 多进程模式下前端不持有模型权重，只保留实例用于展示模型名
+        return
+    activate_model(asr_model)
     
     logger.info(f"✅ 服务已就绪，当前模型: {asr_model.get_model_name()}")
 
 
+def activate_model(model: ASRModel):
+    model.load()
+    if share_weights_enabled():
+        enable_shared_weights(model)
+    enable_disaggregation(model)
+
+
+def get_idle_unload_sec() -> float:
+    """空闲卸载时间：环境变量 MINDVOICE_IDLE_UNLOAD_SEC（由命令行参数或桌面端设置）优先，其次配置，0 表示常驻"""
+    env_value = os.environ.get("MINDVOICE_IDLE_UNLOAD_SEC")
+    if env_value:
+        return float(env_value)
+    idle_config = {**DEFAULT_CONFIG["idle"], **current_config.get("idle", {})}
+    return float(idle_config.get("unload_after_sec") or 0)
+
+
+def snapshot_before_unload(model: ASRModel):
+    """卸载前为还没有快照的模型写一份，之后重新加载走 mmap 快照"""
+    members = model.members() if isinstance(model, CascadeASRModel) else [model]
+    for member in members:
+        if not member.snapshot_attrs or member.from_snapshot or os.environ.get("MINDVOICE_NO_SNAPSHOT") == "1":
+            continue
+        if os.path.exists(member.snapshot_dir()):
+            continue
+        try:
+            size_gb = sum(p.numel() * p.element_size() for p in member.torch_module().parameters()) / 1024 ** 3
+            logger.info(f"卸载前生成快照: {member.get_model_name()}，约占用 {size_gb:.1f} GB 磁盘 ({member.snapshot_dir()})")
+            member.save_snapshot()
+        except Exception as e:
+            logger.warning(f"快照生成失败，下次仍从原始模型加载: {e}")
+
+
+def unload_model():
+    """释放模型权重：换成一个未加载的新实例，旧实例（含编码器缓存、分离执行器）随引用一起回收"""
+    import gc
+    global asr_model
+
+    model = asr_model
+    idle_config = {**DEFAULT_CONFIG["idle"], **current_config.get("idle", {})}
+    if idle_config.get("snapshot_on_unload", False):
+        snapshot_before_unload(model)
+    if model.disaggregated is not None:
+        model.disaggregated.stop()
+
+    fresh = create_asr_model(current_config)
+    if isinstance(model, CascadeASRModel) and isinstance(fresh, CascadeASRModel):
+        # 级联的升级统计跨卸载保留
+        fresh.policy = model.policy
+    asr_model = fresh
+    del model
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def reload_model():
+    activate_model(asr_model)
+
+
+def start_residency():
+    global residency
+    from asr_idle import ModelResidency
+
+    unload_after = get_idle_unload_sec() if worker_pool is None else 0
+    residency = ModelResidency(reload_model, unload_model, unload_after_sec=unload_after)
+    residency.start()
+    if unload_after:
+        logger.info(f"空闲 {unload_after:.0f}s 后自动卸载模型")
+
+
+def resident_memory() -> dict:
+    """模型驻留状态下的进程内存与显存占用"""
+    from asr_weights import memory_usage
+
+    usage = dict(memory_usage() or {})
+    if torch.cuda.is_available():
+        usage["cuda_allocated_mb"] = round(torch.cuda.memory_allocated() / 1024 ** 2, 1)
+        usage["cuda_reserved_mb"] = round(torch.cuda.memory_reserved() / 1024 ** 2, 1)
+    return usage
+
+
+def start_worker_pool():
+    global worker_pool
+    from asr_workers import WorkerPool
+
+    threads = os.environ.get("MINDVOICE_THREADS_PER_WORKER")
+    worker_pool = WorkerPool(
+        get_worker_count(),
+        model_factory=create_asr_model,
+        config=current_config,
+        threads_per_worker=int(threads) if threads else None,
+        post_load=enable_shared_weights if share_weights_enabled() else None,
+    )
+    worker_pool.start()
+
+
+def transcribe_traced(model: ASRModel, audio: AudioInput, language: Optional[str], prompt: Optional[str],
+                      exclusive: bool = False) -> TranscriptionResult:
+    """调用模型并记一个 span，附带生成的 token 数。ONNX 与分离执行器自行计数；exclusive 表示调用方持有模型锁，
+    此时还会临时包装 torch 模块的 generate 计数（包装会替换模块上的方法），剖析窗口内为这次调用开启 torch.profiler"""
+    audio_sec = round(len(audio) / SAMPLE_RATE, 2) if isinstance(audio, np.ndarray) else None
+    with span("model.transcribe", audio_sec=audio_sec) as model_span, \
+            (model_profiler.profile_call() if exclusive else nullcontext()):
+        module = model.torch_module() if exclusive and current_trace() is not None else None
+        with generated_tokens(module) as stats:
+            result = model.transcribe(audio, language, prompt)
+        if stats["calls"]:
+            model_span.set(tokens=stats["tokens"], generate_calls=stats["calls"])
+        return result
+
+
+async def execute_transcription(audio: AudioInput, language: Optional[str] = None, prompt: Optional[str] = None) -> TranscriptionResult:
+    """执行一次转录：多进程模式交给 worker 池，否则在线程中串行调用模型，避免阻塞事件循环"""
+    if worker_pool is not None:
+        with span("worker_pool.transcribe") as pool_span:
+            payload = await worker_pool.transcribe(audio, language=language, prompt=prompt)
+            if payload.get("tokens") is not None:
+                pool_span.set(tokens=payload["tokens"])
+        return TranscriptionResult(text=payload["text"], language=payload["language"])
+
+    async with residency.use():
+        if asr_model.disaggregated is not None:
+            # 分离模式下多个请求同时进入编码/解码队列才能攒批，由执行器自己串行化模型调用
+            return await asyncio.to_thread(transcribe_traced, asr_model, audio, language, prompt)
+
+        t_wait = time.perf_counter()
+        async with model_lock:
+            record_span("model.lock_wait", t_wait)
+            return await asyncio.to_thread(transcribe_traced, asr_model, audio, language, prompt, True)
+
+
+async def execute_batch(audios: List[np.ndarray], language: Optional[str] = None, prompt: Optional[str] = None,
+                        max_batch_size: int = 8) -> list:
+    """批量转录，按顺序返回每条的 TranscriptionResult 或异常。
+    单进程模式下每 max_batch_size 条调用一次 transcribe_batch，子批之间释放模型锁让其他请求插队；
+    某个子批失败时逐条重试，只有出错的那条返回异常"""
+    if worker_pool is not None:
+        payloads = await asyncio.gather(
+            *(worker_pool.transcribe(audio, language=language, prompt=prompt) for audio in audios),
+            return_exceptions=True,
+        )
+        return [p if isinstance(p, Exception) else TranscriptionResult(text=p["text"], language=p["language"])
+                for p in payloads]
+
+    def call_traced(model: ASRModel, method: str, args: tuple, exclusive: bool):
+        # 与 transcribe_traced 相同：持有模型锁时才包装 generate 计数并接受剖析
+        with span(f"model.{method}") as model_span:
+            module = model.torch_module() if exclusive and current_trace() is not None else None
+            with generated_tokens(module) as stats:
+                fn = getattr(model, method)
+                result = model_profiler.call(fn, *args) if exclusive else fn(*args)
+            if stats["calls"]:
+                model_span.set(tokens=stats["tokens"], generate_calls=stats["calls"])
+            return result
+
+    async def run(method, *args):
+        # 按名字取方法：空闲卸载后 asr_model 会换成新实例
+        async with residency.use():
+            if asr_model.disaggregated is not None:
+                return await asyncio.to_thread(call_traced, asr_model, method, args, False)
+            t_wait = time.perf_counter()
+            async with model_lock:
+                record_span("model.lock_wait", t_wait)
+                return await asyncio.to_thread(call_traced, asr_model, method, args, True)
+
+    results = []
+    for start in range(0, len(audios), max(1, max_batch_size)):
+        group = audios[start:start + max(1, max_batch_size)]
+        try:
+            results += await run("transcribe_batch", group, language, prompt)
+            continue
+        except Exception as e:
+            logger.warning(f"批量转录失败，逐条重试 ({len(group)} 条): {e}")
+        for audio in group:
+            try:
+                results.append(await run("transcribe", audio, language, prompt))
+            except Exception as e:
+                results.append(e)
+    return results
+
+
+def get_fairness_config() -> dict:
+    return {**DEFAULT_CONFIG["fairness"], **current_config.get("fairness", {})}
+
+
+def request_client(request: Request) -> str:
+    """请求所属客户端，用于公平排队与限额；只采信 weights 与 trusted_clients 中列出的 key/客户端标识"""
+    config = get_fairness_config()
+    header = config.get("client_header") or "X-Client-Id"
+    return client_identity(
+        request.headers.get("authorization"),
+        request.headers.get(header),
+        request.client.host if request.client else None,
+        trusted=trusted_clients(config.get("weights"), config.get("trusted_clients")),
+    )
+
+
+def rate_limited_response(e: RateLimited) -> JSONResponse:
+    logger.warning(f"请求被限流: {e}")
+    return JSONResponse(status_code=429, content={"error": str(e), "retry_after": round(e.retry_after, 1)},
+                        headers={"Retry-After": str(max(1, round(e.retry_after)))})
+
+
+def create_fairness():
+    from asr_fairshare import FairShare
+
+    fair_config = get_fairness_config()
+    if not fair_config.get("enabled"):
+        return None
+    return FairShare(
+        rate_sec_per_sec=fair_config.get("rate_sec_per_sec"),
+        burst_sec=fair_config.get("burst_sec", 600),
+        max_queued_sec=fair_config.get("max_queued_sec"),
+        weights=fair_config.get("weights"),
+        default_weight=fair_config.get("default_weight", 1.0),
+        min_cost_sec=fair_config.get("min_cost_sec", 1.0),
+    )
+
+
+def start_scheduler():
+    global scheduler
+    from asr_scheduler import Scheduler
+
+    sched_config = {**DEFAULT_CONFIG["scheduler"], **current_config.get("scheduler", {})}
+    if worker_pool is not None:
+        concurrency = worker_pool.num_workers
+    elif asr_model is not None and asr_model.disaggregated is not None:
+        concurrency = asr_model.disaggregated.max_in_flight
+    else:
+        concurrency = 1
+    scheduler = Scheduler(
+        execute_transcription,
+        concurrency=concurrency,
+        bulk_concurrency=sched_config.get("bulk_max_concurrency"),
+        bulk_chunk_sec=sched_config.get("bulk_chunk_sec", 30),
+        interactive_max_sec=sched_config.get("interactive_max_sec", 60),
+        interactive_cap_sec=sched_config.get("interactive_cap_sec", 300),
+        sample_rate=SAMPLE_RATE,
+        fairness=create_fairness(),
+    )
+    scheduler.start()
+
+
+async def run_transcription(audio: AudioInput, language: Optional[str] = None, prompt: Optional[str] = None,
+                            priority: Optional[str] = None, deadline_ms: Optional[float] = None,
+                            client: Optional[str] = None) -> TranscriptionResult:
+    """经调度器排队执行转录：交互请求优先，长 bulk 请求分段让路，同类别内各客户端公平分配"""
+    return await scheduler.submit(audio, language=language, prompt=prompt,
+                                  priority=priority, deadline_ms=deadline_ms, client=client)
+
+
+def _remove_temp_file(context: dict):
+    path = context.get("path")
+    if path and os.path.exists(path):
+        os.unlink(path)
+
+
+async def ingest_stage(context: dict):
+    """接收：读取上传内容并写入临时文件供 ffmpeg 读取"""
+    upload = context.pop("upload")
+    with span("upload.read") as read_span:
+        data = await upload.read()
+        read_span.set(bytes=len(data))
+    context["size"] = len(data)
+    suffix = os.path.splitext(upload.filename)[1] if upload.filename else ".webm"
+
+    def write():
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+            tmp.write(data)
+            return tmp.name
+
+    with span("upload.write"):
+        context["path"] = await asyncio.to_thread(write)
+
+
+def decode_stage(context: dict):
+    """解码/重采样：ffmpeg 转为 16kHz PCM，失败时交给模型读取原始文件"""
+    with span("ffmpeg") as ffmpeg_span:
+        try:
+            context["audio"] = decode_audio(context["path"])
+        except Exception as e:
+            logger.warning(f"FFmpeg 转换失败: {e}")
+            ffmpeg_span.set(error=str(e), fallback="model")
+            context["audio"] = context["path"]
+            return
+        ffmpeg_span.set(audio_sec=round(len(context["audio"]) / SAMPLE_RATE, 2))
+    _remove_temp_file(context)
+
+
+def feature_stage(context: dict):
+    """特征提取：在推理进程内运行时提前算好模型输入，与其他请求的推理重叠。
+    以下情况提前提取的特征不会被取用，跳过以免白算并占住缓存：
+    模型已被空闲卸载（推理阶段重新加载后自行提取）、分离执行（执行器按批自行编码）、
+    调度器会把音频切段（各段分别提取）"""
+    model = asr_model
+    audio = context["audio"]
+    if worker_pool is not None or not residency.loaded or model is None or not isinstance(audio, np.ndarray):
+        return
+    if model.disaggregated is not None or scheduler.will_split(audio, context["priority"]):
+        return
+    model.prepare(audio)
+
+
+async def model_stage(context: dict):
+    """模型推理：交给调度器，按优先级/截止时间占用推理槽位；截止时间扣除在前面各阶段花掉的时间"""
+    deadline_ms = None
+    if context["deadline_at"] is not None:
+        deadline_ms = max(1.0, (context["deadline_at"] - time.monotonic()) * 1000)
+    context["result"] = await run_transcription(
+        context["audio"], language=context["language"], prompt=context["prompt"],
+        priority=context["priority"], deadline_ms=deadline_ms, client=context.get("client"),
+    )
+
+
+def pipeline_rank(context: dict) -> tuple:
+    """流水线各阶段的出队顺序，与调度器一致：交互请求在前，同类别按截止时间。
+    解码前时长未知，按客户端声明的优先级排；解码后按调度器的分类（过长的交互声明降为 bulk）"""
+    audio = context.get("audio")
+    duration = len(audio) / SAMPLE_RATE if isinstance(audio, np.ndarray) else None
+    if duration is None and context.get("priority") == "interactive":
+        priority = "interactive"
+    else:
+        priority = scheduler.classify(duration, context.get("priority"))
+    deadline = context["deadline_at"]
+    return PRIORITY_CLASSES[priority], deadline if deadline is not None else float("inf")
+
+
+def start_pipeline():
+    global pipeline
+    from asr_pipeline import Pipeline, Stage
+
+    pipe_config = {**DEFAULT_CONFIG["pipeline"], **current_config.get("pipeline", {})}
+    queue_size = pipe_config.get("queue_size", 8)
+    # 模型阶段的 worker 只是提交到调度器的并发数，多于推理槽位才能让调度器在排队请求中挑选；
+    # 其中为交互请求预留与推理槽位同样多的 worker，bulk 请求占不满整个阶段
+    model_workers = pipe_config.get("model_workers") or max(4, 2 * scheduler.concurrency)
+    model_reserved = pipe_config.get("model_reserved_workers")
+    if model_reserved is None:
+        model_reserved = scheduler.concurrency
+    pipeline = Pipeline([
+        Stage("ingest", ingest_stage, pipe_config.get("ingest_workers", 2), queue_size),
+        Stage("decode", decode_stage, pipe_config.get("decode_workers", 2), queue_size),
+        Stage("features", feature_stage, pipe_config.get("feature_workers", 1), queue_size),
+        Stage("model", model_stage, model_workers, queue_size, reserved=model_reserved),
+    ], on_drop=_remove_temp_file, rank=pipeline_rank)
+    pipeline.start()
+
+
+def get_jobs_config() -> dict:
+    return {**DEFAULT_CONFIG["jobs"], **current_config.get("jobs", {})}
+
+
+async def transcribe_job(job: dict) -> dict:
+    try:
+        audio = await asyncio.to_thread(decode_audio, job["audio_path"])
+    except Exception as e:
+        logger.warning(f"FFmpeg 转换失败: {e}")
+        audio = job["audio_path"]
+    # 任务没有客户端在线等待，按 bulk 排队，不与交互请求争抢推理槽位
+    result = await run_transcription(audio, language=job["language"], prompt=job["prompt"], priority="bulk")
+    return {"text": result.text, "language": result.language}
+
+
+async def process_job_batch(jobs: List[dict]) -> list:
+    """一批任务同时解码并提交给调度器，由调度器/分离执行器在推理槽位间攒批"""
+    return await asyncio.gather(*(transcribe_job(job) for job in jobs), return_exceptions=True)
+
+
+def start_tracing():
+    global tracer
+    from asr_tracing import TraceCollector
+
+    trace_config = {**DEFAULT_CONFIG["tracing"], **current_config.get("tracing", {})}
+    if not trace_config.get("enabled"):
+        return
+    export_path = os.environ.get("MINDVOICE_TRACE_EXPORT") or trace_config.get("export_path")
+    if export_path and not os.path.isabs(export_path):
+        export_path = os.path.join(get_app_base_path(), export_path)
+    tracer = TraceCollector(
+        keep_slowest=trace_config.get("keep_slowest", 50),
+        keep_recent=trace_config.get("keep_recent", 200),
+        export_path=export_path,
+        export_min_ms=trace_config.get("export_min_ms", 0),
+    )
+    if export_path:
+        logger.info(f"请求 trace 导出到: {export_path}")
+
+
+def get_debug_config() -> dict:
+    return {**DEFAULT_CONFIG["debug"], **current_config.get("debug", {})}
+
+
+def start_profiling():
+    global profile_session
+    debug_config = get_debug_config()
+    profile_session = ProfileSession(
+        max_seconds=debug_config.get("max_profile_sec", 60),
+        interval_ms=debug_config.get("profile_interval_ms", 5),
+    )
+
+
+def start_job_runner():
+    global job_runner
+    from asr_jobs import JobRunner, JobStore
+
+    jobs_config = get_jobs_config()
+    db_path = jobs_config.get("db_path") or DEFAULT_CONFIG["jobs"]["db_path"]
+    if not os.path.isabs(db_path):
+        db_path = os.path.join(get_app_base_path(), db_path)
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+    store = JobStore(db_path, max_attempts=jobs_config.get("max_attempts", 2))
+    store.recover()
+    job_runner = JobRunner(
+        store, process_job_batch,
+        batch_size=jobs_config.get("batch_size", 4),
+        workers=jobs_config.get("workers", 1),
+        retention_hours=jobs_config.get("retention_hours", 24),
+    )
+    job_runner.start()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    start_tracing()
+    start_profiling()
     load_model()
+    if get_worker_count() > 0:
+        start_worker_pool()
+    start_residency()
+    start_scheduler()
+    start_pipeline()
+    start_job_runner()
+    stream_sessions.start()
     yield
+    await stream_sessions.stop()
+    await residency.stop()
+    await job_runner.stop()
+    job_runner.store.close()
+    await pipeline.stop()
+    await scheduler.stop()
+    if asr_model is not None and asr_model.disaggregated is not None:
+        asr_model.disaggregated.stop()
+    if worker_pool is not None:
+        worker_pool.stop()
 
 
 app = FastAPI(title="MindVoice Local ASR", version="2.0.0", lifespan=lifespan)
 
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # 只追踪会触发处理的请求；状态查询、长轮询等 GET 请求不占用 trace 缓冲
+    if tracer is None or request.method == "GET":
+        return await call_next(request)
+    return await trace_http(tracer, request, call_next, client=request_client(request))
+
+
 @app.get("/")
 async def root():
     model_name = asr_model.get_model_name() if asr_model else "未加载"
-    return {
+    status = {
         "status": "ok",
         "model": model_name,
         "message": "MindVoice 本地 ASR 服务运行中"
     }
+    if worker_pool is not None:
+        status["workers"] = worker_pool.status()
+    if scheduler is not None:
+        status["scheduler"] = scheduler.status()
+    if pipeline is not None:
+        status["pipeline"] = pipeline.status()
+    if job_runner is not None:
+        status["jobs"] = await asyncio.to_thread(job_runner.status)
+    if tracer is not None:
+        status["tracing"] = tracer.status()
+    if residency is not None and worker_pool is None:
+        status["residency"] = {**residency.status(), "memory": resident_memory()}
+    if share_weights_enabled():
+        from asr_weights import memory_usage
+        status["memory"] = memory_usage()
+    if asr_model is not None and asr_model.encoder_cache is not None:
+        status["encoder_cache"] = asr_model.encoder_cache.status()
+    if asr_model is not None and asr_model.disaggregated is not None:
+        status["disaggregation"] = asr_model.disaggregated.status()
+    if isinstance(asr_model, CascadeASRModel) and worker_pool is None:
+        status["cascade"] = asr_model.status()
+    return status
 
 
 @app.get("/config")
@@ -461,82 +1551,424 @@ async def get_config():
 async def update_config(model_type: str = Form(...)):
     global asr_model, current_config
     
-    if model_type not in ["qwen", "voxtral"]:
-        return JSONResponse(status_code=400, content={"error": "不支持的模型类型，请选择 qwen 或 voxtral"})
+    if model_type not in MODEL_TYPES:
+        return JSONResponse(status_code=400, content={"error": "不支持的模型类型，请选择 qwen、voxtral、onnx 或 cascade"})
     
     current_config["model_type"] = model_type
     save_config(current_config)
     
     logger.info(f"切换模型到: {model_type}")
-    asr_model = create_asr_model(current_config)
-    asr_model.load()
+    if worker_pool is not None:
+        asr_model = create_asr_model(current_config)
+        worker_pool.stop()
+        start_worker_pool()
+    else:
+        # 持有驻留锁替换模型，避免与空闲卸载、重新加载交错（卸载线程会换掉 asr_model）
+        async with residency.exclusive(), model_lock:
+            asr_model = create_asr_model(current_config)
+            activate_model(asr_model)
     
     return {"status": "ok", "model": asr_model.get_model_name()}
 
 
+@app.post("/v1/preload")
+async def preload():
+    """客户端即将开始听写（如按下快捷键）：模型已被空闲卸载时立即开始后台加载"""
+    if residency is None or worker_pool is not None:
+        return {"loaded": True}
+    loaded = residency.preload()
+    if not loaded:
+        logger.info("收到预加载请求，开始加载模型")
+    return {"loaded": loaded}
+
+
 @app.post("/v1/audio/transcriptions")
 async def transcribe(
+    request: Request,
     file: UploadFile = File(...),
     model_name: str = Form(default="auto", alias="model"),
     language: str = Form(default=None),
     prompt: str = Form(default=None),
+    priority: str = Form(default=None),
+    deadline_ms: float = Form(default=None),
+    x_priority: str = Header(default=None),
+    x_deadline_ms: float = Header(default=None),
 ):
     global asr_model
 
     if asr_model is None:
         return JSONResponse(status_code=503, content={"error": "模型未加载"})
 
-    import time
     t_start = time.time()
-    t_audio_size = 0
-    t_convert = 0
-    t_inference = 0
+    context = {
+        "upload": file,
+        "language": language,
+        "prompt": prompt,
+        "priority": priority or x_priority,
+        # 截止时间从收到请求时算起，流水线各阶段的耗时也计入
+        "deadline_at": time.monotonic() + (deadline_ms or x_deadline_ms) / 1000 if deadline_ms or x_deadline_ms else None,
+        "client": request_client(request),
+    }
 
     try:
-        audio_data = await file.read()
-        t_audio_received = time.time()
-        t_audio_size = len(audio_data)
+        prompt_info = f", 提示词: {prompt[:30]}..." if prompt else ""
+        logger.info(f"开始转录: {file.filename}, 语言: {language or '自动检测'}{prompt_info}")
+        try:
+            context = await pipeline.submit(context)
+        finally:
+            _remove_temp_file(context)
+
+        result = context["result"]
+        timings = context.get("timings", {})
+        t_total = time.time() - t_start
+        t_wait = t_total - sum(timings.values())
+        logger.info(f"转录完成: [{result.language}] {result.text[:80]}...")
+        logger.info(
+            f"耗时统计: 音频接收 {timings.get('ingest', 0)*1000:.0f}ms, 格式转换 {timings.get('decode', 0)*1000:.0f}ms, "
+            f"特征提取 {timings.get('features', 0)*1000:.0f}ms, 模型推理 {timings.get('model', 0)*1000:.0f}ms, "
+            f"排队 {t_wait*1000:.0f}ms, 总计 {t_total*1000:.0f}ms | 音频大小: {context.get('size', 0)/1024:.1f}KB"
+            + (f" | trace: {current_trace().id}" if current_trace() is not None else "")
+        )
+        return {"text": result.text}
 
-        suffix = os.path.splitext(file.filename)[1] if file.filename else ".webm"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(audio_data)
-            input_path = tmp.name
+    except RateLimited as e:
+        return rate_limited_response(e)
+    except DeadlineExceeded as e:
+        logger.warning(f"请求被拒绝: {e}")
+        return JSONResponse(status_code=503, content={"error": str(e)})
+    except Exception as e:
+        logger.error(f"转录失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
 
-        wav_path = input_path + ".wav"
 
+@app.get("/debug/traces")
+async def debug_traces(limit: int = 20):
+    """最慢的若干条请求 trace，按耗时从高到低"""
+    if tracer is None:
+        return JSONResponse(status_code=404, content={"error": "未启用请求追踪"})
+    return {**tracer.status(), "traces": tracer.slowest(max(1, limit))}
+
+
+@app.get("/debug/traces/{trace_id}")
+async def debug_trace(trace_id: str):
+    """按 ID 查询最近的一条 trace（ID 见响应头 X-Trace-Id）"""
+    trace = tracer.get(trace_id) if tracer is not None else None
+    if trace is None:
+        return JSONResponse(status_code=404, content={"error": f"trace 不存在或已被淘汰: {trace_id}"})
+    return trace
+
+
+@app.get("/debug/profile")
+async def debug_profile(request: Request, seconds: float = 10):
+    """在线剖析 seconds 秒：返回 zip，内含 Python 折叠栈与模型的 torch.profiler Chrome trace。
+    需要调试令牌（debug.token 或环境变量 MINDVOICE_DEBUG_TOKEN），放在 Authorization: Bearer 或 X-Debug-Token 头中"""
+    token = os.environ.get("MINDVOICE_DEBUG_TOKEN") or get_debug_config().get("token")
+    if not token:
+        return JSONResponse(status_code=404, content={"error": "未配置调试令牌 (debug.token 或 MINDVOICE_DEBUG_TOKEN)"})
+    if not debug_authorized(token, request.headers.get("authorization"), request.headers.get("x-debug-token")):
+        return JSONResponse(status_code=401, content={"error": "调试令牌无效"})
+
+    notes = []
+    if worker_pool is not None:
+        notes.append("多进程模式下模型在 worker 进程中执行，只采集了前端进程的 Python 栈")
+    elif asr_model is not None and asr_model.disaggregated is not None:
+        notes.append("分离模式下模型在执行器线程中攒批运行，未采集 torch trace（Python 栈包含执行器线程）")
+    profile_model = not notes
+
+    def stop_model() -> dict:
+        trace = model_profiler.stop()
+        if trace is None:
+            notes.append("剖析窗口内没有模型调用，未生成 torch trace")
+            return {}
+        if model_profiler.skipped:
+            notes.append(f"{model_profiler.skipped} 次模型调用与正在剖析的调用重叠，未计入 torch trace")
+        return {"torch_trace.json": trace}
+
+    logger.info(f"开始在线剖析 {seconds:.0f}s")
+    try:
+        files = await profile_session.capture(
+            seconds,
+            start_model=model_profiler.start if profile_model else None,
+            stop_model=stop_model if profile_model else None,
+            notes=notes,
+        )
+    except ProfileBusy as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+    data = await asyncio.to_thread(bundle, files)
+    return Response(data, media_type="application/zip", headers={
+        "Content-Disposition": f'attachment; filename="mindvoice-profile-{int(time.time())}.zip"',
+    })
+
+
+def decode_upload(filename: Optional[str], data: bytes) -> np.ndarray:
+    suffix = os.path.splitext(filename)[1] if filename else ".webm"
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(data)
+    try:
+        return decode_audio(tmp.name)
+    finally:
+        os.unlink(tmp.name)
+
+
+@app.post("/v1/audio/transcriptions/batch")
+async def transcribe_many(
+    request: Request,
+    file: List[UploadFile] = File(...),
+    language: str = Form(default=None),
+    prompt: str = Form(default=None),
+):
+    """一次请求转录多个文件：可重复上传多个 file 字段，也可上传 zip / tar 归档。
+    各文件并行解码后每 max_batch_size 条合成一批，作为 bulk 工作经调度器送入模型，
+    按上传（归档内按路径）顺序返回结果，单个文件失败不影响其他文件"""
+    from asr_batch import expand_archive, is_archive
+
+    if asr_model is None:
+        return JSONResponse(status_code=503, content={"error": "模型未加载"})
+
+    batch_config = {**DEFAULT_CONFIG["batch"], **current_config.get("batch", {})}
+    max_files = batch_config.get("max_files", 64)
+    t_start = time.time()
+
+    items = []
+    for upload in file:
+        data = await upload.read()
+        if is_archive(upload.filename):
+            try:
+                items += await asyncio.to_thread(
+                    expand_archive, upload.filename, data, max_files,
+                    int(batch_config.get("max_member_mb", 200) * 1024 ** 2),
+                    int(batch_config.get("max_archive_mb", 1024) * 1024 ** 2),
+                )
+            except Exception as e:
+                return JSONResponse(status_code=400, content={"error": f"无法读取归档 {upload.filename}: {e}"})
+        else:
+            items.append((upload.filename, data))
+    if not items:
+        return JSONResponse(status_code=400, content={"error": "没有可转录的音频文件"})
+    if len(items) > max_files:
+        return JSONResponse(status_code=413, content={"error": f"单次最多 {max_files} 个文件，收到 {len(items)} 个"})
+
+    decode_slots = asyncio.Semaphore(batch_config.get("decode_workers", 4))
+
+    async def decode(filename, data):
+        async with decode_slots:
+            return await asyncio.to_thread(decode_upload, filename, data)
+
+    decoded = await asyncio.gather(*(decode(name, data) for name, data in items), return_exceptions=True)
+    t_decode = time.time() - t_start
+
+    ready = [i for i, audio in enumerate(decoded) if not isinstance(audio, Exception)]
+    audios = [decoded[i] for i in ready]
+    max_batch_size = max(1, batch_config.get("max_batch_size", 8))
+    groups = [audios[start:start + max_batch_size] for start in range(0, len(audios), max_batch_size)]
+    total_sec = sum(len(audio) for audio in audios) / SAMPLE_RATE
+    # 准入检查按总时长做一次，额度按时长分摊到各子批，由调度器在子批执行完后归还
+    fairness, client, cost = scheduler.fairness, request_client(request), 0.0
+    if fairness is not None and groups:
         try:
-            t_convert_start = time.time()
-            subprocess.run([
-                "ffmpeg", "-y", "-i", input_path,
-                "-ar", "16000", "-ac", "1", "-c:a", "pcm_s16le",
-                wav_path
-            ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            t_convert = time.time() - t_convert_start
-            
-            transcribe_path = wav_path
-            prompt_info = f", 提示词: {prompt[:30]}..." if prompt else ""
-            logger.info(f"开始转录: {file.filename} -> WAV, 语言: {language or '自动检测'}{prompt_info}")
-        except Exception as e:
-            logger.warning(f"FFmpeg 转换失败: {e}")
-            transcribe_path = input_path
-            prompt_info = f", 提示词: {prompt[:30]}..." if prompt else ""
-            logger.info(f"开始转录 (原始格式): {file.filename}, 语言: {language or '自动检测'}{prompt_info}")
+            cost = fairness.admit(client, total_sec)
+        except RateLimited as e:
+            return rate_limited_response(e)
+
+    async def run_group(group):
+        group_sec = sum(len(audio) for audio in group) / SAMPLE_RATE
+        # 每个子批作为 bulk 工作占用调度器槽位，交互请求不会被整批转录挡住
+        return await scheduler.run_bulk(
+            lambda: execute_batch(group, language=language, prompt=prompt, max_batch_size=max_batch_size),
+            group_sec, client=client, cost=cost * group_sec / total_sec if total_sec else cost / len(groups),
+        )
+
+    t_infer_start = time.time()
+    try:
+        outputs = [output for group_outputs in await asyncio.gather(*(run_group(g) for g in groups))
+                   for output in group_outputs]
+    except Exception as e:
+        logger.error(f"批量转录失败: {e}")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+    t_infer = time.time() - t_infer_start
+
+    results = [{"index": i, "filename": name} for i, (name, _) in enumerate(items)]
+    for i, audio in enumerate(decoded):
+        if isinstance(audio, Exception):
+            results[i]["error"] = f"解码失败: {audio}"
+    for i, output in zip(ready, outputs):
+        if isinstance(output, Exception):
+            results[i]["error"] = str(output)
+        else:
+            results[i].update(text=output.text, language=output.language,
+                              duration=round(len(decoded[i]) / SAMPLE_RATE, 3))
 
+    errors = sum("error" in r for r in results)
+    audio_sec = sum(r.get("duration", 0) for r in results)
+    logger.info(
+        f"批量转录完成: {len(results)} 个文件, 失败 {errors} 个 | 并行解码 {t_decode*1000:.0f}ms, "
+        f"模型推理 {t_infer*1000:.0f}ms, 音频总时长 {audio_sec:.1f}s"
+    )
+    return {"results": results}
+
+
+@app.post("/v1/jobs", status_code=202)
+async def create_job(
+    file: UploadFile = File(...),
+    language: str = Form(default=None),
+    prompt: str = Form(default=None),
+):
+    """提交异步转录任务：音频落盘入队后立即返回任务 ID，结果经 GET /v1/jobs/{id} 获取"""
+    from asr_jobs import job_view
+
+    if asr_model is None:
+        return JSONResponse(status_code=503, content={"error": "模型未加载"})
+    data = await file.read()
+    try:
+        job_id = await job_runner.submit(data, file.filename, language=language, prompt=prompt)
+    except Exception as e:
+        logger.error(f"任务提交失败: {e}")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+    logger.info(f"新建转录任务 {job_id[:8]}: {file.filename} ({len(data)/1024:.1f}KB)")
+    return job_view(await job_runner.get(job_id))
+
+
+@app.get("/v1/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """查询任务状态；wait 为长轮询秒数，任务未结束时最多等待这么久（上限 jobs.max_wait_sec）"""
+    from asr_jobs import job_view
+
+    wait = min(max(wait, 0), get_jobs_config().get("max_wait_sec", 60))
+    job = await job_runner.get(job_id, wait=wait)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "任务不存在或已过期"})
+    return job_view(job)
+
+
+@app.post("/v1/audio/sessions")
+async def create_session(
+    request: Request,
+    format: str = Form(default="webm"),
+    language: str = Form(default=None),
+    prompt: str = Form(default=None),
+):
+    """开始一次渐进式上传：之后按序号 POST 分片，结束时调用 finish 获取结果"""
+    if asr_model is None:
+        return JSONResponse(status_code=503, content={"error": "模型未加载"})
+    if residency is not None and worker_pool is None:
+        # 会话开始即说明用户在说话，模型被卸载时趁录音期间加载
+        residency.preload()
+    try:
+        session = await asyncio.to_thread(
+            stream_sessions.create, audio_format=format, language=language, prompt=prompt, sample_rate=SAMPLE_RATE,
+            client=request_client(request),
+        )
+    except Exception as e:
+        logger.error(f"创建上传会话失败: {e}")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+    logger.info(f"新建上传会话 {session.id} ({format})")
+    return {"session_id": session.id}
+
+
+# 停顿处切出的分段短于该值时不单独转录，并入下一段
+SEGMENT_MIN_SEC = 1.0
+# 结束时剩余尾音短于该值且已有分段结果时直接丢弃（只是停顿后的静音）
+SEGMENT_TAIL_MIN_SEC = 0.3
+# 在解码末端往回这么长的范围内找最安静处作为切点
+SEGMENT_SEARCH_SEC = 0.8
+
+
+async def speculate_segment(session):
+    """在说话停顿处切出已解码的音频，后台提前转录，结果留到 finish 时拼接；
+    会话已开始结束时忽略分段标记，避免尾音被重复转录"""
+    await session.settle()
+    segment = session.take_segment(int(SEGMENT_MIN_SEC * SAMPLE_RATE), int(SEGMENT_SEARCH_SEC * SAMPLE_RATE))
+    if segment is None:
+        return
+    start, audio = segment
+    task = asyncio.create_task(
+        run_transcription(audio, language=session.language, prompt=session.prompt, priority="interactive",
+                          client=session.client)
+    )
+    session.segments.append((start, start + len(audio), task))
+    logger.info(f"会话 {session.id[:8]} 推测转录第 {len(session.segments)} 段 ({len(audio)/SAMPLE_RATE:.1f}s)")
+
+
+async def stitch_segments(session, audio: np.ndarray) -> TranscriptionResult:
+    """等待各分段的推测结果并转录剩余尾音，按顺序拼接为完整文本"""
+    tail = audio[session.segment_offset:]
+    tail_task = None
+    if not session.segments or len(tail) >= SEGMENT_TAIL_MIN_SEC * SAMPLE_RATE:
+        tail_task = asyncio.create_task(
+            run_transcription(tail, language=session.language, prompt=session.prompt, priority="interactive",
+                              client=session.client)
+        )
+
+    texts = []
+    language = None
+    for start, end, task in session.segments:
         try:
-            t_inference_start = time.time()
-            result = asr_model.transcribe(audio_path=transcribe_path, language=language, prompt=prompt)
-            t_inference = time.time() - t_inference_start
-            
-            t_total = time.time() - t_start
-            logger.info(f"转录完成: [{result.language}] {result.text[:80]}...")
-            logger.info(f"耗时统计: 音频接收 0ms, 格式转换 {t_convert*1000:.0f}ms, 模型推理 {t_inference*1000:.0f}ms, 总计 {t_total*1000:.0f}ms | 音频大小: {t_audio_size/1024:.1f}KB")
-            return {"text": result.text}
-        finally:
-            if os.path.exists(input_path):
-                os.unlink(input_path)
-            if os.path.exists(wav_path):
-                os.unlink(wav_path)
+            result = await task
+        except Exception as e:
+            logger.warning(f"分段推测转录失败，重新转录: {e}")
+            result = await run_transcription(audio[start:end], language=session.language,
+                                             prompt=session.prompt, priority="interactive", client=session.client)
+        texts.append(result.text)
+        language = language or result.language
+
+    if tail_task is not None:
+        result = await tail_task
+        texts.append(result.text)
+        language = language or result.language
+
+    return TranscriptionResult(text=join_texts(texts), language=language or "unknown")
+
+
+@app.post("/v1/audio/sessions/{session_id}/chunks")
+async def append_session_chunk(session_id: str, request: Request, seq: Optional[int] = None,
+                               segment_end: bool = False):
+    """追加一个二进制分片（请求体即原始音频字节），分片到达即送入解码；
+    segment_end=true 表示说话人在此停顿，已收到的音频会立即在后台转录"""
+    session = stream_sessions.get(session_id)
+    if session is None:
+        return JSONResponse(status_code=404, content={"error": "会话不存在或已过期"})
+    data = await request.body()
+    try:
+        await asyncio.to_thread(session.append, seq, data)
+    except RuntimeError as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+    if segment_end:
+        await speculate_segment(session)
+    return {
+        "received": session.bytes_received,
+        "decoded_sec": round(session.decoded_seconds, 2),
+        "segments": len(session.segments),
+    }
+
 
+@app.post("/v1/audio/sessions/{session_id}/finish")
+async def finish_session(session_id: str):
+    """结束上传并转录；此时绝大部分音频已解码完毕，停顿前的分段也多已转录完成"""
+    session = stream_sessions.pop(session_id)
+    if session is None:
+        return JSONResponse(status_code=404, content={"error": "会话不存在或已过期"})
+
+    try:
+        t_start = time.time()
+        decoded_before = session.decoded_seconds
+        audio = await asyncio.to_thread(session.finish, decode_audio)
+        t_convert = time.time() - t_start
+
+        t_inference_start = time.time()
+        result = await stitch_segments(session, audio)
+        t_inference = time.time() - t_inference_start
+
+        duration = len(audio) / SAMPLE_RATE
+        tail_sec = (len(audio) - session.segment_offset) / SAMPLE_RATE
+        logger.info(f"转录完成: [{result.language}] {result.text[:80]}...")
+        logger.info(f"耗时统计 (渐进上传): 收尾解码 {t_convert*1000:.0f}ms (结束前已解码 {decoded_before:.1f}/{duration:.1f}s), 收尾推理 {t_inference*1000:.0f}ms (推测分段 {len(session.segments)} 个, 尾音 {tail_sec:.1f}s) | 音频大小: {session.bytes_received/1024:.1f}KB")
+        return {"text": result.text}
+    except RateLimited as e:
+        return rate_limited_response(e)
+    except DeadlineExceeded as e:
+        return JSONResponse(status_code=503, content={"error": str(e)})
     except Exception as e:
         logger.error(f"转录失败: {e}")
         import traceback
@@ -544,19 +1976,295 @@ async def transcribe(
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 
+@app.delete("/v1/audio/sessions/{session_id}")
+async def abort_session(session_id: str):
+    session = stream_sessions.pop(session_id)
+    if session is not None:
+        for _, _, task in session.segments:
+            task.cancel()
+        await asyncio.to_thread(session.abort)
+    return {"status": "ok"}
+
+
+def collect_bench_inputs(args) -> List[str]:
+    from asr_batch import collect_inputs
+
+    if not args.input:
+        raise SystemExit(f"{args.command} 需要指定音频文件、目录或 .jsonl 清单")
+    if os.path.isfile(args.input) and not args.input.endswith(".jsonl"):
+        paths = [args.input]
+    else:
+        paths = [item["path"] for item in collect_inputs(args.input)]
+    if not paths:
+        raise SystemExit(f"未找到音频: {args.input}")
+    return paths
+
+
+def measure_cold_start(model_type: str, use_snapshot: bool) -> Optional[float]:
+    """在全新进程中导入服务并加载模型，返回冷启动耗时（秒）"""
+    env = {**os.environ, "MINDVOICE_MODEL": model_type, "MINDVOICE_NO_SNAPSHOT": "0" if use_snapshot else "1"}
+    env.pop("MINDVOICE_WORKERS", None)
+    code = (
+        "import sys, time; t = time.time(); "
+        f"sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r}); "
+        "import local_server; local_server.load_model(); "
+        "print('COLD_START', time.time() - t, local_server.asr_model.from_snapshot)"
+    )
+    t_start = time.time()
+    proc = subprocess.run([sys.executable, "-c", code], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          text=True, encoding="utf-8", errors="replace")
+    line = next((l for l in proc.stdout.splitlines() if l.startswith("COLD_START ")), None)
+    if line is None:
+        logger.error(f"冷启动测量失败 (code {proc.returncode}, {time.time() - t_start:.0f}s): {proc.stderr[-500:]}")
+        return None
+    _, seconds, from_snapshot = line.split()
+    if use_snapshot and from_snapshot != "True":
+        logger.warning("测量进程没有使用快照")
+    return float(seconds)
+
+
+def compile_model(args):
+    """compile-model 子命令：从 HF 格式加载一次，写出快速加载快照，并对比前后的冷启动耗时"""
+    model_type = os.environ.get("MINDVOICE_MODEL") or load_config().get("model_type", "qwen")
+    if model_type == "onnx":
+        raise SystemExit("ONNX 后端已是导出格式，请使用 python asr_onnx.py export")
+    if model_type == "cascade":
+        raise SystemExit("级联由两个模型组成，请分别用 --model qwen / --model voxtral 生成快照")
+
+    before = measure_cold_start(model_type, use_snapshot=False)
+
+    os.environ["MINDVOICE_NO_SNAPSHOT"] = "1"
+    load_model()
+    path = asr_model.save_snapshot()
+    os.environ.pop("MINDVOICE_NO_SNAPSHOT")
+
+    after = measure_cold_start(model_type, use_snapshot=True)
+
+    print("=" * 50)
+    print(f"  快照: {path}")
+    if before is not None and after is not None:
+        print(f"  冷启动: {before:.1f}s (from_pretrained) -> {after:.1f}s (快照)，{before / max(after, 1e-6):.1f}x")
+    print("=" * 50)
+
+
+def benchmark_backends(args):
+    """bench-backends 子命令：每个后端在独立进程中从零启动，对比启动耗时、内存占用与 RTF"""
+    from asr_weights import memory_usage
+
+    paths = collect_bench_inputs(args)
+    backends = args.backends.split(",")
+
+    if os.environ.get("MINDVOICE_BENCH_T0"):
+        # 子进程：只测一个后端，结果以一行 JSON 交回父进程
+        os.environ["MINDVOICE_MODEL"] = backends[0]
+        t_load = time.time()
+        load_model()
+        row = {
+            "backend": backends[0],
+            "model": asr_model.get_model_name(),
+            "startup_sec": time.time() - float(os.environ["MINDVOICE_BENCH_T0"]),
+            "load_sec": time.time() - t_load,
+            "loaded_mb": (memory_usage() or {}).get("rss_mb"),
+        }
+        audios = [decode_audio(path) for path in paths]
+        asr_model.transcribe(audios[0], language=args.language, prompt=args.prompt)
+        t_start = time.perf_counter()
+        row["texts"] = [asr_model.transcribe(a, language=args.language, prompt=args.prompt).text for a in audios]
+        elapsed = time.perf_counter() - t_start
+        audio_sec = sum(len(a) for a in audios) / SAMPLE_RATE
+        row["rtf"] = elapsed / audio_sec if audio_sec > 0 else 0.0
+        row["after_mb"] = (memory_usage() or {}).get("rss_mb")
+        print("BENCH_RESULT " + json.dumps(row, ensure_ascii=False), flush=True)
+        return
+
+    rows = []
+    for backend in backends:
+        logger.info(f"测试后端: {backend}")
+        env = {**os.environ, "MINDVOICE_BENCH_T0": str(time.time())}
+        command = [sys.executable, os.path.abspath(__file__), "bench-backends", args.input, "--backends", backend]
+        if args.language:
+            command += ["--language", args.language]
+        if args.prompt:
+            command += ["--prompt", args.prompt]
+        proc = subprocess.run(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              text=True, encoding="utf-8", errors="replace")
+        line = next((l for l in proc.stdout.splitlines() if l.startswith("BENCH_RESULT ")), None)
+        if line is None:
+            logger.error(f"后端 {backend} 测试失败 (code {proc.returncode}): {proc.stderr[-500:]}")
+            continue
+        rows.append(json.loads(line[len("BENCH_RESULT "):]))
+
+    if not rows:
+        return
+    baseline = rows[0]["texts"]
+    print("=" * 60)
+    print(f"  {len(paths)} 个文件")
+    print(f"  {'后端':<28} {'启动(s)':>8} {'加载(s)':>8} {'加载后(MB)':>10} {'推理后(MB)':>10} {'RTF':>7} {'一致':>6}")
+    for row in rows:
+        same = sum(a == b for a, b in zip(row["texts"], baseline))
+        print(f"  {row['model']:<28} {row['startup_sec']:>8.1f} {row['load_sec']:>8.1f} "
+              f"{row['loaded_mb'] or 0:>10.0f} {row['after_mb'] or 0:>10.0f} {row['rtf']:>7.3f} {same:>3}/{len(baseline)}")
+    print("=" * 60)
+
+
+def benchmark_decode(args):
+    """bench-decode 子命令：对比不同解码设置下的速度 (tokens/s、每 token 延迟、分配器开销) 并校验输出一致"""
+    from asr_decoding import benchmark_decoding
+
+    paths = collect_bench_inputs(args)
+
+    variants = []
+    for value in (int(v) for v in args.lookup_values.split(",")):
+        name = f"lookup={value}" if value > 0 else "greedy"
+        variants.append((name, {"prompt_lookup_num_tokens": value, "static_cache": False}))
+    if args.static_cache:
+        name = "static+compile" if args.compile else "static"
+        variants.append((name, {"prompt_lookup_num_tokens": 0, "static_cache": True}))
+
+    load_model()
+    audios = [decode_audio(path) for path in paths]
+    audio_sec = sum(len(a) for a in audios) / SAMPLE_RATE
+    device = getattr(asr_model, "device", "cpu")
+    logger.info(f"解码测速: {len(audios)} 个文件，共 {audio_sec:.1f}s 音频，设备 {device}")
+
+    print("=" * 60)
+    print(f"  {asr_model.get_model_name()} @ {device}, torch 线程数 {torch.get_num_threads()}")
+    print(f"  {'设置':<14} {'tokens':>7} {'耗时(s)':>8} {'tokens/s':>9} {'ms/token':>9} {'分配器':>12} {'一致':>4}")
+
+    def report(row):
+        identical = "-" if "identical" not in row else ("是" if row["identical"] else "否")
+        alloc = f"{row['alloc_delta']:+.0f} {row['alloc_unit']}"
+        print(f"  {row['variant']:<14} {row['tokens']:>7} {row['seconds']:>8.2f} {row['tokens_per_sec']:>9.1f} "
+              f"{row['ms_per_token']:>9.1f} {alloc:>12} {identical:>4}")
+
+    rows = benchmark_decoding(asr_model, audios, variants,
+                              language=args.language, prompt=args.prompt, progress=report)
+    base = rows[0]["tokens_per_sec"]
+    for row in rows[1:]:
+        if base > 0:
+            print(f"  {row['variant']}: {row['tokens_per_sec'] / base:.2f}x")
+    print("=" * 60)
+
+
+def transcribe_directory(args):
+    """transcribe-dir 子命令：离线批量转录目录或 JSONL 清单"""
+    from asr_batch import run_batch
+
+    if not args.input:
+        raise SystemExit("transcribe-dir 需要指定输入目录或 .jsonl 清单")
+    output = args.output or os.path.join(
+        args.input if os.path.isdir(args.input) else os.path.dirname(os.path.abspath(args.input)),
+        "transcripts.jsonl",
+    )
+
+    load_model()
+    logger.info(f"批量转录: {args.input} -> {output}")
+    stats = run_batch(
+        asr_model, decode_audio, args.input, output,
+        batch_size=args.batch_size,
+        decode_workers=args.decode_workers,
+        language=args.language,
+        prompt=args.prompt,
+        sample_rate=SAMPLE_RATE,
+    )
+
+    print("=" * 50)
+    print(f"  完成 {stats['files']} 个文件，失败 {stats['errors']} 个")
+    print(f"  音频总时长: {stats['audio_sec']:.1f}s，推理耗时: {stats['inference_sec']:.1f}s，总耗时: {stats['wall_sec']:.1f}s")
+    print(f"  RTF: {stats.get('rtf', 0):.3f} (推理) / {stats.get('wall_rtf', 0):.3f} (端到端)")
+    print(f"  输出: {output}")
+    print("=" * 50)
+
+
 if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description="MindVoice 本地 ASR 服务器")
-    parser.add_argument("--model", "-m", choices=["qwen", "voxtral"], 
-                        help="选择模型: qwen 或 voxtral")
+    parser.add_argument("command", nargs="?", default="serve", choices=["serve", "transcribe-dir", "bench-decode", "bench-backends", "compile-model"],
+                        help="serve: 启动 HTTP 服务 (默认)；transcribe-dir: 离线批量转录；bench-decode: 解码加速测速；"
+                             "bench-backends: 后端启动/内存/RTF 对比；compile-model: 生成快速加载快照")
+    parser.add_argument("input", nargs="?",
+                        help="transcribe-dir / bench-* 的输入：音频目录或 JSONL 清单 (bench-* 也可为单个文件)")
+    parser.add_argument("--model", "-m", choices=MODEL_TYPES,
+                        help="选择模型: qwen、voxtral、onnx 或 cascade")
     parser.add_argument("--port", "-p", type=int, default=8787,
                         help="服务端口 (默认: 8787)")
+    parser.add_argument("--workers", "-w", type=int, default=0,
+                        help="推理 worker 进程数，0 表示单进程 (默认: 0)")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="每个 worker 绑定的 CPU 核心数 (默认: 均分全部核心)")
+    parser.add_argument("--share-weights", action="store_true",
+                        help="以只读 mmap 共享模型权重，多个 worker 只占一份内存 (仅 CPU)")
+    parser.add_argument("--output", "-o", default=None,
+                        help="transcribe-dir 结果 JSONL 路径，已存在时断点续跑 (默认: 输入目录下 transcripts.jsonl)")
+    parser.add_argument("--batch-size", type=int, default=8,
+                        help="transcribe-dir 每批送入模型的文件数 (默认: 8)")
+    parser.add_argument("--decode-workers", type=int, default=4,
+                        help="transcribe-dir 并行解码的 ffmpeg 进程数 (默认: 4)")
+    parser.add_argument("--language", default=None,
+                        help="transcribe-dir / bench-decode 默认语言，清单中的 language 字段优先")
+    parser.add_argument("--prompt", default=None,
+                        help="transcribe-dir / bench-decode 默认提示词，清单中的 prompt 字段优先")
+    parser.add_argument("--prompt-lookup", type=int, default=None,
+                        help="prompt lookup 辅助解码每次起草的 token 数，0 关闭 (默认: 读取配置)")
+    parser.add_argument("--static-cache", action="store_true",
+                        help="预分配静态 KV cache 并跨请求复用")
+    parser.add_argument("--compile", action="store_true",
+                        help="静态 cache 下用 torch.compile 编译解码前向")
+    parser.add_argument("--disaggregate", action="store_true",
+                        help="音频编码与文本解码分阶段各自攒批执行 (qwen / onnx，单进程模式)")
+    parser.add_argument("--idle-unload", type=float, default=None,
+                        help="空闲多少秒后卸载模型、下次请求时重新加载，0 表示常驻 (默认: 读取配置)")
+    parser.add_argument("--trace-export", default=None,
+                        help=f"把每个请求的 trace 逐行追加到该 JSONL 文件 (响应头 {TRACE_HEADER} 为 trace ID)")
+    parser.add_argument("--backends", default="qwen,onnx",
+                        help="bench-backends 依次对比的后端，第一个为基准 (默认: qwen,onnx)")
+    parser.add_argument("--lookup-values", default="0,3,10",
+                        help="bench-decode 依次测试的 prompt lookup 长度，第一个为基准 (默认: 0,3,10)")
     args = parser.parse_args()
     
     if args.model:
         os.environ["MINDVOICE_MODEL"] = args.model
         logger.info(f"从命令行参数读取模型类型: {args.model}")
+
+    if args.workers > 0:
+        os.environ["MINDVOICE_WORKERS"] = str(args.workers)
+        if args.threads_per_worker:
+            os.environ["MINDVOICE_THREADS_PER_WORKER"] = str(args.threads_per_worker)
+    if args.share_weights:
+        os.environ["MINDVOICE_SHARE_WEIGHTS"] = "1"
+    if args.prompt_lookup is not None:
+        os.environ["MINDVOICE_PROMPT_LOOKUP"] = str(args.prompt_lookup)
+    if args.static_cache:
+        os.environ["MINDVOICE_STATIC_CACHE"] = "1"
+    if args.compile:
+        os.environ["MINDVOICE_COMPILE"] = "1"
+    if args.disaggregate:
+        os.environ["MINDVOICE_DISAGGREGATE"] = "1"
+    if args.idle_unload is not None:
+        os.environ["MINDVOICE_IDLE_UNLOAD_SEC"] = str(args.idle_unload)
+    if args.trace_export:
+        os.environ["MINDVOICE_TRACE_EXPORT"] = args.trace_export
+
+    if args.command == "transcribe-dir":
+        os.environ.pop("MINDVOICE_WORKERS", None)
+        transcribe_directory(args)
+        sys.exit(0)
+    if args.command in ("bench-decode", "bench-backends"):
+        # 测速会重复转录同一段音频，关闭编码器缓存以免结果偏乐观
+        os.environ.setdefault("MINDVOICE_ENCODER_CACHE_MB", "0")
+    if args.command == "bench-decode":
+        os.environ.pop("MINDVOICE_WORKERS", None)
+        benchmark_decode(args)
+        sys.exit(0)
+    if args.command == "bench-backends":
+        os.environ.pop("MINDVOICE_WORKERS", None)
+        benchmark_backends(args)
+        sys.exit(0)
+    if args.command == "compile-model":
+        os.environ.pop("MINDVOICE_WORKERS", None)
+        compile_model(args)
+        sys.exit(0)
     
     config = load_config()
     if args.model:
@@ -564,20 +2272,33 @@ if __name__ == "__main__":
     
     model_type = config.get("model_type", "qwen")
     
-    model_display = "Qwen3-ASR-0.6B" if model_type == "qwen" else "Voxtral-Mini-4B-Realtime"
+    model_display = {
+        "voxtral": "Voxtral-Mini-4B-Realtime",
+        "onnx": "Qwen3-ASR-0.6B (ONNX)",
+        "cascade": "Qwen3-ASR-0.6B → Voxtral-Mini-4B (级联)",
+    }.get(model_type, "Qwen3-ASR-0.6B")
     
     print("=" * 50)
     print("  MindVoice 本地 ASR 服务器 v2.0")
     print(f"  当前模型: {model_display}")
     print(f"  地址: http://localhost:{args.port}")
+    if args.workers > 0:
+        print(f"  推理 worker: {args.workers} 个进程")
     print("=" * 50)
     print()
     print("  支持的模型:")
     print("    - qwen    : Qwen3-ASR-0.6B (轻量级)")
     print("    - voxtral : Voxtral-Mini-4B-Realtime (实时)")
+    print("    - onnx    : Qwen3-ASR-0.6B ONNX Runtime (CPU, 需先导出)")
+    print("    - cascade : 先用 Qwen3-ASR，低置信度时升级到 Voxtral")
     print()
-    print("  切换模型: POST /config?model_type=qwen|voxtral")
-    print("  命令行: python local_server.py --model qwen|voxtral")
+    print("  切换模型: POST /config?model_type=qwen|voxtral|onnx|cascade")
+    print("  命令行: python local_server.py --model qwen|voxtral|onnx|cascade")
+    print("  多进程: python local_server.py --workers N")
+    print("  批量转录: python local_server.py transcribe-dir <目录|清单.jsonl>")
+    print("  解码测速: python local_server.py bench-decode <音频|目录>")
+    print("  生成快照: python local_server.py compile-model --model qwen|voxtral")
     print("=" * 50)
     
-    uvicorn.run(app, host="0.0.0.0", port=args.port, log_level="info")
+    # 保持空闲连接足够久，客户端两次听写之间可复用同一条 keep-alive 连接
+    uvicorn.run(app, host="0.0.0.0", port=args.port, log_level="info", timeout_keep_alive=120)
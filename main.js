@@ -174,7 +174,11 @@ async function startLocalServer() {
     }
 
     const localModel = store.get('localModel') || 'qwen';
-    const modelDisplay = localModel === 'voxtral' ? 'Voxtral-Mini-4B-Realtime' : 'Qwen3-ASR-0.6B';
+    const modelDisplay = {
+        voxtral: 'Voxtral-Mini-4B-Realtime',
+        onnx: 'Qwen3-ASR-0.6B (ONNX)',
+        cascade: 'Qwen3-ASR-0.6B → Voxtral-Mini-4B (级联)',
+    }[localModel] || 'Qwen3-ASR-0.6B';
 
     console.log('[MindVoice] Starting local server...');
     console.log(`[MindVoice] Model: ${modelDisplay}`);
@@ -211,6 +215,7 @@ async function startLocalServer() {
         const env = {
             ...process.env,
             MINDVOICE_MODEL: localModel,
+            MINDVOICE_IDLE_UNLOAD_SEC: String(Math.max(0, Number(store.get('localIdleUnloadMin')) || 0) * 60),
             MINDVOICE_EXE_DIR: path.dirname(process.execPath),
             PYTHONIOENCODING: 'utf-8',
             PYTHONLEGACYWINDOWSSTDIO: 'utf-8',
@@ -416,6 +421,10 @@ function stopVllmServer() {
 function handleHotkeyPress(isRecording) {
     console.log(`[MindVoice] Hotkey pressed, isRecording: ${isRecording}`);
     if (isRecording) {
+        if (store.get('apiProvider') === 'local') {
+            // The local model may have been unloaded while idle: start reloading it while the user speaks
+            require('./lib/api-service').preloadLocalServer();
+        }
         // Start listening mode
         trayManager.setState('recording');
         console.log('[MindVoice] Sending recording-state-change: true to renderer');
@@ -582,19 +591,8 @@ ipcMain.handle('set-auto-launch', (event, enabled) => {
 
 ipcMain.handle('test-connection', async () => {
     try {
-        const config = {
-            apiProvider: store.get('apiProvider'),
-            apiKey: store.get('apiKey'),
-            baseUrl: store.get('baseUrl'),
-            model: store.get('model'),
-            language: store.get('language'),
-            vllmUrl: store.get('vllmUrl'),
-            siliconFlowModel: store.get('siliconFlowModel'),
-            prompt: store.get('prompt')
-        };
-
         const APIService = require('./lib/api-service');
-        const apiService = new APIService(config);
+        const apiService = new APIService(getApiConfig());
         const success = await apiService.testConnection();
 
         return { success, error: null };
@@ -615,59 +613,72 @@ ipcMain.handle('clear-history', () => {
     return true;
 });
 
-ipcMain.on('stop-recording', async (event, audioData) => {
-    // 无论是手动按键停止还是 VAD 自动停止，都要重置快捷键状态
-    hotkeyManager.resetState();
-
-    try {
-        console.log(`[MindVoice] Received audio data (base64), length: ${audioData ? audioData.length : 0} chars`);
-        overlayWindow.webContents.send('show-message', 'Transcribing...', 'processing');
-
-        const buffer = Buffer.from(audioData, 'base64');
-        console.log(`[MindVoice] Buffer size: ${buffer.length} bytes`);
-
-        if (buffer.length === 0) {
-            throw new Error('录音数据为空，请检查麦克风权限');
-        }
+/**
+ * Build the APIService config from current settings
+ */
+function getApiConfig() {
+    return {
+        apiProvider: store.get('apiProvider'),
+        apiKey: store.get('apiKey'),
+        baseUrl: store.get('baseUrl'),
+        model: store.get('model'),
+        language: store.get('language'),
+        vllmUrl: store.get('vllmUrl'),
+        siliconFlowModel: store.get('siliconFlowModel'),
+        prompt: store.get('prompt'),
+        useHttp2: store.get('useHttp2'),
+        hedging: store.get('hedging'),
+        hedgeTargets: store.get('hedgeTargets'),
+        hedgeDelayMs: store.get('hedgeDelayMs')
+    };
+}
 
-        const apiProvider = store.get('apiProvider');
-        const APIService = require('./lib/api-service');
+/**
+ * Make sure the local/vLLM server for the current provider is up, starting it if needed
+ */
+async function ensureServerOnline(apiProvider) {
+    const APIService = require('./lib/api-service');
 
-        if (apiProvider === 'local') {
-            let isServerOnline = await APIService.checkLocalServer();
+    if (apiProvider === 'local') {
+        let isServerOnline = await APIService.checkLocalServer();
+        if (!isServerOnline) {
+            overlayWindow.webContents.send('show-message', '启动本地模型...', 'processing');
+            isServerOnline = await startLocalServer();
             if (!isServerOnline) {
-                overlayWindow.webContents.send('show-message', '启动本地模型...', 'processing');
-                isServerOnline = await startLocalServer();
-                if (!isServerOnline) {
-                    throw new Error('本地模型启动失败');
-                }
+                throw new Error('本地模型启动失败');
             }
-        } else if (apiProvider === 'vllm') {
-            const vllmUrl = store.get('vllmUrl') || 'http://localhost:8000';
-            let isVllmOnline = await APIService.checkVllmServer(vllmUrl);
+        }
+    } else if (apiProvider === 'vllm') {
+        const vllmUrl = store.get('vllmUrl') || 'http://localhost:8000';
+        let isVllmOnline = await APIService.checkVllmServer(vllmUrl);
+        if (!isVllmOnline) {
+            overlayWindow.webContents.send('show-message', '启动 vLLM...', 'processing');
+            isVllmOnline = await startVllmServer();
             if (!isVllmOnline) {
-                overlayWindow.webContents.send('show-message', '启动 vLLM...', 'processing');
-                isVllmOnline = await startVllmServer();
-                if (!isVllmOnline) {
-                    throw new Error(`vLLM 服务启动失败，请检查配置`);
-                }
+                throw new Error(`vLLM 服务启动失败，请检查配置`);
             }
         }
+    }
+}
 
-        const config = {
-            apiProvider,
-            apiKey: store.get('apiKey'),
-            baseUrl: store.get('baseUrl'),
-            model: store.get('model'),
-            language: store.get('language'),
-            vllmUrl: store.get('vllmUrl'),
-            siliconFlowModel: store.get('siliconFlowModel'),
-            prompt: store.get('prompt')
-        };
+/**
+ * Run a transcription and deliver the result: hallucination filter, history, paste, overlay
+ * @param {Function} transcribeFn - Receives an APIService, resolves to the transcribed text
+ */
+async function deliverTranscription(transcribeFn) {
+    // 无论是手动按键停止还是 VAD 自动停止，都要重置快捷键状态
+    hotkeyManager.resetState();
+
+    try {
+        overlayWindow.webContents.send('show-message', 'Transcribing...', 'processing');
+
+        const apiProvider = store.get('apiProvider');
+        const APIService = require('./lib/api-service');
+        await ensureServerOnline(apiProvider);
 
-        const apiService = new APIService(config);
+        const apiService = new APIService(getApiConfig());
         const startTime = Date.now();
-        const text = await apiService.transcribe(buffer, 'audio.wav');
+        const text = await transcribeFn(apiService);
         const duration = ((Date.now() - startTime) / 1000).toFixed(2);
         console.log(`[MindVoice] Transcription completed in ${duration}s`);
 
@@ -743,6 +754,115 @@ ipcMain.on('stop-recording', async (event, audioData) => {
         // Reset hotkey recording state so next press starts fresh
         hotkeyManager.resetState();
     }
+}
+
+ipcMain.on('stop-recording', async (event, audioData, filename = 'audio.wav') => {
+    await deliverTranscription(async (apiService) => {
+        // Accept raw bytes from the renderer; base64 strings are still understood for older callers
+        const buffer = typeof audioData === 'string' ? Buffer.from(audioData, 'base64') : Buffer.from(audioData || []);
+        console.log(`[MindVoice] Received audio data: ${buffer.length} bytes (${filename})`);
+
+        if (buffer.length === 0) {
+            throw new Error('录音数据为空，请检查麦克风权限');
+        }
+
+        return apiService.transcribe(buffer, filename);
+    });
+});
+
+// ============ Progressive Upload ============
+
+// The recording currently being streamed to the server while the user speaks
+let audioStream = null;
+
+ipcMain.on('audio-stream-start', (event, format) => {
+    const APIService = require('./lib/api-service');
+    const apiService = new APIService(getApiConfig());
+
+    audioStream = {
+        format,
+        apiService,
+        chunks: [],
+        seq: 0,
+        failed: false,
+        // Sessions are only opened for providers that support them; others upload once at the end
+        session: apiService.supportsStreaming()
+            ? apiService.startSession(format).catch((error) => {
+                console.log(`[MindVoice] Progressive upload unavailable, will upload at the end: ${error.message}`);
+                return null;
+            })
+            : Promise.resolve(null)
+    };
+    audioStream.chain = audioStream.session;
+    console.log(`[MindVoice] Audio stream started (${format})`);
+});
+
+ipcMain.on('audio-stream-chunk', (event, chunk, segmentEnd) => {
+    const stream = audioStream;
+    if (!stream) return;
+
+    const buffer = Buffer.from(chunk);
+    const seq = stream.seq++;
+    // Keep a copy so we can fall back to a one-shot upload if the session breaks
+    stream.chunks.push(buffer);
+
+    stream.chain = stream.chain.then(async () => {
+        const sessionId = await stream.session;
+        if (!sessionId || stream.failed) return;
+        try {
+            await stream.apiService.appendChunk(sessionId, seq, buffer, Boolean(segmentEnd));
+        } catch (error) {
+            console.log(`[MindVoice] Chunk upload failed, will upload at the end: ${error.message}`);
+            stream.failed = true;
+        }
+    });
+});
+
+ipcMain.on('audio-stream-abort', async () => {
+    const stream = audioStream;
+    audioStream = null;
+    if (!stream) return;
+
+    const sessionId = await stream.session;
+    if (sessionId) {
+        stream.apiService.abortSession(sessionId);
+    }
+});
+
+ipcMain.on('audio-stream-finish', async () => {
+    const stream = audioStream;
+    audioStream = null;
+    if (!stream) return;
+
+    await deliverTranscription(async (apiService) => {
+        await stream.chain;
+        const sessionId = await stream.session;
+        const total = stream.chunks.reduce((sum, chunk) => sum + chunk.length, 0);
+        console.log(`[MindVoice] Audio stream finished: ${stream.chunks.length} chunks, ${total} bytes`);
+
+        if (total === 0) {
+            throw new Error('录音数据为空，请检查麦克风权限');
+        }
+
+        const APIService = require('./lib/api-service');
+        const audio = Buffer.concat(stream.chunks);
+        const [recording, filename] = stream.format === 'pcm_f32le'
+            ? [APIService.float32ToWav(audio), 'audio.wav']
+            : [audio, `audio.${stream.format}`];
+
+        if (sessionId && !stream.failed) {
+            try {
+                // With hedging on, a slow finish also sends the whole recording to the other hedge targets
+                return await apiService.finishSessionHedged(sessionId, recording, filename);
+            } catch (error) {
+                console.log(`[MindVoice] Session finish failed, uploading whole recording: ${error.message}`);
+            }
+        } else if (sessionId) {
+            stream.apiService.abortSession(sessionId);
+        }
+
+        return apiService.transcribe(recording, filename);
+    });
 });
 
 // Voice activity state from renderer's VAD
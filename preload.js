@@ -14,7 +14,13 @@ contextBridge.exposeInMainWorld('electronAPI', {
     clearHistory: () => ipcRenderer.invoke('clear-history'),
 
     startRecording: () => ipcRenderer.send('start-recording'),
-    stopRecording: (audioData) => ipcRenderer.send('stop-recording', audioData),
+    stopRecording: (audioData, filename) => ipcRenderer.send('stop-recording', audioData, filename),
+
+    // Progressive upload: binary chunks are forwarded to the server while recording
+    audioStreamStart: (format) => ipcRenderer.send('audio-stream-start', format),
+    audioStreamChunk: (chunk, segmentEnd) => ipcRenderer.send('audio-stream-chunk', chunk, segmentEnd),
+    audioStreamFinish: () => ipcRenderer.send('audio-stream-finish'),
+    audioStreamAbort: () => ipcRenderer.send('audio-stream-abort'),
 
     voiceActivity: (state) => ipcRenderer.send('voice-activity', state),
 
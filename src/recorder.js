@@ -23,6 +23,12 @@ class AudioRecorder {
         this.silenceStartTime = null
         this.simpleVadInterval = null
         this.lastCountdownVal = null
+
+        // Pauses this long split the dictation into segments the server transcribes ahead of time
+        this.SEGMENT_PAUSE_MS = 600
+        this.pauseStartTime = null
+        this.segmentMarked = false
+        this.segmentPending = false
         
         // Silence countdown tracking
         this.silenceCountdown = 0
@@ -44,6 +50,10 @@ class AudioRecorder {
         // MediaRecorder for simple VAD
         this.mediaRecorder = null
         this.audioChunks = []
+
+        // Progressive upload: chunks go to the server while the user is still speaking
+        this.streaming = false
+        this.streamChain = Promise.resolve()
         
         // Audio visualizer
         this.audioContext = null
@@ -90,6 +100,9 @@ class AudioRecorder {
             this.listenStartTime = Date.now()
             this.silenceStartTime = null
             this.lastCountdownVal = null
+            this.pauseStartTime = null
+            this.segmentMarked = false
+            this.segmentPending = false
             this.vad = null
             this.useSimpleVAD = false
 
@@ -271,6 +284,12 @@ onSpeechEnd(audio) {
 
         console.log(`[VAD] Accepted: duration ${speechDuration}ms, volume ${volume.toFixed(4)}`)
 
+        // Upload each accepted segment right away as raw 16kHz float32 samples
+        if (!this.streaming) {
+            this.startStream('pcm_f32le')
+        }
+        this.streamChunk(audio.slice().buffer, true)
+
         // Accumulate audio (for multiple speech segments)
         if (!this.accumulatedAudio) {
             this.accumulatedAudio = audio.slice()
@@ -332,6 +351,8 @@ onSpeechEnd(audio) {
         this.mediaRecorder.ondataavailable = (event) => {
             if (event.data.size > 0) {
                 this.audioChunks.push(event.data)
+                this.streamChunk(event.data, this.segmentPending)
+                this.segmentPending = false
             }
         }
 
@@ -345,23 +366,13 @@ onSpeechEnd(audio) {
                 return
             }
 
-            const audioBlob = new Blob(this.audioChunks, { type: 'audio/webm' })
-            console.log(`[SimpleVAD] Sending ${audioBlob.size} bytes`)
-            const arrayBuffer = await audioBlob.arrayBuffer()
-            const bytes = new Uint8Array(arrayBuffer)
-            let binary = ''
-            const len = bytes.byteLength
-            const CHUNK_SIZE = 0x8000
-
-            for (let i = 0; i < len; i += CHUNK_SIZE) {
-                binary += String.fromCharCode.apply(null, bytes.subarray(i, Math.min(i + CHUNK_SIZE, len)))
-            }
-
-            const base64 = btoa(binary)
-            window.electronAPI.stopRecording(base64)
+            // Chunks were already streamed as they arrived; only the tail is left to flush
+            console.log(`[SimpleVAD] Finishing stream of ${this.audioChunks.length} chunks`)
+            await this.finishStream()
             this.cleanup()
         }
 
+        this.startStream('webm')
         this.mediaRecorder.start(500)
         this.useSimpleVAD = true
         this.setState('listening')
@@ -398,6 +409,8 @@ onSpeechEnd(audio) {
             if (isSpeechFrame) {
                 this.silenceStartTime = null
                 this.lastCountdownVal = null
+                this.pauseStartTime = null
+                this.segmentMarked = false
                 
                 const exceedRatio = Math.min(2.0, avgLevel / dynamicThreshold)
                 const penalty = 8 * exceedRatio
@@ -414,6 +427,17 @@ onSpeechEnd(audio) {
             } else {
                 if (this.hasSpeechStarted) {
                     this.noiseFloor = (this.noiseFloor * 0.995) + (avgLevel * 0.005)
+
+                    // Flush what we have at a pause so the server can transcribe it while the user keeps talking
+                    if (!this.pauseStartTime) {
+                        this.pauseStartTime = now
+                    } else if (!this.segmentMarked && now - this.pauseStartTime >= this.SEGMENT_PAUSE_MS) {
+                        this.segmentMarked = true
+                        this.segmentPending = true
+                        if (this.mediaRecorder && this.mediaRecorder.state === 'recording') {
+                            this.mediaRecorder.requestData()
+                        }
+                    }
                     
                     if (this.autoStopEnabled) {
                         // If stopDelay is 0, stop immediately on first silence frame
@@ -484,26 +508,48 @@ onSpeechEnd(audio) {
             return
         }
 
-        console.log(`[Recorder] Converting ${audio.length} samples to WAV...`)
+        this.accumulatedAudio = null
 
-        const wavBuffer = this.float32ToWav(audio)
-        console.log(`[Recorder] WAV size: ${wavBuffer.byteLength} bytes`)
+        if (this.streaming) {
+            // Segments were uploaded as they ended; just close the stream
+            console.log(`[Recorder] Finishing stream, ${audio.length} samples total`)
+            this.finishStream()
+        } else {
+            console.log(`[Recorder] Converting ${audio.length} samples to WAV...`)
+            const wavBuffer = this.float32ToWav(audio)
+            console.log(`[Recorder] Sending WAV: ${wavBuffer.byteLength} bytes`)
+            window.electronAPI.stopRecording(new Uint8Array(wavBuffer), 'audio.wav')
+        }
+        this.cleanup()
+    }
 
-        const bytes = new Uint8Array(wavBuffer)
-        let binary = ''
-        const len = bytes.byteLength
-        const CHUNK_SIZE = 0x8000
+    // ============ Progressive Upload ============
 
-        for (let i = 0; i < len; i += CHUNK_SIZE) {
-            binary += String.fromCharCode.apply(null, bytes.subarray(i, Math.min(i + CHUNK_SIZE, len)))
-        }
+    startStream(format) {
+        this.streaming = true
+        this.streamChain = Promise.resolve()
+        window.electronAPI.audioStreamStart(format)
+    }
 
-        const base64 = btoa(binary)
-        console.log(`[Recorder] Sending ${base64.length} chars base64 audio`)
-        
-        this.accumulatedAudio = null
-        window.electronAPI.stopRecording(base64)
-        this.cleanup()
+    streamChunk(data, segmentEnd = false) {
+        if (!this.streaming) return
+        // Blob.arrayBuffer() is async; chain so chunks reach main in recording order
+        this.streamChain = this.streamChain.then(async () => {
+            const buffer = data instanceof Blob ? await data.arrayBuffer() : data
+            window.electronAPI.audioStreamChunk(new Uint8Array(buffer), segmentEnd)
+        })
+    }
+
+    async finishStream() {
+        this.streaming = false
+        await this.streamChain
+        window.electronAPI.audioStreamFinish()
+    }
+
+    abortStream() {
+        if (!this.streaming) return
+        this.streaming = false
+        this.streamChain.then(() => window.electronAPI.audioStreamAbort())
     }
 
     float32ToWav(samples) {
@@ -586,6 +632,9 @@ onSpeechEnd(audio) {
     }
 
     cleanup() {
+        // Drop any upload session that wasn't finished (no speech, error)
+        this.abortStream()
+
         // Destroy VAD (pause first if running)
         if (this.vad) {
             this.vad.pause().catch(() => {})
@@ -0,0 +1,26 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def _load(module_name: str, filename: str):
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def whisper_causal():
+    """whisper_causal_backup.py is a vLLM model file with package-relative
+    imports; load it and its sibling as if they lived in `vllm.model_executor.models`."""
+    pytest.importorskip("vllm")
+    _load("vllm.model_executor.models.whisper_causal_streaming", "whisper_causal_streaming.py")
+    return _load("vllm.model_executor.models.whisper_causal_backup", "whisper_causal_backup.py")
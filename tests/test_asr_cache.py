@@ -0,0 +1,109 @@
+import pickle
+
+import numpy as np
+
+from asr_cache import (
+    CachedFeatureExtractor, EncoderCache, audio_scope, cache_module_forward, cached_features, content_key,
+    scope_cached,
+)
+
+
+def test_content_key_follows_raw_audio():
+    audio = np.arange(16000, dtype=np.float32)
+    assert content_key(audio) == content_key(audio.copy())
+    assert content_key(audio) != content_key(audio[:-1])
+    assert content_key(audio) != content_key(audio.astype(np.float64))
+    assert content_key(audio, "a") != content_key(audio, "b")
+    assert content_key(object()) is None
+
+
+def test_lru_evicts_by_bytes():
+    cache = EncoderCache(max_bytes=2000)
+    cache.put("a", np.zeros(200, dtype=np.float32))
+    cache.put("b", np.zeros(200, dtype=np.float32))
+    assert cache.get("a") is not None  # a is now most recent
+    cache.put("c", np.zeros(200, dtype=np.float32))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    status = cache.status()
+    assert (status["hits"], status["misses"], status["evictions"]) == (3, 1, 1)
+
+
+class Encoder:
+    def __init__(self):
+        self.calls = 0
+
+    def forward(self, features):
+        self.calls += 1
+        return features.sum(axis=-1)
+
+
+class Extractor:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, audio):
+        self.calls += 1
+        return {"input_features": np.stack([audio, audio * 2]), "attention_mask": np.ones(len(audio), dtype=np.int32)}
+
+
+def run(encoder, extractor, cache, audio):
+    with audio_scope(audio, cache=cache):
+        features = cached_features(extractor, audio)
+        # Two encoder calls per request, like a model that encodes in windows
+        return [encoder.forward(features["input_features"][:, :2]), encoder.forward(features["input_features"][:, 2:])], \
+            features["attention_mask"]
+
+
+def test_hit_skips_feature_extraction_and_encoder():
+    cache = EncoderCache(max_bytes=1 << 20)
+    encoder, extractor = Encoder(), Extractor()
+    cache_module_forward(encoder, cache)
+    audio = np.array([1.0, 2.0, 3.0, 4.0], dtype=np.float32)
+
+    assert not scope_cached(cache, audio)
+    first, mask = run(encoder, extractor, cache, audio)
+    assert (extractor.calls, encoder.calls) == (1, 2)
+    assert scope_cached(cache, audio.copy())
+
+    second, cached_mask = run(encoder, extractor, cache, audio.copy())
+    assert (extractor.calls, encoder.calls) == (1, 2)
+    assert all(np.array_equal(a, b) for a, b in zip(first, second))
+    assert np.array_equal(mask, cached_mask)
+
+    # Different audio misses
+    run(encoder, extractor, cache, audio + 1)
+    assert (extractor.calls, encoder.calls) == (2, 4)
+
+
+def test_evicted_encoder_output_extracts_again():
+    cache = EncoderCache(max_bytes=1 << 20)
+    encoder, extractor = Encoder(), Extractor()
+    cache_module_forward(encoder, cache)
+    audio = np.array([1.0, 2.0, 3.0, 4.0], dtype=np.float32)
+    run(encoder, extractor, cache, audio)
+
+    cache._entries.pop(f"{content_key(audio)}:1")
+    assert not scope_cached(cache, audio)
+    run(encoder, extractor, cache, audio)
+    assert (extractor.calls, encoder.calls) == (2, 3)
+
+
+def test_outside_scope_nothing_is_cached():
+    cache = EncoderCache(max_bytes=1 << 20)
+    encoder, extractor = Encoder(), Extractor()
+    cache_module_forward(encoder, cache)
+    audio = np.ones(4, dtype=np.float32)
+    for _ in range(2):
+        encoder.forward(cached_features(extractor, audio)["input_features"])
+    assert (extractor.calls, encoder.calls) == (2, 2)
+    assert cache.status()["entries"] == 0
+
+
+def test_cached_feature_extractor_wraps_and_pickles_plain():
+    extractor = Extractor()
+    wrapped = CachedFeatureExtractor(extractor)
+    assert wrapped.calls == 0
+    wrapped(np.ones(4, dtype=np.float32))
+    assert extractor.calls == 1
+    assert isinstance(pickle.loads(pickle.dumps(wrapped)), Extractor)
@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+
+import pytest
+
+from asr_decoding import (
+    MIN_NEW_TOKENS, configure_generation, is_static_cache_error, run_with_static_fallback, token_budget,
+)
+
+
+def test_token_budget_scales_with_duration_and_caps():
+    assert token_budget(0, 512) == MIN_NEW_TOKENS
+    assert token_budget(2.0, 512) == MIN_NEW_TOKENS + 30
+    assert token_budget(0.1, 512) == MIN_NEW_TOKENS + 2  # rounds up
+    assert token_budget(600, 512) == 512
+
+
+def test_static_cache_errors_are_recognised_narrowly():
+    assert is_static_cache_error(ValueError(
+        "This model does not support `cache_implementation='static'`. Please check the following issue"))
+    assert is_static_cache_error(ValueError("assisted generate is not supported with Static cache classes`"))
+    # Generic errors that merely mention caches or compilation are real failures
+    assert not is_static_cache_error(ValueError("bad cache_position for input"))
+    assert not is_static_cache_error(RuntimeError("compile step failed: shape mismatch"))
+    assert not is_static_cache_error(NotImplementedError("static"))
+    assert not is_static_cache_error(RuntimeError("CUDA out of memory"))
+
+
+def test_dynamo_errors_are_static_cache_errors():
+    exc = pytest.importorskip("torch._dynamo.exc")
+    assert is_static_cache_error(exc.Unsupported("graph break"))
+    assert is_static_cache_error(exc.BackendCompilerFailed(lambda: None, RuntimeError("boom"), None))
+
+
+class FakeModel:
+    static_cache = True
+    compile_decoder = True
+
+    def __init__(self):
+        self.module = type("Module", (), {})()
+        self.module.forward = "compiled"
+        self.module._mindvoice_compiled = True
+
+    def get_model_name(self):
+        return "fake"
+
+    def torch_module(self):
+        return self.module
+
+
+def test_fallback_disables_static_cache_and_retries_once():
+    model = FakeModel()
+    calls = []
+
+    def generate():
+        calls.append(model.static_cache)
+        if model.static_cache:
+            raise ValueError("This model does not support `cache_implementation='static'`.")
+        return "ok"
+
+    assert run_with_static_fallback(model, generate) == "ok"
+    assert calls == [True, False]
+    assert not model.static_cache and not model.compile_decoder
+    assert "forward" not in model.module.__dict__
+
+
+def test_fallback_reraises_unrelated_errors():
+    model = FakeModel()
+
+    def generate():
+        raise ValueError("cache is full")
+
+    with pytest.raises(ValueError):
+        run_with_static_fallback(model, generate)
+    assert model.static_cache
+
+
+def test_configure_generation_modes():
+    module = SimpleNamespace(generation_config=SimpleNamespace())
+    assert configure_generation(module, prompt_lookup_num_tokens=4) == "prompt_lookup"
+    assert module.generation_config.prompt_lookup_num_tokens == 4
+    # Assisted decoding needs batch size 1 and a dynamic cache; it wins over the static cache
+    assert configure_generation(module, 4, static_cache=True) == "prompt_lookup"
+    assert module.generation_config.cache_implementation is None
+    assert configure_generation(module, 4, static_cache=True, batch_size=2) == "static"
+    assert module.generation_config.prompt_lookup_num_tokens is None
+    assert module.generation_config.cache_implementation == "static"
+    assert configure_generation(module) == "greedy"
+    assert configure_generation(SimpleNamespace(), 4) == "greedy"
+
+
+def test_prompt_lookup_matches_greedy():
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+
+    torch.manual_seed(0)
+    config = transformers.Qwen3Config(
+        vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, head_dim=8,
+    )
+    model = transformers.Qwen3ForCausalLM(config).eval()
+    # Repeated n-grams in the context give prompt lookup something to draft from
+    input_ids = torch.tensor([[5, 6, 7, 8, 9, 5, 6, 7, 8, 9, 5, 6, 7]])
+
+    outputs = {}
+    for lookup in (0, 3):
+        configure_generation(model, prompt_lookup_num_tokens=lookup)
+        with torch.no_grad():
+            outputs[lookup] = model.generate(input_ids, max_new_tokens=24, do_sample=False,
+                                             eos_token_id=None, pad_token_id=0)
+    assert torch.equal(outputs[0], outputs[3])
@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from asr_disagg import QwenSplitRuntime  # noqa: E402
+from asr_onnx import build_prompt  # noqa: E402
+
+EOS = 1
+
+
+class CharTokenizer:
+    """One token per character, enough for the prompt text the runtime embeds."""
+
+    def __call__(self, text, add_special_tokens=False, return_tensors="pt"):
+        ids = torch.tensor([[2 + ord(c) % 60 for c in text]])
+        return type("Encoding", (), {"input_ids": ids})()
+
+    def decode(self, tokens, **kwargs):
+        return "".join(chr(ord("a") + t % 26) for t in tokens)
+
+
+def tiny_runtime():
+    torch.manual_seed(0)
+    config = transformers.Qwen3Config(
+        vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, head_dim=8,
+    )
+    lm = transformers.Qwen3ForCausalLM(config).eval()
+    runtime = QwenSplitRuntime.__new__(QwenSplitRuntime)
+    runtime.thinker = lm
+    runtime.tokenizer = CharTokenizer()
+    runtime.embed = lm.get_input_embeddings()
+    runtime.device = torch.device("cpu")
+    runtime.dtype = torch.float32
+    runtime.mrope = False
+    runtime.eos_ids = {EOS}
+    runtime.prompt_config = {"prompt_prefix": "<s>{context}<a>", "prompt_suffix": "</a>"}
+    runtime.parse_output = None
+    return runtime, lm
+
+
+def test_batched_decode_matches_greedy_generate():
+    runtime, lm = tiny_runtime()
+    requests = [
+        (torch.randn(7, 32), None, None),
+        (torch.randn(3, 32), "English", "hotword list"),
+        (torch.randn(12, 32), None, "x"),
+    ]
+
+    batched = runtime.decode_batch(requests, max_new_tokens=8)
+
+    for (embeds, language, prompt), (text, _, _, count) in zip(requests, batched):
+        # Left padding in the batch must not change what each request decodes on its own
+        assert runtime.decode_batch([(embeds, language, prompt)], max_new_tokens=8)[0][0] == text
+
+        prefix, suffix = build_prompt(prompt, language, runtime.prompt_config)
+        with torch.no_grad():
+            inputs = torch.cat([runtime.embed(runtime._ids(prefix)), embeds, runtime.embed(runtime._ids(suffix))])
+            expected = lm.generate(inputs_embeds=inputs[None], max_new_tokens=8, do_sample=False,
+                                   eos_token_id=EOS, pad_token_id=EOS)[0].tolist()
+        expected = [t for t in expected if t != EOS]
+        assert count == len(expected)
+        assert text == runtime.tokenizer.decode(expected)
+
+
+@pytest.mark.skipif(not os.environ.get("QWEN3_ASR_MODEL"), reason="set QWEN3_ASR_MODEL to a Qwen3-ASR checkpoint")
+def test_disaggregated_matches_normal_mode():
+    qwen_asr = pytest.importorskip("qwen_asr")
+    from asr_disagg import DisaggregatedExecutor
+
+    wrapper = qwen_asr.Qwen3ASRModel.from_pretrained(os.environ["QWEN3_ASR_MODEL"], dtype=torch.float32,
+                                                     device_map="cpu", max_new_tokens=128)
+    rng = np.random.default_rng(0)
+    audios = [rng.standard_normal(int(16000 * seconds)).astype(np.float32) * 0.01 for seconds in (0.3, 4, 35)]
+    normal = wrapper.transcribe(audio=[(a, 16000) for a in audios], language=None)
+
+    options = {f"{phase}_{key}": value for phase in ("encoder", "decoder")
+               for key, value in (("max_batch", 4), ("max_wait_ms", 10), ("workers", 1))}
+    executor = DisaggregatedExecutor(QwenSplitRuntime(wrapper), options, max_new_tokens=128)
+    try:
+        split = executor.transcribe_batch(audios)
+    finally:
+        executor.stop()
+    assert [(text, language) for text, language, _ in split] == [(r.text, r.language) for r in normal]
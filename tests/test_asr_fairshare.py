@@ -0,0 +1,86 @@
+import hashlib
+
+import pytest
+
+import asr_fairshare
+from asr_fairshare import FairShare, RateLimited, TokenBucket, client_identity, parse_weights, trusted_clients
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(asr_fairshare.time, "monotonic", clock)
+    return clock
+
+
+def test_token_bucket_refills_at_rate(clock):
+    bucket = TokenBucket(rate=2.0, burst=10.0)
+    assert bucket.take(8) == 0.0
+    assert bucket.take(4) == pytest.approx(1.0)  # 2 left, needs 2 more at 2/s
+    clock.now += 1.0
+    assert bucket.take(4) == 0.0
+    # Costs above the burst are let through once the bucket is full
+    clock.now += 100
+    assert bucket.take(50) == 0.0
+
+
+def test_admission_rate_limits_per_client(clock):
+    fair = FairShare(rate_sec_per_sec=1.0, burst_sec=30.0)
+    assert fair.admit("a", 25) == 25
+    with pytest.raises(RateLimited) as excinfo:
+        fair.admit("a", 10)
+    assert excinfo.value.retry_after == pytest.approx(5.0)
+    # Other clients and internal work are not affected
+    assert fair.admit("b", 25) == 25
+    assert fair.admit(None, 1000) == 1000
+    clock.now += 5
+    assert fair.admit("a", 10) == 10
+
+
+def test_admission_caps_queued_audio():
+    fair = FairShare(max_queued_sec=60.0)
+    fair.admit("a", 50)
+    with pytest.raises(RateLimited):
+        fair.admit("a", 20)
+    fair.release("a", 50)
+    assert fair.admit("a", 20) == 20
+
+
+def test_short_requests_cost_at_least_min_cost():
+    fair = FairShare(min_cost_sec=1.0)
+    assert fair.admit("a", 0.2) == 1.0
+
+
+def test_start_time_fair_queuing_tags():
+    fair = FairShare(weights={"heavy": 2.0})
+    # Back-to-back requests from one client get increasing tags
+    assert fair.tag("a", 10) == 0.0
+    assert fair.tag("a", 10) == 10.0
+    # A new client starts at the current virtual time, ahead of a's backlog
+    assert fair.tag("b", 10) == 0.0
+    # Twice the weight advances half as fast
+    assert fair.tag("heavy", 10) == 0.0
+    assert fair.tag("heavy", 10) == 5.0
+    # Once work tagged 10 has started, a client that was idle cannot claim the past
+    fair.dispatched(10.0)
+    assert fair.tag("c", 10) == 10.0
+    assert fair.tag("b", 10) == 10.0
+
+
+def test_client_identity_trusts_only_configured_ids():
+    trusted = trusted_clients(parse_weights("id:batch=0.5"), ["key:" + "0" * 12, "ip:1.2.3.4"])
+    assert trusted == {"id:batch", "key:" + "0" * 12}
+    assert client_identity(None, "batch", "10.0.0.1", trusted) == "id:batch"
+    assert client_identity(None, "made-up", "10.0.0.1", trusted) == "ip:10.0.0.1"
+    assert client_identity("Bearer secret", None, "10.0.0.1", trusted) == "ip:10.0.0.1"
+    assert client_identity("Bearer secret", "batch", "10.0.0.1") == "ip:10.0.0.1"
+    key = "key:" + hashlib.sha256(b"secret").hexdigest()[:12]
+    assert client_identity("Bearer secret", None, None, {key}) == key
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from asr_onnx import PROMPT_PREFIX, PROMPT_SUFFIX, build_prompt, derive_prompt_template, split_language
+
+
+class ChatProcessor:
+    """Renders conversations the way Qwen3-ASR's chat template does."""
+
+    def __init__(self, system=True):
+        self.system = system
+
+    def apply_chat_template(self, conversation, add_generation_prompt=False, tokenize=True):
+        assert not tokenize and add_generation_prompt
+        text = ""
+        for message in conversation:
+            if message["role"] == "system":
+                if self.system:
+                    text += f"<|im_start|>system\n{message['content']}<|im_end|>\n"
+                continue
+            text += "<|im_start|>user\n<|audio_start|><|audio_pad|><|audio_end|><|im_end|>\n"
+        return text + "<|im_start|>assistant\n"
+
+
+class BrokenProcessor:
+    def apply_chat_template(self, *args, **kwargs):
+        raise ValueError("no chat template")
+
+
+def test_derive_prompt_template_splits_at_audio():
+    prefix, suffix = derive_prompt_template(ChatProcessor())
+    assert prefix == "<|im_start|>system\n{context}<|im_end|>\n<|im_start|>user\n<|audio_start|>"
+    assert suffix == "<|audio_end|><|im_end|>\n<|im_start|>assistant\n"
+
+    config = {"prompt_prefix": prefix, "prompt_suffix": suffix}
+    prefix, suffix = build_prompt(" hotwords ", "English", config)
+    assert prefix.startswith("<|im_start|>system\nhotwords<|im_end|>")
+    assert suffix.endswith("<|im_start|>assistant\nlanguage English<asr_text>")
+
+
+def test_derive_prompt_template_falls_back():
+    assert derive_prompt_template(BrokenProcessor()) == (PROMPT_PREFIX, PROMPT_SUFFIX)
+    # A template without a system turn still splits, the prompt just has nowhere to go
+    prefix, _ = derive_prompt_template(ChatProcessor(system=False))
+    assert "{context}" not in prefix and prefix.endswith("<|audio_start|>")
+
+
+def test_split_language():
+    assert split_language("language Chinese<asr_text> 你好 ", None) == ("你好", "Chinese")
+    assert split_language("hello", "English") == ("hello", "English")
+    assert split_language("hello", None) == ("hello", "unknown")
+
+
+def test_embedding_table_is_exported_in_fp32():
+    torch = pytest.importorskip("torch")
+    from asr_onnx import embedding_table
+
+    embed = torch.nn.Embedding(16, 8).to(torch.bfloat16)
+    table = embedding_table(embed)
+    assert table.dtype == np.float32 and table.shape == (16, 8)
+    # Upcast exactly, with no extra rounding through a half-precision type
+    assert np.array_equal(table, embed.weight.float().detach().numpy())
@@ -0,0 +1,87 @@
+import asyncio
+
+from asr_pipeline import Pipeline, Stage
+
+
+def rank(context):
+    return (0 if context["priority"] == "interactive" else 1, context.get("deadline", float("inf")))
+
+
+def test_stage_dequeues_by_priority_then_deadline():
+    order = []
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def work(context):
+            if context["name"] == "blocker":
+                await gate.wait()
+            order.append(context["name"])
+
+        pipeline = Pipeline([Stage("work", work, workers=1, queue_size=8)], rank=rank)
+        pipeline.start()
+        submits = [asyncio.create_task(pipeline.submit({"name": "blocker", "priority": "bulk"}))]
+        await asyncio.sleep(0.01)
+        for name, priority, deadline in [("bulk", "bulk", 1.0), ("late", "interactive", 9.0),
+                                         ("early", "interactive", 2.0), ("none", "interactive", None)]:
+            context = {"name": name, "priority": priority}
+            if deadline is not None:
+                context["deadline"] = deadline
+            submits.append(asyncio.create_task(pipeline.submit(context)))
+        await asyncio.sleep(0.01)
+        gate.set()
+        await asyncio.gather(*submits)
+        await pipeline.stop()
+
+    asyncio.run(main())
+    assert order == ["blocker", "early", "late", "none", "bulk"]
+
+
+def test_reserved_workers_let_interactive_pass_busy_bulk():
+    done = []
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def work(context):
+            if context["priority"] == "bulk":
+                await gate.wait()
+            done.append(context["name"])
+
+        stage = Stage("model", work, workers=3, queue_size=8, reserved=1)
+        pipeline = Pipeline([stage], rank=rank)
+        pipeline.start()
+        bulk = [asyncio.create_task(pipeline.submit({"name": f"bulk{i}", "priority": "bulk"})) for i in range(4)]
+        await asyncio.sleep(0.01)
+        assert stage.status()["active"] == 2
+        assert stage.status()["queued"] == 2
+
+        await asyncio.wait_for(pipeline.submit({"name": "dictation", "priority": "interactive"}), timeout=1)
+        assert done == ["dictation"]
+        gate.set()
+        await asyncio.gather(*bulk)
+        await pipeline.stop()
+
+    asyncio.run(main())
+    assert sorted(done[1:]) == ["bulk0", "bulk1", "bulk2", "bulk3"]
+
+
+def test_full_queue_still_admits_interactive():
+    async def main():
+        gate = asyncio.Event()
+
+        async def work(context):
+            if context["priority"] == "bulk":
+                await gate.wait()
+
+        pipeline = Pipeline([Stage("work", work, workers=2, queue_size=2, reserved=1)], rank=rank)
+        pipeline.start()
+        # One bulk running, two filling the queue, one blocked on backpressure
+        bulk = [asyncio.create_task(pipeline.submit({"name": i, "priority": "bulk"})) for i in range(4)]
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(pipeline.submit({"name": "dictation", "priority": "interactive"}), timeout=1)
+        gate.set()
+        await asyncio.gather(*bulk)
+        await pipeline.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+import asyncio
+
+import numpy as np
+
+from asr_scheduler import Scheduler
+
+SAMPLE_RATE = 16000
+
+
+def audio(seconds: float) -> np.ndarray:
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+
+def test_classify_caps_claimed_interactive():
+    scheduler = Scheduler(None, interactive_max_sec=60, interactive_cap_sec=300, sample_rate=SAMPLE_RATE)
+    assert scheduler.classify(10, None) == "interactive"
+    assert scheduler.classify(120, None) == "bulk"
+    assert scheduler.classify(120, "interactive") == "interactive"
+    assert scheduler.classify(3600, "interactive") == "bulk"
+    assert scheduler.classify(None, "interactive") == "bulk"
+    assert scheduler.classify(5, "bulk") == "bulk"
+
+
+def test_long_interactive_claim_is_split_like_bulk():
+    scheduler = Scheduler(None, bulk_chunk_sec=30, interactive_cap_sec=300, sample_rate=SAMPLE_RATE)
+    assert scheduler.will_split(audio(3600), "interactive")
+    assert not scheduler.will_split(audio(120), "interactive")
+
+
+def test_long_interactive_claim_waits_behind_real_interactive():
+    order = []
+
+    async def execute(chunk, language, prompt):
+        order.append(round(len(chunk) / SAMPLE_RATE))
+        await asyncio.sleep(0)
+        return chunk
+
+    async def main():
+        scheduler = Scheduler(execute, concurrency=1, bulk_chunk_sec=1000, interactive_cap_sec=300,
+                              sample_rate=SAMPLE_RATE)
+        scheduler.start()
+        # Hold the only slot so both requests are queued before either is dispatched
+        gate = asyncio.Event()
+        blocker = asyncio.create_task(scheduler.run_bulk(gate.wait, duration=0))
+        await asyncio.sleep(0)
+        fake = asyncio.create_task(scheduler.submit(audio(900), priority="interactive"))
+        real = asyncio.create_task(scheduler.submit(audio(5), priority="interactive"))
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(blocker, fake, real)
+        await scheduler.stop()
+
+    asyncio.run(main())
+    assert order == [5, 900]
+
+
+def test_deadline_beats_other_clients_smaller_fair_tag():
+    from asr_fairshare import FairShare
+
+    order = []
+
+    async def execute(chunk, language, prompt):
+        order.append(language)
+        await asyncio.sleep(0)
+        return chunk
+
+    async def main():
+        scheduler = Scheduler(execute, concurrency=1, sample_rate=SAMPLE_RATE, fairness=FairShare())
+        scheduler.start()
+        gate = asyncio.Event()
+        blocker = asyncio.create_task(scheduler.run_bulk(gate.wait, duration=0))
+        await asyncio.sleep(0)
+        # a's 20s backlog pushes a's later tags past b's
+        jobs = [
+            scheduler.submit(audio(20), language="a-backlog", client="a"),
+            scheduler.submit(audio(5), language="a-deadline", client="a", deadline_ms=60_000),
+            scheduler.submit(audio(5), language="b-none", client="b"),
+            scheduler.submit(audio(5), language="b-late", client="b", deadline_ms=120_000),
+            scheduler.submit(audio(5), language="b-none-2", client="b"),
+        ]
+        tasks = [asyncio.create_task(job) for job in jobs]
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(blocker, *tasks)
+        await scheduler.stop()
+
+    asyncio.run(main())
+    # Fair-share tags alone would run a-deadline last (tag 20). Deadlines go first, earliest
+    # first; the rest follow their tags (a-backlog 0, b-none 0, b-none-2 10)
+    assert order == ["a-deadline", "b-late", "a-backlog", "b-none", "b-none-2"]
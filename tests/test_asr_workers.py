@@ -0,0 +1,45 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+pytest.importorskip("torch")
+
+from asr_workers import WorkerPool, partition_cores  # noqa: E402
+
+
+def crashing_model(config):
+    os._exit(3)
+
+
+def test_partition_cores_spreads_remainder_first():
+    assert partition_cores(3, list(range(8))) == [[0, 1, 2], [3, 4, 5], [6, 7]]
+    assert partition_cores(4, [0, 1]) == [[0], [1]]
+
+
+def test_crashing_worker_backs_off_then_fails_pool():
+    async def main():
+        pool = WorkerPool(1, crashing_model, {}, max_restarts=2, restart_backoff_sec=0.01)
+        pool.start()
+        try:
+            # Queued before the first crash: failed with the crash, not left waiting
+            with pytest.raises(RuntimeError, match="异常退出"):
+                await asyncio.wait_for(pool.transcribe("missing.wav"), timeout=60)
+
+            deadline = time.monotonic() + 60
+            while not pool.failed and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+            status = pool.status()
+            assert status["failed"] and status["failed_workers"] == [0]
+            assert status["restarts"] == {"0": 3}
+
+            t_start = time.monotonic()
+            with pytest.raises(RuntimeError, match="已失效"):
+                await pool.transcribe("missing.wav")
+            assert time.monotonic() - t_start < 0.5
+            assert status["pending"] == 0
+        finally:
+            pool.stop()
+
+    asyncio.run(main())
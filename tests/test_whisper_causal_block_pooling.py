@@ -0,0 +1,120 @@
+"""Equivalence and throughput of `BlockPoolingMetadataScaler` against the
+deep-copy rescale it replaced, on CPU tensors."""
+
+import copy
+import time
+from dataclasses import dataclass
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("vllm")
+
+
+def scale_metadata_reference(common_attn_metadata, block_pool_size: int):
+    """The original deep-copy implementation of the block-pooling builder."""
+    new_common_attn_metadata = copy.deepcopy(common_attn_metadata)
+    new_common_attn_metadata.query_start_loc *= block_pool_size
+    new_common_attn_metadata.query_start_loc_cpu *= block_pool_size
+    new_common_attn_metadata.seq_lens *= block_pool_size
+    new_common_attn_metadata._seq_lens_cpu *= block_pool_size
+    new_common_attn_metadata._num_computed_tokens_cpu *= block_pool_size
+    new_common_attn_metadata.num_actual_tokens *= block_pool_size
+    new_common_attn_metadata.max_query_len *= block_pool_size
+    new_common_attn_metadata.max_seq_len *= block_pool_size
+    original_slot_mapping = common_attn_metadata.slot_mapping
+    new_common_attn_metadata.slot_mapping = (
+        (
+            original_slot_mapping.unsqueeze(1) * block_pool_size
+            + torch.arange(block_pool_size, device=original_slot_mapping.device)
+        )
+        .flatten()
+        .clamp(min=-1)
+    )
+    return new_common_attn_metadata
+
+
+@dataclass
+class FakeAttentionMetadata:
+    """Stand-in carrying the fields the block-pooling rescale touches."""
+
+    query_start_loc: "torch.Tensor"
+    query_start_loc_cpu: "torch.Tensor"
+    seq_lens: "torch.Tensor"
+    _seq_lens_cpu: "torch.Tensor"
+    _num_computed_tokens_cpu: "torch.Tensor"
+    num_actual_tokens: int
+    max_query_len: int
+    max_seq_len: int
+    slot_mapping: "torch.Tensor"
+    block_table_tensor: "torch.Tensor"
+
+
+def make_metadata(num_reqs: int, query_len: int = 16, context_len: int = 1500):
+    query_lens = torch.full((num_reqs,), query_len, dtype=torch.int32)
+    query_start_loc = torch.zeros(num_reqs + 1, dtype=torch.int32)
+    query_start_loc[1:] = query_lens.cumsum(0)
+    seq_lens = query_lens + context_len
+    num_tokens = num_reqs * query_len
+    slot_mapping = torch.arange(num_tokens, dtype=torch.int64)
+    slot_mapping[-1] = -1  # padded token
+    return FakeAttentionMetadata(
+        query_start_loc=query_start_loc.clone(),
+        query_start_loc_cpu=query_start_loc,
+        seq_lens=seq_lens.clone(),
+        _seq_lens_cpu=seq_lens.clone(),
+        _num_computed_tokens_cpu=torch.full((num_reqs,), context_len, dtype=torch.int32),
+        num_actual_tokens=num_tokens,
+        max_query_len=query_len,
+        max_seq_len=query_len + context_len,
+        slot_mapping=slot_mapping,
+        block_table_tensor=torch.zeros(num_reqs, 64, dtype=torch.int32),
+    )
+
+
+def assert_metadata_equal(actual, expected, fields):
+    for name in (*fields, "slot_mapping"):
+        a, b = getattr(actual, name), getattr(expected, name)
+        assert a.dtype == b.dtype and torch.equal(a, b), name
+    for name in ("num_actual_tokens", "max_query_len", "max_seq_len"):
+        assert getattr(actual, name) == getattr(expected, name), name
+
+
+@pytest.mark.parametrize("block_pool_size", [2, 4])
+def test_scaler_matches_deepcopy(whisper_causal, block_pool_size):
+    scaler = whisper_causal.BlockPoolingMetadataScaler(block_pool_size)
+    fields = scaler._TENSOR_FIELDS
+    # grow, shrink and grow again to exercise buffer growth and reuse
+    for num_reqs in (1, 16, 32, 16, 32):
+        metadata = make_metadata(num_reqs)
+        expected = scale_metadata_reference(metadata, block_pool_size)
+        assert_metadata_equal(scaler.scale(metadata), expected, fields)
+        scaler.record_use()
+        # the input must be left untouched
+        assert_metadata_equal(metadata, make_metadata(num_reqs), fields)
+
+
+def test_scaler_keeps_concurrent_builds_apart(whisper_causal):
+    scaler = whisper_causal.BlockPoolingMetadataScaler(4)
+    first = scaler.scale(make_metadata(8))
+    snapshot = copy.deepcopy(first)
+    scaler.scale(make_metadata(8, query_len=4))
+    assert_metadata_equal(first, snapshot, scaler._TENSOR_FIELDS)
+
+
+def test_scaler_throughput(whisper_causal):
+    metadata = make_metadata(32)
+    scaler = whisper_causal.BlockPoolingMetadataScaler(4)
+    rates = {}
+    for name, fn in (
+        ("reference", lambda: scale_metadata_reference(metadata, 4)),
+        ("pooled", lambda: scaler.scale(metadata)),
+    ):
+        fn()
+        iterations = 2000
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        rates[name] = iterations / (time.perf_counter() - start)
+    print(f"\nrescales/s: reference {rates['reference']:.0f}, pooled {rates['pooled']:.0f} "
+          f"({rates['pooled'] / rates['reference']:.1f}x)")
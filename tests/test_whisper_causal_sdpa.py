@@ -0,0 +1,90 @@
+"""Numerical equivalence and throughput of the portable SDPA backend for the
+causal Whisper encoder, on CPU."""
+
+import time
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("vllm")
+
+
+def reference_attention(query, keys, values, scale, sliding_window):
+    """Dense float64 attention over one sequence (queries at its end)."""
+    query_len, num_heads, _ = query.shape
+    seq_len, num_kv_heads, _ = keys.shape
+    keys = keys.double().repeat_interleave(num_heads // num_kv_heads, dim=1)
+    values = values.double().repeat_interleave(num_heads // num_kv_heads, dim=1)
+    scores = torch.einsum("qhd,khd->hqk", query.double(), keys) * scale
+    query_pos = torch.arange(seq_len - query_len, seq_len)[:, None]
+    key_pos = torch.arange(seq_len)[None, :]
+    allowed = key_pos <= query_pos
+    if sliding_window is not None:
+        allowed &= key_pos > query_pos - sliding_window
+    scores = scores.masked_fill(~allowed, float("-inf"))
+    return torch.einsum("hqk,khd->qhd", scores.softmax(-1), values)
+
+
+def make_case(whisper_causal, num_reqs=4, query_len=64, context_len=448, num_heads=32,
+              num_kv_heads=8, head_size=64, block_size=16, sliding_window=375):
+    """Paged KV cache with shuffled blocks whose context is filled directly;
+    forward() writes the new tokens itself."""
+    torch.manual_seed(0)
+    seq_len = context_len + query_len
+    blocks_per_seq = (seq_len + block_size - 1) // block_size
+    num_blocks = num_reqs * blocks_per_seq + 1
+    impl = whisper_causal.WhisperCausalSDPAImpl(
+        num_heads, head_size, head_size**-0.5, num_kv_heads, None, sliding_window, "auto"
+    )
+    kv_cache = torch.zeros(
+        whisper_causal.WhisperCausalSDPABackend.get_kv_cache_shape(
+            num_blocks, block_size, num_kv_heads, head_size
+        )
+    )
+    block_table = torch.randperm(num_blocks - 1)[: num_reqs * blocks_per_seq].view(
+        num_reqs, blocks_per_seq
+    )
+
+    keys = torch.randn(num_reqs, seq_len, num_kv_heads, head_size)
+    values = torch.randn(num_reqs, seq_len, num_kv_heads, head_size)
+    positions = torch.arange(seq_len)
+    slots = block_table[:, positions // block_size] * block_size + positions % block_size
+    ctx_slots = slots[:, :context_len].flatten()
+    kv_cache[0].view(-1, num_kv_heads, head_size)[ctx_slots] = keys[:, :context_len].flatten(0, 1)
+    kv_cache[1].view(-1, num_kv_heads, head_size)[ctx_slots] = values[:, :context_len].flatten(0, 1)
+
+    query = torch.randn(num_reqs * query_len, num_heads, head_size)
+    metadata = whisper_causal.WhisperCausalSDPAMetadata(
+        num_actual_tokens=num_reqs * query_len,
+        max_query_len=query_len,
+        query_start_loc_cpu=[i * query_len for i in range(num_reqs + 1)],
+        seq_lens_cpu=[seq_len] * num_reqs,
+        block_table=block_table,
+        slot_mapping=slots[:, context_len:].flatten(),
+    )
+    args = (query, keys[:, context_len:].flatten(0, 1), values[:, context_len:].flatten(0, 1),
+            kv_cache, metadata)
+    return impl, args, keys, values
+
+
+@pytest.mark.parametrize("sliding_window", [375, None])
+def test_sdpa_matches_reference(whisper_causal, sliding_window):
+    impl, args, keys, values = make_case(whisper_causal, sliding_window=sliding_window)
+    query = args[0]
+    output = impl.forward(None, *args)
+    query_len = args[4].max_query_len
+    for i in range(keys.shape[0]):
+        rows = slice(i * query_len, (i + 1) * query_len)
+        expected = reference_attention(query[rows], keys[i], values[i], impl.scale, sliding_window)
+        torch.testing.assert_close(output[rows].double(), expected, atol=1e-4, rtol=0)
+
+
+def test_sdpa_throughput(whisper_causal):
+    impl, args, _, _ = make_case(whisper_causal)
+    impl.forward(None, *args)
+    iterations = 20
+    start = time.perf_counter()
+    for _ in range(iterations):
+        impl.forward(None, *args)
+    elapsed = time.perf_counter() - start
+    print(f"\nSDPA backend: {iterations * args[4].num_actual_tokens / elapsed:.0f} query tokens/s")
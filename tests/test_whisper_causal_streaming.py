@@ -0,0 +1,87 @@
+"""`RollingKVWindow` streaming attention: exact against full-sequence
+sliding-window attention, and flat memory over hours of synthetic input.
+Needs only torch."""
+
+import resource
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from whisper_causal_streaming import RollingKVWindow, rolling_window_attention
+
+SLIDING_WINDOW = 750
+NUM_HEADS, NUM_KV_HEADS, HEAD_SIZE = 4, 2, 32
+# encoder tokens per second of audio after the conv stride and block pooling
+TOKENS_PER_SEC = 12.5
+
+
+def rope_interleaved(x, positions, theta=1e6):
+    """GPT-J style (non-neox) RoPE, as used by the encoder."""
+    head_size = x.shape[-1]
+    inv_freq = 1.0 / theta ** (
+        torch.arange(0, head_size, 2, dtype=torch.float64, device=x.device) / head_size
+    )
+    angles = positions.to(torch.float64)[:, None] * inv_freq[None, :]
+    cos = angles.cos().to(x.dtype)[:, None, :]
+    sin = angles.sin().to(x.dtype)[:, None, :]
+    x1, x2 = x[..., 0::2], x[..., 1::2]
+    return torch.stack([x1 * cos - x2 * sin, x2 * cos + x1 * sin], dim=-1).flatten(-2)
+
+
+def full_attention(queries, keys, values, scale):
+    """Dense float64 sliding-window attention at absolute positions."""
+    positions = torch.arange(queries.shape[0])
+    repeat = NUM_HEADS // NUM_KV_HEADS
+    q = rope_interleaved(queries.double(), positions)
+    k = rope_interleaved(keys.double(), positions).repeat_interleave(repeat, dim=1)
+    v = values.double().repeat_interleave(repeat, dim=1)
+    mask = (positions[None, :] <= positions[:, None]) & (
+        positions[None, :] > positions[:, None] - SLIDING_WINDOW
+    )
+    scores = torch.einsum("qhd,khd->hqk", q, k) * scale
+    return torch.einsum("hqk,khd->qhd", scores.masked_fill(~mask, float("-inf")).softmax(-1), v)
+
+
+@pytest.mark.parametrize("chunk_tokens", [1, 10, 64])
+def test_rolling_window_matches_full_attention(chunk_tokens):
+    torch.manual_seed(0)
+    total = 3 * SLIDING_WINDOW
+    scale = HEAD_SIZE**-0.5
+    queries = torch.randn(total, NUM_HEADS, HEAD_SIZE)
+    keys = torch.randn(total, NUM_KV_HEADS, HEAD_SIZE)
+    values = torch.randn(total, NUM_KV_HEADS, HEAD_SIZE)
+    reference = full_attention(queries, keys, values, scale)
+
+    window = RollingKVWindow(SLIDING_WINDOW, NUM_KV_HEADS, HEAD_SIZE)
+    for start in range(0, total, chunk_tokens):
+        end = min(start + chunk_tokens, total)
+        out = rolling_window_attention(
+            queries[start:end], keys[start:end], values[start:end], window, rope_interleaved, scale
+        )
+        torch.testing.assert_close(out.double(), reference[start:end], atol=1e-4, rtol=0)
+
+
+def test_rolling_window_memory_is_flat_over_hours():
+    hours, chunk_tokens = 3.0, 10
+    torch.manual_seed(0)
+    window = RollingKVWindow(SLIDING_WINDOW, NUM_KV_HEADS, HEAD_SIZE)
+    storage = (window.keys.data_ptr(), window.values.data_ptr(), window.nbytes())
+    chunk = (
+        torch.randn(chunk_tokens, NUM_HEADS, HEAD_SIZE),
+        torch.randn(chunk_tokens, NUM_KV_HEADS, HEAD_SIZE),
+        torch.randn(chunk_tokens, NUM_KV_HEADS, HEAD_SIZE),
+    )
+
+    total_tokens = int(hours * 3600 * TOKENS_PER_SEC)
+    rss_kb = []
+    while window.seen < total_tokens:
+        rolling_window_attention(*chunk, window, rope_interleaved, HEAD_SIZE**-0.5)
+        if window.seen % (chunk_tokens * 1000) == 0:
+            rss_kb.append(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+    assert window.seen / TOKENS_PER_SEC / 3600 >= hours
+    # the ring is never reallocated
+    assert (window.keys.data_ptr(), window.values.data_ptr(), window.nbytes()) == storage
+    # peak RSS after warm-up does not keep climbing
+    assert rss_kb[-1] - rss_kb[1] < 16 * 1024
@@ -14,8 +14,13 @@ os.environ.setdefault("NCCL_IB_DISABLE", "1")
 os.environ.setdefault("VLLM_WORKER_MULTIPROC_METHOD", "spawn")
 os.environ.setdefault("TORCH_NCCL_HEARTBEAT_TIMEOUT_SEC", "300")
 os.environ.setdefault("TORCH_NCCL_ENABLE_MONITORING", "0")
+# /debug/profile (enabled by DEBUG_TOKEN) drives vLLM's built-in torch profiler, which must be
+# configured before the engine starts; it stays idle until start_profile() is called.
+if os.environ.get("DEBUG_TOKEN"):
+    os.environ.setdefault("VLLM_TORCH_PROFILER_DIR", "/tmp/mindvoice-vllm-profile")
 import io
 import time
+import asyncio
 import tempfile
 import logging
 from contextlib import asynccontextmanager
@@ -23,8 +28,13 @@ from typing import Optional
 
 import torch
 import uvicorn
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, Request
+from fastapi.responses import JSONResponse, Response
+
+from asr_decoding import add_generated_tokens, generated_tokens
+from asr_fairshare import FairGate, FairShare, RateLimited, client_identity, parse_weights, trusted_clients
+from asr_tracing import TraceCollector, record_span, span, trace_http
+from asr_profiling import ProfileBusy, ProfileSession, bundle, debug_authorized
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger("MindVoice-ASR")
@@ -33,10 +43,59 @@ MODEL_PATH = os.environ.get("MODEL_PATH", "/home/ai/models/Qwen3-ASR-0.6B")
 PORT = int(os.environ.get("PORT", "8000"))
 GPU_MEMORY_UTILIZATION = float(os.environ.get("GPU_MEMORY_UTILIZATION", "0.85"))
 MAX_MODEL_LEN = int(os.environ.get("MAX_MODEL_LEN", "1024"))
+# Per-client fair share and admission control (see asr_fairshare). Costs are in seconds of audio.
+FAIR_RATE_SEC_PER_SEC = float(os.environ.get("FAIR_RATE_SEC_PER_SEC", "0"))  # 0 = no rate limit
+FAIR_BURST_SEC = float(os.environ.get("FAIR_BURST_SEC", "600"))
+FAIR_MAX_QUEUED_SEC = float(os.environ.get("FAIR_MAX_QUEUED_SEC", "0"))  # 0 = unbounded
+CLIENT_WEIGHTS = parse_weights(os.environ.get("CLIENT_WEIGHTS"))  # e.g. "key:ab12cd34ef56=2,id:batch=0.5"
+CLIENT_HEADER = os.environ.get("CLIENT_HEADER", "X-Client-Id")
+# Only API keys / client IDs listed here or in CLIENT_WEIGHTS are trusted; everything else is keyed by peer IP
+TRUSTED_CLIENTS = trusted_clients(
+    CLIENT_WEIGHTS, [name.strip() for name in os.environ.get("TRUSTED_CLIENTS", "").split(",") if name.strip()]
+)
+MAX_CONCURRENT_TRANSCRIPTIONS = int(os.environ.get("MAX_CONCURRENT_TRANSCRIPTIONS", "1"))
+# Per-request tracing (see asr_tracing): trace ID in the X-Trace-Id header, slowest traces at /debug/traces
+TRACE_ENABLED = os.environ.get("TRACE_ENABLED", "1") != "0"
+TRACE_KEEP_SLOWEST = int(os.environ.get("TRACE_KEEP_SLOWEST", "50"))
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH") or None  # JSONL file, one trace per line
+TRACE_EXPORT_MIN_MS = float(os.environ.get("TRACE_EXPORT_MIN_MS", "0"))
+# On-demand profiling (see asr_profiling): /debug/profile is disabled unless DEBUG_TOKEN is set
+DEBUG_TOKEN = os.environ.get("DEBUG_TOKEN") or None
+PROFILE_MAX_SEC = float(os.environ.get("PROFILE_MAX_SEC", "60"))
 
 model = None
 
 
+def count_vllm_tokens(llm):
+    """Wrap vLLM's LLM.generate so every call adds the generated token count to the active
+    generated_tokens() scope (the request's context is copied into the worker thread)."""
+    original = llm.generate
+
+    def generate(*args, **kwargs):
+        outputs = original(*args, **kwargs)
+        add_generated_tokens(sum(len(completion.token_ids) for output in outputs for completion in output.outputs))
+        return outputs
+
+    llm.generate = generate
+
+
+fair_gate = FairGate(
+    FairShare(
+        rate_sec_per_sec=FAIR_RATE_SEC_PER_SEC,
+        burst_sec=FAIR_BURST_SEC,
+        max_queued_sec=FAIR_MAX_QUEUED_SEC,
+        weights=CLIENT_WEIGHTS,
+    ),
+    concurrency=MAX_CONCURRENT_TRANSCRIPTIONS,
+)
+tracer = TraceCollector(
+    keep_slowest=TRACE_KEEP_SLOWEST,
+    export_path=TRACE_EXPORT_PATH,
+    export_min_ms=TRACE_EXPORT_MIN_MS,
+) if TRACE_ENABLED else None
+profile_session = ProfileSession(max_seconds=PROFILE_MAX_SEC)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global model
@@ -51,6 +110,11 @@ async def lifespan(app: FastAPI):
         max_num_seqs=32,
         disable_log_stats=False,
     )
+    llm = getattr(model, "model", None)
+    if callable(getattr(llm, "generate", None)):
+        count_vllm_tokens(llm)
+    else:
+        logger.warning("vLLM engine not found on the model; inference spans will not report token counts")
     logger.info("Model loaded successfully with vLLM backend!")
     
     yield
@@ -61,13 +125,32 @@ async def lifespan(app: FastAPI):
 app = FastAPI(title="MindVoice ASR Server", version="2.1.0", lifespan=lifespan)
 
 
+def request_client(request: Request) -> str:
+    return client_identity(
+        request.headers.get("authorization"),
+        request.headers.get(CLIENT_HEADER),
+        request.client.host if request.client else None,
+        trusted=TRUSTED_CLIENTS,
+    )
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Health checks and status polls are not traced
+    if tracer is None or request.method == "GET":
+        return await call_next(request)
+    return await trace_http(tracer, request, call_next, client=request_client(request))
+
+
 @app.get("/")
 async def root():
     return {
         "status": "ok",
         "model": "Qwen3-ASR-0.6B",
         "backend": "vLLM",
-        "message": "MindVoice ASR Server running"
+        "message": "MindVoice ASR Server running",
+        "fairness": fair_gate.status(),
+        "tracing": tracer.status() if tracer is not None else None,
     }
 
 
@@ -76,8 +159,82 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/debug/traces")
+async def debug_traces(limit: int = 20):
+    """Slowest recent request traces, slowest first"""
+    if tracer is None:
+        return JSONResponse(status_code=404, content={"error": "Tracing is disabled"})
+    return {**tracer.status(), "traces": tracer.slowest(max(1, limit))}
+
+
+@app.get("/debug/traces/{trace_id}")
+async def debug_trace(trace_id: str):
+    """A single recent trace by the ID returned in the X-Trace-Id header"""
+    trace = tracer.get(trace_id) if tracer is not None else None
+    if trace is None:
+        return JSONResponse(status_code=404, content={"error": f"Trace not found or evicted: {trace_id}"})
+    return trace
+
+
+def profiling_engine():
+    """The vLLM engine behind the qwen_asr wrapper, if it supports start_profile/stop_profile"""
+    for candidate in (model, getattr(model, "llm", None), getattr(model, "model", None)):
+        if candidate is not None and hasattr(candidate, "start_profile") and hasattr(candidate, "stop_profile"):
+            return candidate
+    return None
+
+
+@app.get("/debug/profile")
+async def debug_profile(request: Request, seconds: float = 10):
+    """Profile the live server for `seconds`: returns a zip with collapsed Python stacks of this
+    process and vLLM's torch.profiler traces of the engine. Requires DEBUG_TOKEN, sent as
+    Authorization: Bearer <token> or X-Debug-Token."""
+    if not DEBUG_TOKEN:
+        return JSONResponse(status_code=404, content={"error": "Profiling is disabled (set DEBUG_TOKEN)"})
+    if not debug_authorized(DEBUG_TOKEN, request.headers.get("authorization"), request.headers.get("x-debug-token")):
+        return JSONResponse(status_code=401, content={"error": "Invalid debug token"})
+
+    notes = []
+    engine = profiling_engine()
+    trace_dir = os.environ.get("VLLM_TORCH_PROFILER_DIR")
+    if engine is None or not trace_dir:
+        notes.append("vLLM engine profiler unavailable; only Python stacks were captured")
+        engine = None
+    t_window = time.time()
+
+    def stop_engine() -> dict:
+        engine.stop_profile()
+        # The engine writes one Chrome trace per worker into VLLM_TORCH_PROFILER_DIR
+        files = {}
+        for root, _, names in os.walk(trace_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                if os.path.getmtime(path) >= t_window:
+                    with open(path, "rb") as f:
+                        files["vllm/" + os.path.relpath(path, trace_dir)] = f.read()
+        if not files:
+            notes.append(f"No new engine traces found in {trace_dir}")
+        return files
+
+    logger.info(f"Profiling for {seconds:.0f}s")
+    try:
+        files = await profile_session.capture(
+            seconds,
+            start_model=engine.start_profile if engine is not None else None,
+            stop_model=stop_engine if engine is not None else None,
+            notes=notes,
+        )
+    except ProfileBusy as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+    data = await asyncio.to_thread(bundle, files)
+    return Response(data, media_type="application/zip", headers={
+        "Content-Disposition": f'attachment; filename="mindvoice-vllm-profile-{int(time.time())}.zip"',
+    })
+
+
 @app.post("/v1/audio/transcriptions")
 async def transcribe(
+    request: Request,
     file: UploadFile = File(...),
     model_name: str = Form(default="auto", alias="model"),
     language: str = Form(default=None),
@@ -86,7 +243,9 @@ async def transcribe(
     t_start = time.time()
     
     try:
-        audio_data = await file.read()
+        with span("upload.read") as read_span:
+            audio_data = await file.read()
+            read_span.set(bytes=len(audio_data))
         t_audio_size = len(audio_data)
         
         suffix = os.path.splitext(file.filename)[1] if file.filename else ".webm"
@@ -124,15 +283,17 @@ async def transcribe(
         
         for i, strategy_args in enumerate(conversion_strategies):
             try:
-                if strategy_args == "pipe":
-                    # Pipe strategy: feed raw bytes via stdin, let ffmpeg probe the stream
-                    cmd = ["ffmpeg", "-y", "-i", "pipe:0"] + output_args
-                    with open(input_path, "rb") as f:
-                        result = subprocess.run(cmd, stdin=f, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
-                else:
-                    cmd = ["ffmpeg"] + strategy_args + output_args
-                    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
-                
+                with span("ffmpeg.attempt", strategy=i + 1) as attempt:
+                    if strategy_args == "pipe":
+                        # Pipe strategy: feed raw bytes via stdin, let ffmpeg probe the stream
+                        cmd = ["ffmpeg", "-y", "-i", "pipe:0"] + output_args
+                        with open(input_path, "rb") as f:
+                            result = subprocess.run(cmd, stdin=f, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                    else:
+                        cmd = ["ffmpeg"] + strategy_args + output_args
+                        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                    attempt.set(returncode=result.returncode)
+
                 if result.returncode == 0 and os.path.exists(wav_path) and os.path.getsize(wav_path) > 44:
                     if i > 0:
                         logger.info(f"FFmpeg conversion succeeded with strategy {i+1}")
@@ -140,6 +301,7 @@ async def transcribe(
                 else:
                     stderr_msg = result.stderr.decode(errors="replace")[-200:] if result.stderr else ""
                     logger.warning(f"FFmpeg strategy {i+1} failed (code {result.returncode}): {stderr_msg[-80:]}")
+                    attempt.set(stderr=stderr_msg[-80:])
                     last_error = stderr_msg
                     # Clean up failed output
                     if os.path.exists(wav_path):
@@ -155,8 +317,6 @@ async def transcribe(
         transcribe_path = wav_path
         
         try:
-            t_inference_start = time.time()
-            
             lang_map = {
                 "zh": "Chinese",
                 "en": "English", 
@@ -167,7 +327,20 @@ async def transcribe(
             lang = lang_map.get(language, language) if language else None
             context = prompt.strip() if prompt else ""
             
-            results = model.transcribe(audio=transcribe_path, language=lang, context=context)
+            # Admission is charged by decoded duration (16 kHz mono s16 WAV, 44-byte header);
+            # queued requests are released in per-client fair-share order.
+            duration = max(os.path.getsize(transcribe_path) - 44, 0) / (16000 * 2)
+            client = request_client(request)
+            t_queued = time.perf_counter()
+            async with fair_gate.slot(client, duration):
+                record_span("fair_queue", t_queued, audio_sec=round(duration, 2))
+                t_inference_start = time.time()
+                with span("inference", audio_sec=round(duration, 2)) as inference_span, generated_tokens() as stats:
+                    results = await asyncio.to_thread(
+                        model.transcribe, audio=transcribe_path, language=lang, context=context
+                    )
+                    if stats["calls"]:
+                        inference_span.set(tokens=stats["tokens"], generate_calls=stats["calls"])
             t_inference = time.time() - t_inference_start
             
             t_total = time.time() - t_start
@@ -184,6 +357,13 @@ async def transcribe(
             if os.path.exists(wav_path):
                 os.unlink(wav_path)
     
+    except RateLimited as e:
+        logger.warning(f"Rate limited: {e}")
+        return JSONResponse(
+            status_code=429,
+            content={"error": str(e), "retry_after": round(e.retry_after, 1)},
+            headers={"Retry-After": str(max(1, round(e.retry_after)))},
+        )
     except Exception as e:
         logger.error(f"Transcription failed: {e}")
         import traceback
@@ -210,4 +390,5 @@ if __name__ == "__main__":
 
     signal.signal(signal.SIGTERM, handle_sigterm)
 
-    uvicorn.run(app, host="0.0.0.0", port=PORT)
+    # Keep idle connections open long enough for the client to reuse them between utterances
+    uvicorn.run(app, host="0.0.0.0", port=PORT, timeout_keep_alive=120)
@@ -1,9 +1,8 @@
 # SPDX-License-Identifier: Apache-2.0
 # SPDX-FileCopyrightText: Copyright contributors to the vLLM project
-import copy
 import functools
 import math
-from dataclasses import replace
+from dataclasses import dataclass, replace
 from functools import partial
 
 import torch
@@ -22,9 +21,12 @@ from vllm.model_executor.layers.quantization import QuantizationConfig
 from vllm.model_executor.layers.rotary_embedding import get_rope
 from vllm.model_executor.models.mistral import MistralMLP
 from vllm.model_executor.models.whisper import WhisperPosEmbedType
+from vllm.platforms import current_platform
 from vllm.v1.attention.backend import (
     AttentionBackend,
+    AttentionImpl,
     AttentionMetadata,
+    AttentionMetadataBuilder,
     AttentionType,
     CommonAttentionMetadata,
     subclass_attention_backend_with_overrides,
@@ -34,6 +36,7 @@ from vllm.v1.attention.selector import get_attn_backend
 from vllm.v1.kv_cache_interface import AttentionSpec
 
 from .utils import make_layers
+from .whisper_causal_streaming import RollingKVWindow, rolling_window_attention
 
 CausalRMSNorm = partial(RMSNorm, eps=1e-5)
 
@@ -99,6 +102,307 @@ class WhisperCausalConv1d(nn.Conv1d):
         return super().forward(x)
 
 
+# Number of scaled-metadata buffer sets a builder rotates through. The metadata
+# returned by `build()` references these buffers, so two builds that are alive
+# at the same time (e.g. micro-batches prepared before either runs) must not
+# share storage.
+_NUM_METADATA_BUFFERS = 2
+
+
+class BlockPoolingMetadataScaler:
+    """Rescales `CommonAttentionMetadata` from encoder tokens to pooled KV slots.
+
+    Equivalent to deep-copying the metadata and multiplying every token count
+    by `block_pool_size`, but without per-step allocations: scaled tensors are
+    written with `out=` into persistent buffers that only grow when a larger
+    batch shows up, the per-slot offsets `arange(block_pool_size)` are cached
+    per device, and the remaining fields are shared with the input through a
+    shallow `dataclasses.replace`.
+
+    Pinned host buffers are written by the CPU immediately, while the builder
+    may still have a non-blocking host-to-device copy from the previous use of
+    the same buffer set queued on the stream. `record_use()` marks the end of
+    those copies with a CUDA event after each build, and `scale()` waits on
+    that event before rewriting the set.
+    """
+
+    _TENSOR_FIELDS = (
+        "query_start_loc",
+        "query_start_loc_cpu",
+        "seq_lens",
+        "_seq_lens_cpu",
+        "_num_computed_tokens_cpu",
+    )
+
+    def __init__(self, block_pool_size: int, num_buffers: int = _NUM_METADATA_BUFFERS):
+        self.block_pool_size = block_pool_size
+        self._buffers: list[dict[str, torch.Tensor]] = [{} for _ in range(num_buffers)]
+        self._events: list[torch.cuda.Event | None] = [None] * num_buffers
+        self._pending = [False] * num_buffers
+        self._next = 0
+        self._last = 0
+        self._offsets: dict[tuple[torch.device, torch.dtype], torch.Tensor] = {}
+
+    @staticmethod
+    def _buffer(
+        buffers: dict[str, torch.Tensor],
+        name: str,
+        numel: int,
+        dtype: torch.dtype,
+        device: torch.device,
+        pin_memory: bool = False,
+    ) -> torch.Tensor:
+        buf = buffers.get(name)
+        if buf is None or buf.dtype != dtype or buf.device != device:
+            buf = None
+        if buf is None or buf.numel() < numel:
+            capacity = max(numel, 2 * buf.numel() if buf is not None else numel)
+            buf = torch.empty(capacity, dtype=dtype, device=device, pin_memory=pin_memory)
+            buffers[name] = buf
+        return buf[:numel]
+
+    def _scaled(
+        self, buffers: dict[str, torch.Tensor], name: str, src: torch.Tensor | None
+    ) -> torch.Tensor | None:
+        if src is None:
+            return None
+        pinned = src.device.type == "cpu" and src.is_pinned()
+        out = self._buffer(buffers, name, src.numel(), src.dtype, src.device, pinned)
+        return torch.mul(src, self.block_pool_size, out=out.view(src.shape))
+
+    def _slot_mapping(
+        self, buffers: dict[str, torch.Tensor], slot_mapping: torch.Tensor
+    ) -> torch.Tensor:
+        pool = self.block_pool_size
+        dtype = torch.promote_types(slot_mapping.dtype, torch.int64)
+        key = (slot_mapping.device, dtype)
+        offsets = self._offsets.get(key)
+        if offsets is None:
+            offsets = torch.arange(pool, dtype=dtype, device=slot_mapping.device)
+            self._offsets[key] = offsets
+        num_tokens = slot_mapping.numel()
+        out = self._buffer(
+            buffers, "slot_mapping", num_tokens * pool, dtype, slot_mapping.device
+        ).view(num_tokens, pool)
+        # offsets + pool * slot, broadcast to [num_tokens, pool] in one kernel
+        torch.add(offsets, slot_mapping.unsqueeze(1), alpha=pool, out=out)
+        out.clamp_(min=-1)
+        return out.view(-1)
+
+    def scale(self, common_attn_metadata: CommonAttentionMetadata):
+        index = self._next
+        self._next = (index + 1) % len(self._buffers)
+        if self._pending[index]:
+            # async copies out of this set's pinned buffers must finish first
+            self._events[index].synchronize()
+            self._pending[index] = False
+        self._last = index
+        buffers = self._buffers[index]
+        pool = self.block_pool_size
+        updates = {
+            name: self._scaled(buffers, name, getattr(common_attn_metadata, name))
+            for name in self._TENSOR_FIELDS
+        }
+        return replace(
+            common_attn_metadata,
+            **updates,
+            num_actual_tokens=common_attn_metadata.num_actual_tokens * pool,
+            max_query_len=common_attn_metadata.max_query_len * pool,
+            max_seq_len=common_attn_metadata.max_seq_len * pool,
+            slot_mapping=self._slot_mapping(buffers, common_attn_metadata.slot_mapping),
+        )
+
+    def record_use(self) -> None:
+        """Called once the metadata from the last `scale()` has been handed to
+        the underlying builder; records the point on the current stream after
+        which its pinned host buffers may be rewritten."""
+        index = self._last
+        if not any(buf.is_pinned() for buf in self._buffers[index].values()):
+            return
+        if self._events[index] is None:
+            self._events[index] = torch.cuda.Event()
+        self._events[index].record()
+        self._pending[index] = True
+
+
+@dataclass
+class WhisperCausalSDPAMetadata:
+    num_actual_tokens: int
+    max_query_len: int
+    query_start_loc_cpu: list[int]
+    seq_lens_cpu: list[int]
+    block_table: torch.Tensor
+    slot_mapping: torch.Tensor
+
+
+class WhisperCausalSDPAMetadataBuilder(
+    AttentionMetadataBuilder[WhisperCausalSDPAMetadata]
+):
+    def __init__(
+        self,
+        kv_cache_spec: AttentionSpec,
+        layer_names: list[str],
+        vllm_config: VllmConfig,
+        device: torch.device,
+    ):
+        super().__init__(kv_cache_spec, layer_names, vllm_config, device)
+
+    def build(
+        self,
+        common_prefix_len: int,
+        common_attn_metadata: CommonAttentionMetadata,
+        fast_build: bool = False,
+    ) -> WhisperCausalSDPAMetadata:
+        num_reqs = common_attn_metadata.num_reqs
+        return WhisperCausalSDPAMetadata(
+            num_actual_tokens=common_attn_metadata.num_actual_tokens,
+            max_query_len=common_attn_metadata.max_query_len,
+            query_start_loc_cpu=common_attn_metadata.query_start_loc_cpu[
+                : num_reqs + 1
+            ].tolist(),
+            # host copy kept by the runner; reading `seq_lens` would sync the device
+            seq_lens_cpu=common_attn_metadata.seq_lens_cpu[:num_reqs].tolist(),
+            block_table=common_attn_metadata.block_table_tensor,
+            slot_mapping=common_attn_metadata.slot_mapping,
+        )
+
+
+class WhisperCausalSDPAImpl(AttentionImpl[WhisperCausalSDPAMetadata]):
+    """Paged causal sliding-window attention on
+    `torch.nn.functional.scaled_dot_product_attention`.
+
+    Follows the same contract as the FlashAttention backend (token-major
+    paged KV cache addressed through `slot_mapping` / `block_table`, causal
+    mask aligned to the end of each sequence, window of `sliding_window`
+    keys including the query itself), so block pooling works unchanged on
+    top of it, including on CPU-only nodes.
+    """
+
+    def __init__(
+        self,
+        num_heads: int,
+        head_size: int,
+        scale: float,
+        num_kv_heads: int,
+        alibi_slopes: list[float] | None,
+        sliding_window: int | None,
+        kv_cache_dtype: str,
+        logits_soft_cap: float | None = None,
+        attn_type: str = AttentionType.DECODER,
+        kv_sharing_target_layer_name: str | None = None,
+        **kwargs,
+    ) -> None:
+        if alibi_slopes is not None or logits_soft_cap:
+            raise NotImplementedError(
+                "The SDPA Whisper backend supports neither ALiBi nor logits soft cap."
+            )
+        if kv_cache_dtype != "auto":
+            raise NotImplementedError(
+                f"The SDPA Whisper backend does not support kv cache dtype {kv_cache_dtype}."
+            )
+        self.num_heads = num_heads
+        self.head_size = head_size
+        self.scale = float(scale)
+        self.num_kv_heads = num_kv_heads
+        self.num_queries_per_kv = num_heads // num_kv_heads
+        self.sliding_window = sliding_window
+        self.attn_type = attn_type
+        self.kv_sharing_target_layer_name = kv_sharing_target_layer_name
+
+    def _mask(self, query_len: int, seq_len: int, device: torch.device) -> torch.Tensor:
+        query_pos = torch.arange(seq_len - query_len, seq_len, device=device)[:, None]
+        key_pos = torch.arange(seq_len, device=device)[None, :]
+        mask = key_pos <= query_pos
+        if self.sliding_window is not None:
+            mask &= key_pos > query_pos - self.sliding_window
+        return mask
+
+    def forward(
+        self,
+        layer: torch.nn.Module,
+        query: torch.Tensor,
+        key: torch.Tensor,
+        value: torch.Tensor,
+        kv_cache: torch.Tensor,
+        attn_metadata: WhisperCausalSDPAMetadata,
+        output: torch.Tensor | None = None,
+        output_scale: torch.Tensor | None = None,
+        output_block_scale: torch.Tensor | None = None,
+    ) -> torch.Tensor:
+        if output is None:
+            output = torch.empty_like(query)
+        if attn_metadata is None:
+            # profiling run
+            return output.fill_(0)
+
+        num_tokens = attn_metadata.num_actual_tokens
+        query = query[:num_tokens].view(-1, self.num_heads, self.head_size)
+        key_cache, value_cache = kv_cache.unbind(0)
+        block_size = key_cache.shape[1]
+
+        if self.kv_sharing_target_layer_name is None:
+            slots = attn_metadata.slot_mapping[:num_tokens]
+            valid = slots >= 0
+            key = key[:num_tokens].view(-1, self.num_kv_heads, self.head_size)
+            value = value[:num_tokens].view(-1, self.num_kv_heads, self.head_size)
+            flat_key_cache = key_cache.view(-1, self.num_kv_heads, self.head_size)
+            flat_value_cache = value_cache.view(-1, self.num_kv_heads, self.head_size)
+            flat_key_cache[slots[valid]] = key[valid]
+            flat_value_cache[slots[valid]] = value[valid]
+
+        result = output[:num_tokens].view(-1, self.num_heads, self.head_size)
+        starts = attn_metadata.query_start_loc_cpu
+        for i, seq_len in enumerate(attn_metadata.seq_lens_cpu):
+            start, end = starts[i], starts[i + 1]
+            if end == start:
+                continue
+            blocks = attn_metadata.block_table[i, : (seq_len + block_size - 1) // block_size]
+            keys = key_cache[blocks].flatten(0, 1)[:seq_len]
+            values = value_cache[blocks].flatten(0, 1)[:seq_len]
+            if self.num_queries_per_kv > 1:
+                keys = keys.repeat_interleave(self.num_queries_per_kv, dim=1)
+                values = values.repeat_interleave(self.num_queries_per_kv, dim=1)
+            out = F.scaled_dot_product_attention(
+                query[start:end].transpose(0, 1),
+                keys.transpose(0, 1),
+                values.transpose(0, 1),
+                attn_mask=self._mask(end - start, seq_len, query.device),
+                scale=self.scale,
+            )
+            result[start:end] = out.transpose(0, 1)
+        return output
+
+
+class WhisperCausalSDPABackend(AttentionBackend):
+    """Portable attention backend for the causal Whisper encoder, used on
+    CPU-only nodes where FlashAttention is unavailable."""
+
+    accept_output_buffer: bool = True
+
+    @staticmethod
+    def get_name() -> str:
+        return "WHISPER_CAUSAL_SDPA"
+
+    @staticmethod
+    def get_impl_cls() -> type[WhisperCausalSDPAImpl]:
+        return WhisperCausalSDPAImpl
+
+    @staticmethod
+    def get_builder_cls() -> type[WhisperCausalSDPAMetadataBuilder]:
+        return WhisperCausalSDPAMetadataBuilder
+
+    @staticmethod
+    def get_kv_cache_shape(
+        num_blocks: int,
+        block_size: int,
+        num_kv_heads: int,
+        head_size: int,
+        cache_dtype_str: str = "auto",
+    ) -> tuple[int, ...]:
+        # same token-major layout as FlashAttention
+        return (2, num_blocks, block_size, num_kv_heads, head_size)
+
+
 @functools.lru_cache
 def create_whisper_attention_backend_with_block_pooling(
     underlying_attn_backend: AttentionBackend, block_pool_size: int
@@ -121,6 +425,7 @@ def create_whisper_attention_backend_with_block_pooling(
                 num_kv_heads=kv_cache_spec.num_kv_heads // block_pool_size,
             )
             super().__init__(kv_cache_spec, layer_names, vllm_config, device)
+            self._metadata_scaler = BlockPoolingMetadataScaler(block_pool_size)
 
         def build(
             self,
@@ -128,53 +433,46 @@ def create_whisper_attention_backend_with_block_pooling(
             common_attn_metadata: CommonAttentionMetadata,
             fast_build: bool = False,
         ) -> AttentionMetadata:
-            new_common_attn_metadata = copy.deepcopy(common_attn_metadata)
-            new_common_attn_metadata.query_start_loc *= block_pool_size
-            new_common_attn_metadata.query_start_loc_cpu *= block_pool_size
-            new_common_attn_metadata.seq_lens *= block_pool_size
-            new_common_attn_metadata._seq_lens_cpu *= block_pool_size
-            new_common_attn_metadata._num_computed_tokens_cpu *= block_pool_size
-            new_common_attn_metadata.num_actual_tokens *= block_pool_size
-            new_common_attn_metadata.max_query_len *= block_pool_size
-            new_common_attn_metadata.max_seq_len *= block_pool_size
-            original_slot_mapping = common_attn_metadata.slot_mapping
-            common_prefix_len *= block_pool_size
-            new_common_attn_metadata.slot_mapping = (
-                (
-                    original_slot_mapping.unsqueeze(1) * block_pool_size
-                    + torch.arange(block_pool_size, device=original_slot_mapping.device)
-                )
-                .flatten()
-                .clamp(min=-1)
-            )
-            return super().build(
-                common_prefix_len, new_common_attn_metadata, fast_build
+            metadata = super().build(
+                common_prefix_len * block_pool_size,
+                self._metadata_scaler.scale(common_attn_metadata),
+                fast_build,
             )
+            self._metadata_scaler.record_use()
+            return metadata
 
-    if not issubclass(underlying_attn_backend, FlashAttentionBackend):
+    if not issubclass(
+        underlying_attn_backend, (FlashAttentionBackend, WhisperCausalSDPABackend)
+    ):
         raise NotImplementedError(
             f"{underlying_attn_backend} is not yet supported."
             "Contributions to support more backends are much "
             "appreciated."
         )
 
+    def get_kv_cache_shape(
+        num_blocks: int,
+        block_size: int,
+        num_kv_heads: int,
+        head_size: int,
+        cache_dtype_str: str = "auto",
+    ) -> tuple[int, ...]:
+        # we stretch each block by `block_pool_size`; both supported backends
+        # use a token-major layout, so pooled heads stay contiguous per token
+        return underlying_attn_backend.get_kv_cache_shape(
+            num_blocks,
+            block_size * block_pool_size,
+            num_kv_heads // block_pool_size,
+            head_size,
+            cache_dtype_str,
+        )
+
     attn_backend = subclass_attention_backend_with_overrides(
         name_prefix=prefix,
         attention_backend_cls=underlying_attn_backend,
         overrides={
             "get_builder_cls": lambda: WhisperCausalAttentionWithBlockPoolingBuilder,
-            "get_kv_cache_shape": lambda num_blocks,
-            block_size,
-            num_kv_heads,
-            head_size,
-            cache_dtype_str: (
-                2,
-                num_blocks,
-                # we stretch each block by `block_pool_size`
-                block_size * block_pool_size,
-                num_kv_heads // block_pool_size,
-                head_size,
-            ),  # TODO: generalize to other backends
+            "get_kv_cache_shape": get_kv_cache_shape,
         },
     )
 
@@ -219,6 +517,10 @@ class WhisperCausalAttentionWithBlockPooling(Attention):
             block_size,
             attn_type=attn_type,
         )
+        if current_platform.is_cpu():
+            # no FlashAttention on CPU-only nodes: use the portable SDPA backend;
+            # other GPU backends still fail loudly in the block-pooling factory
+            underlying_attn_backend = WhisperCausalSDPABackend
         attn_backend = create_whisper_attention_backend_with_block_pooling(
             underlying_attn_backend, block_pool_size
         )
@@ -314,6 +616,7 @@ class WhisperCausalAttention(nn.Module):
         assert per_layer_sliding_window is not None, (
             "rope can only used in combination with a sliding window"
         )
+        self.sliding_window = per_layer_sliding_window
         self._init_rotary_emb(max_position_embeddings)
 
     def _init_rotary_emb(self, max_position_embeddings: int) -> None:
@@ -358,6 +661,35 @@ class WhisperCausalAttention(nn.Module):
 
         return output
 
+    def forward_streaming(
+        self, hidden_states: torch.Tensor, window: RollingKVWindow
+    ) -> torch.Tensor:
+        """Attention over one streaming chunk using `window` instead of the
+        paged KV cache; positions are local to the window (see
+        `RollingKVWindow`)."""
+        qkv, _ = self.qkv_proj(hidden_states)
+        q, k, v = qkv.split([self.q_size, self.kv_size, self.kv_size], dim=-1)
+        q = q.view(-1, self.num_heads, self.head_dim)
+        k = k.view(-1, self.num_kv_heads, self.head_dim)
+        v = v.view(-1, self.num_kv_heads, self.head_dim)
+
+        def rotate(x: torch.Tensor, positions: torch.Tensor) -> torch.Tensor:
+            return self.rotary_emb(positions, x.flatten(1), None)[0].view_as(x)
+
+        attn_output = rolling_window_attention(q, k, v, window, rotate, self.scaling)
+        output, _ = self.out_proj(attn_output.flatten(1))
+
+        return output
+
+    def new_rolling_window(self, dtype: torch.dtype, device: torch.device) -> RollingKVWindow:
+        return RollingKVWindow(
+            self.sliding_window,
+            self.num_kv_heads,
+            self.head_dim,
+            dtype=dtype,
+            device=device,
+        )
+
 
 class WhisperCausalEncoderLayer(nn.Module):
     def __init__(self, *, vllm_config: VllmConfig, prefix: str = ""):
@@ -412,6 +744,42 @@ class WhisperCausalEncoderLayer(nn.Module):
 
         return hidden_states
 
+    def forward_streaming(
+        self, hidden_states: torch.Tensor, window: RollingKVWindow
+    ) -> torch.Tensor:
+        residual = hidden_states
+        hidden_states = self.self_attn_layer_norm(hidden_states)
+        hidden_states = self.self_attn.forward_streaming(hidden_states, window)
+        hidden_states = residual + hidden_states
+        residual = hidden_states
+        hidden_states = self.final_layer_norm(hidden_states)
+        hidden_states = self.mlp(hidden_states)
+        hidden_states = residual + hidden_states
+
+        return hidden_states
+
+
+@dataclass
+class WhisperCausalStreamState:
+    """Per-stream state for `WhisperCausalEncoder.forward_streaming`.
+
+    Holds the causal conv left context and one `RollingKVWindow` per layer;
+    its size is fixed at creation and independent of how long the stream
+    runs.
+    """
+
+    conv1_tail: torch.Tensor
+    conv2_tail: torch.Tensor
+    windows: list[RollingKVWindow]
+    frames: int = 0
+
+    def nbytes(self) -> int:
+        return (
+            self.conv1_tail.nbytes
+            + self.conv2_tail.nbytes
+            + sum(window.nbytes() for window in self.windows)
+        )
+
 
 class WhisperCausalEncoder(nn.Module):
     def __init__(self, *, vllm_config: VllmConfig, prefix: str = ""):
@@ -455,6 +823,55 @@ class WhisperCausalEncoder(nn.Module):
 
         return hidden_states
 
+    def new_stream_state(
+        self, dtype: torch.dtype, device: torch.device
+    ) -> WhisperCausalStreamState:
+        conv1_context = self.conv1._padding_total
+        conv2_context = self.conv2._padding_total
+        return WhisperCausalStreamState(
+            conv1_tail=torch.zeros(
+                self.num_mel_bins, conv1_context, dtype=dtype, device=device
+            ),
+            conv2_tail=torch.zeros(
+                self.conv2.in_channels, conv2_context, dtype=dtype, device=device
+            ),
+            windows=[
+                layer.self_attn.new_rolling_window(dtype, device)
+                for layer in self.layers
+            ],
+        )
+
+    def forward_streaming(
+        self, input_features: torch.Tensor, state: WhisperCausalStreamState
+    ) -> torch.Tensor:
+        """Encodes the next chunk of mel frames ([num_mel_bins, frames]) of an
+        unbounded stream. Memory use is bounded by `state`, which is updated in
+        place; chaining calls gives the same output as encoding the
+        concatenated features in one pass. `frames` must be a multiple of
+        `total_stride` so that no conv output depends on future frames."""
+        assert input_features.shape[-1] % self.total_stride == 0, (
+            f"chunk length must be a multiple of {self.total_stride} frames"
+        )
+        # The causal convs only pad on the left, so carrying the last
+        # `_padding_total` inputs of each conv replaces that padding exactly.
+        features = torch.cat([state.conv1_tail, input_features], dim=-1)
+        state.conv1_tail = features[:, features.shape[-1] - state.conv1_tail.shape[-1] :]
+        embeds = nn.functional.gelu(F.conv1d(features, self.conv1.weight, self.conv1.bias))
+
+        embeds = torch.cat([state.conv2_tail, embeds], dim=-1)
+        state.conv2_tail = embeds[:, embeds.shape[-1] - state.conv2_tail.shape[-1] :]
+        embeds = nn.functional.gelu(
+            F.conv1d(embeds, self.conv2.weight, self.conv2.bias, stride=self.conv2._stride)
+        )
+        state.frames += input_features.shape[-1]
+
+        hidden_states = embeds.transpose(-1, -2)
+        for encoder_layer, window in zip(self.layers, state.windows):
+            hidden_states = encoder_layer.forward_streaming(hidden_states, window)
+
+        hidden_states = self.layer_norm(hidden_states)
+        return hidden_states
+
     def forward(
         self, hidden_states: torch.Tensor, positions: torch.Tensor
     ) -> torch.Tensor:
@@ -0,0 +1,100 @@
+# SPDX-License-Identifier: Apache-2.0
+# SPDX-FileCopyrightText: Copyright contributors to the vLLM project
+"""Constant-memory KV store for streaming the causal Whisper encoder.
+
+Used by `WhisperCausalEncoder.forward_streaming`; kept free of vLLM imports so
+it can be tested with torch alone.
+"""
+from typing import Callable
+
+import torch
+import torch.nn.functional as F
+
+
+class RollingKVWindow:
+    """Constant-memory KV store for streaming causal sliding-window attention.
+
+    Keeps the un-rotated keys/values of the last `sliding_window - 1` tokens
+    (all a future query can see besides itself) in a preallocated ring;
+    older tokens are overwritten as new ones arrive, so memory does not grow
+    with stream length. RoPE is applied at attention time using positions
+    relative to the oldest token in view: attention scores only depend on
+    position differences, so outputs equal the full-sequence computation
+    while the rotation angles stay bounded no matter how long the stream is.
+    """
+
+    def __init__(
+        self,
+        sliding_window: int,
+        num_kv_heads: int,
+        head_size: int,
+        dtype: torch.dtype = torch.float32,
+        device: torch.device | str = "cpu",
+    ):
+        self.sliding_window = sliding_window
+        self.capacity = max(sliding_window - 1, 1)
+        self.keys = torch.zeros(self.capacity, num_kv_heads, head_size, dtype=dtype, device=device)
+        self.values = torch.zeros_like(self.keys)
+        self._slots = torch.arange(self.capacity, device=device)
+        self.filled = 0
+        self.head = 0  # next slot to overwrite
+        self.seen = 0  # total tokens appended, kept for bookkeeping only
+
+    def context(self) -> tuple[torch.Tensor, torch.Tensor]:
+        """Cached keys/values ordered oldest to newest."""
+        if self.filled < self.capacity:
+            return self.keys[: self.filled], self.values[: self.filled]
+        order = (self._slots + self.head) % self.capacity
+        return self.keys[order], self.values[order]
+
+    def append(self, keys: torch.Tensor, values: torch.Tensor) -> None:
+        keys, values = keys[-self.capacity :], values[-self.capacity :]
+        count = keys.shape[0]
+        slots = (self._slots[:count] + self.head) % self.capacity
+        self.keys[slots] = keys
+        self.values[slots] = values
+        self.head = (self.head + count) % self.capacity
+        self.filled = min(self.filled + count, self.capacity)
+        self.seen += count
+
+    def nbytes(self) -> int:
+        return self.keys.nbytes + self.values.nbytes
+
+
+def rolling_window_attention(
+    query: torch.Tensor,
+    key: torch.Tensor,
+    value: torch.Tensor,
+    window: RollingKVWindow,
+    rotate: Callable[[torch.Tensor, torch.Tensor], torch.Tensor],
+    scale: float,
+) -> torch.Tensor:
+    """Attention for a new chunk of un-rotated `query`/`key`/`value`
+    ([tokens, heads, head_size]) against the window's context, then appends
+    the chunk to the window. `rotate(x, positions)` applies RoPE."""
+    context_keys, context_values = window.context()
+    keys = torch.cat([context_keys, key])
+    values = torch.cat([context_values, value])
+    num_keys, num_queries = keys.shape[0], query.shape[0]
+
+    positions = torch.arange(num_keys, device=query.device)
+    query_pos = positions[num_keys - num_queries :]
+    query = rotate(query, query_pos)
+    keys = rotate(keys, positions)
+    repeat = query.shape[1] // keys.shape[1]
+    if repeat > 1:
+        keys = keys.repeat_interleave(repeat, dim=1)
+        values = values.repeat_interleave(repeat, dim=1)
+
+    mask = (positions[None, :] <= query_pos[:, None]) & (
+        positions[None, :] > query_pos[:, None] - window.sliding_window
+    )
+    out = F.scaled_dot_product_attention(
+        query.transpose(0, 1),
+        keys.transpose(0, 1),
+        values.transpose(0, 1),
+        attn_mask=mask,
+        scale=scale,
+    ).transpose(0, 1)
+    window.append(key, value)
+    return out